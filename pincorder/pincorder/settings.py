@@ -31,6 +31,10 @@ else:
 
 ALLOWED_HOSTS = ['pincorder.freddytstudio.com', 'localhost']
 
+# Token that Prometheus sends to scrape the metrics ( 'Authorization: Bearer <token>' ), the metrics can't be
+# scraped without it. The address of the requests can't be used, behind the reverse proxy they all come from localhost
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
 
 # Application definition
 
@@ -49,6 +53,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'recorder_engine.middleware.MetricsMiddleware',
+    'recorder_engine.middleware.CompressionMiddleware',
+    'recorder_engine.middleware.StatelessAPIMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -56,6 +63,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'recorder_engine.middleware.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'pincorder.urls'
@@ -150,19 +158,36 @@ MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 # Directory where raw recordings are stored
 UPLOAD_MEDIA_URL =  "raw_upload/"
 
+# Directory where the profile reports of the ProfilingMiddleware are stored
+PROFILE_ROOT = os.path.join(BASE_DIR, "profiles")
+
 # Rest Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'oauth2_provider.ext.rest_framework.OAuth2Authentication',
+        'recorder_engine.authentication.CachedOAuth2Authentication',
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework_social_oauth2.authentication.SocialAuthentication',
     ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'recorder_engine.renderers.FastJSONRenderer',
+        'recorder_engine.renderers.MessagePackRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'recorder_engine.parsers.FastJSONParser',
+        'recorder_engine.parsers.MessagePackParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
     'TEST_REQUEST_DEFAULT_FORMAT': 'json'
 }
 
+# The browsable API is only available in the local enviroment
+if not IS_PRODUCTION:
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'] += ('rest_framework.renderers.BrowsableAPIRenderer',)
+
 AUTHENTICATION_BACKENDS = (
     'rest_framework_social_oauth2.backends.DjangoOAuth2',
     'social_core.backends.facebook.FacebookAppOAuth2',
@@ -186,5 +211,64 @@ OAUTH2_PROVIDER = {
     # this is the list of available scopes
     'SCOPES': {'read': 'Read scope', 'write': 'Write scope', 'groups': 'Access to your groups'},
     # Increase access token expire time
-    'ACCESS_TOKEN_EXPIRE_SECONDS': 2592000
-}
\ No newline at end of file
+    'ACCESS_TOKEN_EXPIRE_SECONDS': 2592000,
+    # Refresh tokens not used within 60 days of the expiration of their access token are deleted by the
+    # purge_tokens command, together with their access token
+    'REFRESH_TOKEN_EXPIRE_SECONDS': 5184000,
+}
+
+# Maximum number of validated access tokens kept in memory by each process
+TOKEN_CACHE_SIZE = 10000
+
+# Number of seconds a validated access token is kept in memory
+TOKEN_CACHE_TTL = 300
+
+# Number of seconds the expired OAuth2 tokens and grants are kept before the purge_tokens command deletes them
+TOKEN_PURGE_RETENTION = 7 * 24 * 3600
+
+# Number of rows deleted by each transaction of the purge_tokens command
+TOKEN_PURGE_BATCH_SIZE = 1000
+
+
+# Minimum size in bytes of the responses compressed by the CompressionMiddleware
+COMPRESSION_MIN_SIZE = 1024
+
+# Content types compressed by the CompressionMiddleware, the media files are already compressed
+COMPRESSION_CONTENT_TYPES = ('text/', 'application/json', 'application/msgpack', 'application/javascript',
+                             'application/xml')
+
+# Compressed bodies of the responses bigger than COMPRESSION_CACHE_MIN_SIZE bytes are kept in memory,
+# so that the same response is only compressed once
+COMPRESSION_CACHE_MIN_SIZE = 64 * 1024
+COMPRESSION_CACHE_SIZE = 100
+COMPRESSION_CACHE_TTL = 300
+
+
+# Maximum number of recordings fetched by a single call to the get_batch route
+RECORDING_BATCH_MAX_SIZE = 1000
+
+# Number of recordings above which the get_batch response is streamed
+RECORDING_BATCH_STREAM_SIZE = 100
+
+# Maximum number of recordings created by a single call to the bulk_create route
+RECORDING_BULK_MAX_SIZE = 1000
+
+# Maximum number of pins returned by a single call to the get_pins route with the 'limit' parameter
+PIN_PAGE_MAX_SIZE = 1000
+
+# Maximum number of calls in a single request to the batch API
+API_BATCH_MAX_SIZE = 50
+
+# Seconds before the 'since' of a sync whose changes are returned again, longer than the longest transaction.
+# The rows written by a transaction are newer than the 'synced_at' of the syncs only once it's committed
+SYNC_OVERLAP = 60
+
+# Number of recordings checked by each transaction of the reconcile_counters command
+COUNTER_RECONCILE_BATCH_SIZE = 1000
+
+# Default maximum number of bytes of recording files and pin images each user can store, None for no limit.
+# The limit of a single user can be changed in its StorageUsage
+STORAGE_QUOTA = 2 * 1024 ** 3
+
+# Number of bytes of the media files read at a time by the export of the archive of a user
+EXPORT_CHUNK_SIZE = 64 * 1024
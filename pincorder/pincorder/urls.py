@@ -1,6 +1,7 @@
 from django.conf.urls import url, include
 from django.contrib import admin
 from .views import *
+from recorder_engine.metrics import metrics_view
 
 # Define the url patterns for the application
 urlpatterns = [
@@ -10,4 +11,5 @@ urlpatterns = [
     url(r'^api-auth/', include('rest_framework.urls', namespace='rest_framework')),
     url(r'^o/', include('oauth2_provider.urls', namespace='oauth2_provider')),
     url(r'^auth/', include('rest_framework_social_oauth2.urls')),
+    url(r'^metrics/$', metrics_view, name='metrics'),  # Prometheus metrics
 ]
@@ -0,0 +1 @@
+default_app_config = 'recorder_engine.apps.RecorderEngineConfig'
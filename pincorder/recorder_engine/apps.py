@@ -3,3 +3,8 @@ from django.apps import AppConfig
 
 class RecorderEngineConfig(AppConfig):
     name = 'recorder_engine'
+
+    def ready(self):
+        # Connect the signal handlers that keep the statistics of the courses, the storage usage of the users
+        # and the tombstones of the deleted recordings
+        from . import course_statistics, quota, sync
@@ -0,0 +1,96 @@
+import copy
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from oauth2_provider.ext.rest_framework import OAuth2Authentication
+from oauth2_provider.models import AccessToken
+
+from .cache import TTLCache
+from .metrics import record_cache_lookup
+
+
+# Cache of the validated access tokens: token string -> (user, access token)
+token_cache = TTLCache(settings.TOKEN_CACHE_SIZE, settings.TOKEN_CACHE_TTL)
+
+
+def get_bearer_token(request):
+    """
+    Return the token of the 'Authorization: Bearer <token>' header, or None
+    """
+    auth = request.META.get('HTTP_AUTHORIZATION', '').split()
+    if len(auth) == 2 and auth[0].lower() == 'bearer':
+        return auth[1]
+    return None
+
+
+class CachedOAuth2Authentication(OAuth2Authentication):
+    """
+    OAuth2Authentication that keeps the recently validated access tokens in memory, so that
+    the following requests with the same token don't make any database query.
+    Tokens are removed from the cache when they are revoked, changed or expired. Each process has its own cache,
+    so a token revoked in another process can be used until TOKEN_CACHE_TTL seconds have passed
+    """
+
+    def authenticate(self, request):
+        token = get_bearer_token(request)
+        if token is None:
+            # The token may be passed in other ways, let the oauthlib validation handle it
+            return super(CachedOAuth2Authentication, self).authenticate(request)
+
+        cached = token_cache.get(token)
+        record_cache_lookup('oauth2_token', cached is not None)
+        if cached is not None:
+            # Return copies, so that changes made while handling a request don't leak to the others
+            user, access_token = cached
+            return copy.copy(user), copy.copy(access_token)
+
+        result = super(CachedOAuth2Authentication, self).authenticate(request)
+        if result is not None:
+            user, access_token = result
+
+            # The entry must not outlive the token
+            expires = time.monotonic() + (access_token.expires - timezone.now()).total_seconds()
+            # The tokens of a user are deleted together when the user changes
+            token_cache.set(token, (user, access_token), expires=expires, tag=user.id)
+
+        return result
+
+
+class StatelessAuthenticationMixin(object):
+    """
+    View mixin that authenticates the requests marked by the StatelessAPIMiddleware with the access token only,
+    instead of trying all the authentication classes in order
+    """
+
+    def initialize_request(self, request, *args, **kwargs):
+        drf_request = super(StatelessAuthenticationMixin, self).initialize_request(request, *args, **kwargs)
+        if getattr(request, 'stateless_api', False):
+            drf_request.authenticators = [CachedOAuth2Authentication()]
+        return drf_request
+
+
+# Invalidation handlers, used to remove the tokens from the cache as soon as they are revoked or changed
+
+@receiver(post_save, sender=AccessToken)
+@receiver(post_delete, sender=AccessToken)
+def access_token_changed_handler(sender, **kwargs):
+    """
+    Remove the token from the cache when it's revoked ( deleted ) or changed
+    """
+    token_cache.delete(kwargs['instance'].token)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed_handler(sender, update_fields=None, **kwargs):
+    """
+    Remove the tokens of a user from the cache when the user is deleted or changed ( e.g. deactivated ).
+    The update of the last login, made by every login, doesn't change the authentication and is skipped
+    """
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    token_cache.delete_tag(kwargs['instance'].id)
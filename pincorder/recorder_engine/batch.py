@@ -0,0 +1,91 @@
+"""
+Dispatch of the sub requests of the batch API ( see views.BatchView ).
+
+Each sub request is handled in-process by the view of its route, without going through the middleware again.
+The sub requests are authenticated with the user of the batch request, so the credentials are checked only once
+"""
+import io
+import json
+import logging
+
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import transaction
+from django.urls import resolve, Resolver404
+
+from .renderers import FastJSONRenderer
+
+
+logger = logging.getLogger('django.request')
+
+# HTTP methods allowed in the sub requests
+BATCH_METHODS = ('GET', 'POST', 'PUT', 'PATCH', 'DELETE')
+
+
+def build_sub_request(request, method, path, body=None):
+    """
+    Return a WSGIRequest for the sub request, with the same headers and the same user of the batch request
+    """
+    path_info, _, query_string = path.partition('?')
+    content = FastJSONRenderer().render(body) if body is not None else b''
+
+    environ = request.META.copy()
+    environ.update({
+        'REQUEST_METHOD': method,
+        'PATH_INFO': path_info,
+        'QUERY_STRING': query_string,
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(content)),
+        'wsgi.input': io.BytesIO(content),
+    })
+    sub_request = WSGIRequest(environ)
+
+    # The batch request is already authenticated, let the views use the same user and token
+    sub_request._force_auth_user = request.user
+    sub_request._force_auth_token = request.auth
+    return sub_request
+
+
+def get_response_body(response):
+    """
+    Return the data of the response: the data of the REST framework responses, the decoded JSON of the others
+    """
+    if hasattr(response, 'data'):
+        return response.data
+
+    content = b''.join(response.streaming_content) if response.streaming else response.content
+    if not content:
+        return None
+    if response.get('Content-Type', '').startswith('application/json'):
+        return json.loads(content.decode('utf-8'))
+    return content.decode('utf-8', errors='replace')
+
+
+def dispatch_sub_request(request, method, path, body=None):
+    """
+    Handle the sub request and return its status code and body.
+    The writes run in their own transaction, so the changes of a sub request that fails are rolled back
+    """
+    try:
+        match = resolve(path.partition('?')[0])
+    except Resolver404:
+        return {'status': 404, 'body': {'detail': "ERROR: No route matches the path " + path}}
+
+    sub_request = build_sub_request(request, method, path, body)
+    sub_request.resolver_match = match
+
+    try:
+        if method == 'GET':
+            # Reads don't need a transaction
+            response = match.func(sub_request, *match.args, **match.kwargs)
+        else:
+            with transaction.atomic():
+                response = match.func(sub_request, *match.args, **match.kwargs)
+
+                # Roll back the changes of the sub requests that fail
+                if response.status_code >= 400:
+                    transaction.set_rollback(True)
+    except Exception:
+        logger.exception("Internal Server Error in the batch sub request: %s %s", method, path)
+        return {'status': 500, 'body': {'detail': "ERROR: Internal server error"}}
+
+    return {'status': response.status_code, 'body': get_response_body(response)}
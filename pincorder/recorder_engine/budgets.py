@@ -0,0 +1,73 @@
+from collections import namedtuple
+
+
+# Maximum number of SQL queries and milliseconds that a single call to a route can take.
+# The query count must not depend on the amount of data, so the same budget is checked
+# both with a small dataset and with a dataset 100 times bigger ( see tests/test_budgets.py ).
+# The milliseconds depend on the machine: run_benchmark reports the routes over budget, the tests check them
+# only with CHECK_TIME_BUDGETS=1 in the environment
+Budget = namedtuple('Budget', ('queries', 'milliseconds'))
+
+
+# Budgets for the routes defined in urls.py, identified by the url name and the HTTP method
+ROUTE_BUDGETS = {
+    ('api-root', 'GET'): Budget(queries=0, milliseconds=500),
+
+    # Recording API
+    # The writes that change the recordings of a course also read the ancestors of the course and update their
+    # statistics ( see course_statistics.py ), with at most 3 more queries whatever the depth of the tree.
+    # The uploads read the storage quota of the user first, and update its storage usage ( see quota.py )
+    # One more query for the pins, when they are expanded
+    ('recording-list', 'GET'): Budget(queries=2, milliseconds=1000),
+    ('recording-list', 'POST'): Budget(queries=5, milliseconds=500),
+    ('recording-detail', 'GET'): Budget(queries=1, milliseconds=500),
+    ('recording-detail', 'PATCH'): Budget(queries=5, milliseconds=500),
+    ('recording-detail', 'DELETE'): Budget(queries=10, milliseconds=1000),
+    # One insert on PostgreSQL, one for each recording on the other backends ( the tests create 3 recordings ),
+    # plus the savepoint of the transaction and the statistics of the courses, once or for each recording
+    ('recording-bulk-create', 'POST'): Budget(queries=12, milliseconds=1000),
+    ('recording-search-by-name', 'GET'): Budget(queries=1, milliseconds=1000),
+    ('recording-get-batch', 'GET'): Budget(queries=2, milliseconds=1000),
+    ('recording-get-file', 'GET'): Budget(queries=2, milliseconds=500),
+    ('recording-get-status', 'GET'): Budget(queries=1, milliseconds=500),
+    # The file and the counters of the recording are written in the same transaction
+    ('recording-upload-file', 'POST'): Budget(queries=12, milliseconds=1000),
+    ('recording-get-pins', 'GET'): Budget(queries=1, milliseconds=1000),
+    # A single statement and the update of the counters, with an image the replaced one is read in the same
+    # transaction
+    ('recording-add-pin', 'POST'): Budget(queries=10, milliseconds=1000),
+    # The pin, its tombstone and the counters of the recording in the same transaction
+    ('recording-delete-pin', 'DELETE'): Budget(queries=11, milliseconds=500),
+    # A single statement for all the pins and the update of the counters, with images the replaced ones are read in
+    # the same transaction
+    ('recording-add-pin-batch', 'POST'): Budget(queries=11, milliseconds=500),
+
+    # Course API
+    ('course-list', 'GET'): Budget(queries=1, milliseconds=1000),
+    ('course-list', 'POST'): Budget(queries=5, milliseconds=500),
+    ('course-detail', 'GET'): Budget(queries=1, milliseconds=500),
+    # Moving a course to another parent moves its statistics too
+    ('course-detail', 'PATCH'): Budget(queries=6, milliseconds=500),
+    # The recordings deleted with the course get their tombstones and leave the storage usage of their authors
+    # with a few queries for each course, whatever their number
+    ('course-detail', 'DELETE'): Budget(queries=18, milliseconds=1000),
+    ('course-add-course-with-teacher', 'POST'): Budget(queries=6, milliseconds=500),
+    ('course-add-teacher', 'POST'): Budget(queries=4, milliseconds=500),
+    ('course-statistics', 'GET'): Budget(queries=1, milliseconds=500),
+    ('course-add-users', 'POST'): Budget(queries=5, milliseconds=1000),
+    ('course-remove-users', 'POST'): Budget(queries=5, milliseconds=1000),
+
+    # User Dump API
+    ('user-dump', 'GET'): Budget(queries=3, milliseconds=3000),
+    # The archive is read while it's streamed, the budget covers the whole response: the recordings, the pins, the
+    # files and the images, with a query each
+    ('user-export', 'GET'): Budget(queries=4, milliseconds=3000),
+
+    # Batch API
+    # The queries of the calls are counted too, the budget covers a batch of a few calls
+    ('batch', 'POST'): Budget(queries=20, milliseconds=1000),
+
+    # Sync API
+    # The pins are written with the upsert of add_pin, in a savepoint, and the deleted ones update the counters again
+    ('sync', 'POST'): Budget(queries=23, milliseconds=2000),
+}
@@ -0,0 +1,59 @@
+from django.db import connection
+from django.db.models import Case, Value, When
+from rest_framework.exceptions import PermissionDenied
+
+from .models import Course, Recording
+from .signals import recordings_created
+
+
+def bulk_create_with_ids(model, objects):
+    """
+    Insert the objects and set their primary keys, keeping the given order.
+    The backends that return the ids of a bulk insert ( PostgreSQL ) use a single query,
+    the others save the objects one at a time
+    """
+    if connection.features.can_return_ids_from_bulk_insert:
+        return model._default_manager.bulk_create(objects)
+
+    for obj in objects:
+        obj.save(force_insert=True)
+    return objects
+
+
+def case_by_id(field, values):
+    """
+    Return the expression that sets a different value of the field for each row, given the id -> value dict.
+    Used to update many rows with a single query
+    """
+    return Case(*[When(pk=id, then=Value(value)) for id, value in values.items()],
+                output_field=field)
+
+
+def check_course_access(user, course_ids):
+    """
+    Raise PermissionDenied if the user is not allowed to write in any of the courses, with a single query
+    """
+    course_ids = set(course_ids)
+    if not course_ids:
+        return
+
+    allowed = set(Course.objects.filter(id__in=course_ids, authorized_users=user).values_list('id', flat=True))
+    if course_ids - allowed:
+        raise PermissionDenied("You're not allowed to write in this course!")
+
+
+def bulk_create_recordings(user, items):
+    """
+    Create the recordings of the user from the validated data of the RecordingBulkSerializer,
+    and return them in the same order
+    """
+    check_course_access(user, [item['course'] for item in items if item.get('course') is not None])
+
+    recordings = bulk_create_with_ids(Recording, [
+        Recording(name=item['name'], date=item['date'], course_id=item.get('course'), user=user) for item in items
+    ])
+
+    # The backends without the ids of a bulk insert saved the recordings one at a time, sending post_save
+    if connection.features.can_return_ids_from_bulk_insert:
+        recordings_created.send(sender=Recording, recordings=recordings)
+    return recordings
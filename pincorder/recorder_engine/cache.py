@@ -0,0 +1,91 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache(object):
+    """
+    Thread safe in-memory cache, bounded both in size ( least recently used entries are evicted first )
+    and in time ( every entry has an expiration time )
+    """
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.lock = threading.Lock()
+
+        # Key -> (expiration time, value), ordered from the least to the most recently used
+        self.entries = OrderedDict()
+
+        # Tag -> set of the keys of the entries stored with the tag, and key -> tag
+        self.tags = {}
+        self.key_tags = {}
+
+    def get(self, key, default=None):
+        """
+        Return the value of the key, or default if the key is missing or expired
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return default
+
+            expires, value = entry
+            if time.monotonic() >= expires:
+                self._remove(key)
+                return default
+
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, expires=None, tag=None):
+        """
+        Store the value. expires, if given, is a time.monotonic() deadline that shortens the ttl.
+        The entries stored with a tag can be deleted together ( see delete_tag )
+        """
+        deadline = time.monotonic() + self.ttl
+        if expires is not None:
+            deadline = min(deadline, expires)
+
+        with self.lock:
+            self._remove(key)
+            self.entries[key] = (deadline, value)
+            if tag is not None:
+                self.tags.setdefault(tag, set()).add(key)
+                self.key_tags[key] = tag
+
+            # Evict the least recently used entries
+            while len(self.entries) > self.maxsize:
+                self._remove(next(iter(self.entries)))
+
+    def delete(self, key):
+        with self.lock:
+            self._remove(key)
+
+    def delete_tag(self, tag):
+        """
+        Delete all the entries stored with the tag, without looking at the others
+        """
+        with self.lock:
+            for key in list(self.tags.get(tag, ())):
+                self._remove(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.tags.clear()
+            self.key_tags.clear()
+
+    def _remove(self, key):
+        """
+        Delete the entry and its tag, the lock must be held
+        """
+        self.entries.pop(key, None)
+        tag = self.key_tags.pop(key, None)
+        if tag is not None:
+            keys = self.tags[tag]
+            keys.discard(key)
+            if not keys:
+                del self.tags[tag]
+
+    def __len__(self):
+        return len(self.entries)
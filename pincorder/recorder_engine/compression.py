@@ -0,0 +1,115 @@
+import hashlib
+import zlib
+
+from django.conf import settings
+
+from .cache import TTLCache
+from .metrics import record_cache_lookup
+
+try:
+    import brotli
+except ImportError:
+    # Without brotli only gzip is offered
+    brotli = None
+
+
+# Compression levels, a tradeoff between the size and the time spent compressing every response
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# Compressed bodies of the recent responses: (encoding, hash of the body) -> compressed body
+compressed_cache = TTLCache(settings.COMPRESSION_CACHE_SIZE, settings.COMPRESSION_CACHE_TTL)
+
+
+class GzipCompressor(object):
+    def __init__(self):
+        # The 16 added to the window size makes zlib write the gzip header and trailer
+        self.compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def process(self, data):
+        return self.compressor.compress(data)
+
+    def flush(self):
+        """
+        Return all the data compressed up to now, so that it can be sent immediately
+        """
+        return self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+class BrotliCompressor(object):
+    def __init__(self):
+        self.compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def process(self, data):
+        return self.compressor.process(data)
+
+    def flush(self):
+        return self.compressor.flush()
+
+    def finish(self):
+        return self.compressor.finish()
+
+
+# Supported encodings, in order of preference
+COMPRESSORS = [('gzip', GzipCompressor)]
+if brotli is not None:
+    COMPRESSORS.insert(0, ('br', BrotliCompressor))
+
+
+def get_accepted_encoding(request):
+    """
+    Return the preferred encoding among the ones accepted by the client, or None
+    """
+    accepted = {}
+    for item in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        parts = item.strip().split(';')
+        quality = 1.0
+        for param in parts[1:]:
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[parts[0].strip().lower()] = quality
+
+    for encoding, compressor_class in COMPRESSORS:
+        if accepted.get(encoding, accepted.get('*', 0)) > 0:
+            return encoding
+    return None
+
+
+def compress(encoding, content):
+    """
+    Compress the whole content. The big bodies are cached, so that the same response is only compressed once
+    """
+    if len(content) < settings.COMPRESSION_CACHE_MIN_SIZE:
+        return compress_content(encoding, content)
+
+    key = (encoding, hashlib.sha1(content).digest())
+    compressed = compressed_cache.get(key)
+    record_cache_lookup('compression', compressed is not None)
+    if compressed is None:
+        compressed = compress_content(encoding, content)
+        compressed_cache.set(key, compressed)
+    return compressed
+
+
+def compress_content(encoding, content):
+    compressor = dict(COMPRESSORS)[encoding]()
+    return compressor.process(content) + compressor.finish()
+
+
+def compress_sequence(encoding, sequence):
+    """
+    Compress the chunks of a streaming response one at a time, sending each of them as soon as it's compressed
+    """
+    compressor = dict(COMPRESSORS)[encoding]()
+    for chunk in sequence:
+        data = compressor.process(chunk) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
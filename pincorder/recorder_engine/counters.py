@@ -0,0 +1,76 @@
+"""
+Maintenance of the denormalized counters of the recordings ( pin_count, has_file, media_bytes ).
+
+The views that add or delete pins and files update the counters with F() expressions in the same transaction,
+so that concurrent changes are never lost. The changes are notified with the recording_counters_changed signal.
+Changes made outside the API ( e.g. in the admin ) are not counted, the reconcile_counters command repairs the drift
+"""
+from django.db import models
+from django.db.models import Count, Exists, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .bulk import case_by_id
+from .models import Pin, Recording, RecordingFile
+from .quota import add_used_bytes
+from .signals import recording_counters_changed
+
+
+def update_counters(user_id, pins=None, media_bytes=None):
+    """
+    Add the differences to the counters of the recordings of the user, with a single UPDATE.
+    pins and media_bytes are dicts of recording id -> difference, the media bytes are added to the storage used by
+    the user too
+    """
+    pins = {id: delta for id, delta in (pins or {}).items() if delta}
+    media_bytes = {id: delta for id, delta in (media_bytes or {}).items() if delta}
+
+    ids = set(pins) | set(media_bytes)
+    if not ids:
+        return
+
+    changes = {}
+    for name, field, deltas in (('pin_count', models.IntegerField(), pins),
+                                ('media_bytes', models.BigIntegerField(), media_bytes)):
+        if len(ids) == 1 and deltas:
+            changes[name] = F(name) + deltas[next(iter(ids))]
+        elif deltas:
+            # The recordings without a difference keep their value
+            changes[name] = F(name) + Coalesce(case_by_id(field, deltas), Value(0))
+        if name in changes:
+            # A counter that drifted below the real value can't become negative ( pin_count is unsigned on
+            # PostgreSQL ), it stays at 0 until the reconcile_counters command fixes it
+            changes[name] = Greatest(changes[name], Value(0))
+    Recording.objects.filter(id__in=ids).update(**changes)
+    add_used_bytes(user_id, sum(media_bytes.values()))
+
+    if pins:
+        recording_counters_changed.send(sender=Recording, pins=pins, duration={})
+
+
+def add_recording_file(user_id, recording_id, size, duration=None):
+    """
+    Update the counters of the recording of the user after its file is uploaded
+    """
+    Recording.objects.filter(id=recording_id).update(has_file=True, duration=duration,
+                                                     media_bytes=F('media_bytes') + size)
+    add_used_bytes(user_id, size)
+    if duration:
+        recording_counters_changed.send(sender=Recording, pins={}, duration={recording_id: duration})
+
+
+def annotate_expected_counters(queryset):
+    """
+    Annotate the recordings with the values of the counters computed from the related rows
+    """
+    pins = Pin.objects.filter(recording=OuterRef('pk')).order_by().values('recording')
+    files = RecordingFile.objects.filter(recording=OuterRef('pk'))
+
+    return queryset.annotate(
+        expected_pin_count=Coalesce(Subquery(pins.annotate(count=Count('id')).values('count'),
+                                             output_field=models.IntegerField()), Value(0)),
+        expected_has_file=Exists(files),
+        expected_media_bytes=Coalesce(Subquery(pins.annotate(size=Sum('media_size')).values('size'),
+                                               output_field=models.BigIntegerField()), Value(0)) +
+                             Coalesce(Subquery(files.values('size'), output_field=models.BigIntegerField()),
+                                      Value(0)),
+    )
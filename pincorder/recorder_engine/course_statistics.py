@@ -0,0 +1,280 @@
+"""
+Incremental maintenance of the statistics of the courses ( see models.CourseStatistics ).
+
+The signal handlers add the differences made by every change of the recordings to the statistics of their course and
+of all the ancestors of the course, with F() expressions. The statistics of a course, sub courses included, are then
+read with a single query, whatever the number of its recordings
+"""
+import threading
+from collections import Counter, defaultdict
+
+from django.db import connection, models
+from django.db.models import Count, F, Max, Sum, Value
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .bulk import case_by_id
+from .models import Course, CourseStatistics, Pin, Recording
+from .signals import recording_counters_changed, recordings_created
+
+
+STATISTICS_FIELDS = ('recording_count', 'pin_count', 'total_duration')
+
+# Ids of the courses being deleted by the current thread. Their recordings are removed from the statistics of the
+# ancestors together with the course ( see course_pre_delete_handler )
+_deleting_courses = threading.local()
+
+
+ANCESTORS_SQL = (
+    "WITH RECURSIVE ancestors ({id}, {parent_course_id}) AS ("
+    "SELECT {id}, {parent_course_id} FROM {course} WHERE {id} IN ({ids}) "
+    # UNION drops the rows already found, so a loop in the tree ends the recursion
+    "UNION SELECT {course}.{id}, {course}.{parent_course_id} FROM {course} "
+    "INNER JOIN ancestors ON {course}.{id} = ancestors.{parent_course_id}) "
+    "SELECT {id}, {parent_course_id} FROM ancestors"
+)
+
+
+def get_course_chains(course_ids, parents=None):
+    """
+    Return the dict course id -> list with the id of the course and the ids of all its ancestors.
+    parents is a dict course id -> parent id of the already known courses, the ancestors of the others are read
+    with a single recursive query, whatever the depth of the tree
+    """
+    parents = dict(parents or {})
+    missing = set(course_ids) - set(parents)
+    missing.update(parent for parent in parents.values() if parent is not None and parent not in parents)
+    if missing:
+        quote = connection.ops.quote_name
+        sql = ANCESTORS_SQL.format(course=quote(Course._meta.db_table), id=quote('id'),
+                                   parent_course_id=quote('parent_course_id'), ids=", ".join(["%s"] * len(missing)))
+        with connection.cursor() as cursor:
+            cursor.execute(sql, list(missing))
+            parents.update(cursor.fetchall())
+
+    chains = {}
+    for course_id in course_ids:
+        chain = []
+        id = course_id
+        # The missing courses have no statistics, a loop in the tree is walked only once
+        while id is not None and id in parents and id not in chain:
+            chain.append(id)
+            id = parents[id]
+        chains[course_id] = chain
+    return chains
+
+
+def update_course_statistics(changes, parents=None):
+    """
+    Add the differences to the statistics of the courses and of their ancestors, with a single UPDATE.
+    changes is a dict course id -> dict of field -> difference, parents is passed to get_course_chains
+    """
+    changes = {id: difference for id, difference in changes.items() if id is not None}
+    if not changes:
+        return
+
+    totals = defaultdict(Counter)
+    for course_id, chain in get_course_chains(changes, parents).items():
+        for id in chain:
+            totals[id].update(changes[course_id])
+
+    # The ancestors shared by a move don't change
+    totals = {id: total for id, total in totals.items() if any(total.values())}
+    if not totals:
+        return
+
+    updates = {'last_activity': timezone.now()}
+    for field in STATISTICS_FIELDS:
+        differences = {id: total[field] for id, total in totals.items() if total[field]}
+        if len(totals) == 1 and differences:
+            updates[field] = F(field) + differences[next(iter(totals))]
+        elif differences:
+            # The courses without a difference keep their value
+            updates[field] = F(field) + Coalesce(case_by_id(models.BigIntegerField(), differences), Value(0))
+    CourseStatistics.objects.filter(course_id__in=totals).update(**updates)
+
+
+def get_recording_statistics(recording, sign=1):
+    """
+    Return the differences made by adding ( or removing, with sign -1 ) the recording to a course
+    """
+    return {'recording_count': sign, 'pin_count': sign * recording.pin_count,
+            'total_duration': sign * (recording.duration or 0)}
+
+
+def get_cached_parents(recordings):
+    """
+    Return the parents of the courses already loaded with the recordings ( e.g. by the serializers ), by course id
+    """
+    return {recording.course.id: recording.course.parent_course_id for recording in recordings
+            if recording.course_id is not None and Recording.course.is_cached(recording)}
+
+
+def get_deleting_courses():
+    """
+    Return the set of the ids of the courses being deleted by the current thread
+    """
+    if not hasattr(_deleting_courses, 'ids'):
+        _deleting_courses.ids = set()
+    return _deleting_courses.ids
+
+
+def is_deleted_with_course(recording):
+    """
+    Check if the recording is deleted together with its course. The handlers of the course take care of all its
+    recordings at once, the ones of the recordings skip them
+    """
+    return getattr(recording, '_deleted_with_course', False)
+
+
+def compute_course_statistics():
+    """
+    Compute the statistics of all the courses from the counters of the recordings, with a query for each table.
+    Return a dict course id -> dict of field -> value
+    """
+    parents = dict(Course.objects.values_list('id', 'parent_course_id'))
+    statistics = {id: {'recording_count': 0, 'pin_count': 0, 'total_duration': 0, 'last_activity': None}
+                  for id in parents}
+    chains = get_course_chains(parents, parents)
+
+    def add_activity(course_id, activity):
+        for id in chains[course_id]:
+            if activity is not None and (statistics[id]['last_activity'] is None or
+                                         activity > statistics[id]['last_activity']):
+                statistics[id]['last_activity'] = activity
+
+    for row in Recording.objects.filter(course__isnull=False).order_by().values('course_id').annotate(
+            recordings=Count('id'), pins=Sum('pin_count'), duration=Sum('duration'), activity=Max('updated')):
+        for id in chains[row['course_id']]:
+            statistics[id]['recording_count'] += row['recordings']
+            statistics[id]['pin_count'] += row['pins'] or 0
+            statistics[id]['total_duration'] += row['duration'] or 0
+        add_activity(row['course_id'], row['activity'])
+
+    for course_id, activity in Pin.objects.filter(recording__course__isnull=False).order_by() \
+            .values_list('recording__course_id').annotate(activity=Max('updated')):
+        add_activity(course_id, activity)
+
+    return statistics
+
+
+# Signal Handlers, the raw saves of the fixtures are skipped
+
+@receiver(post_save, sender=Course)
+def course_post_save_handler(sender, instance, created, raw=False, **kwargs):
+    """
+    Create the statistics of a new course, move the statistics of a course that changed parent
+    """
+    if raw:
+        return
+
+    loaded_parent_id = getattr(instance, '_loaded_parent_course_id', instance.parent_course_id)
+    instance._loaded_parent_course_id = instance.parent_course_id
+
+    if created:
+        CourseStatistics.objects.create(course=instance)
+    elif loaded_parent_id != instance.parent_course_id:
+        try:
+            statistics = CourseStatistics.objects.values(*STATISTICS_FIELDS).get(course=instance)
+        except CourseStatistics.DoesNotExist:
+            return
+        update_course_statistics({
+            loaded_parent_id: {field: -value for field, value in statistics.items()},
+            instance.parent_course_id: statistics,
+        })
+
+
+@receiver(pre_delete, sender=Course)
+def course_pre_delete_handler(sender, instance, **kwargs):
+    """
+    Remove the statistics of the deleted course from its ancestors, while the rows that link them still exist.
+    The course can be deleted before its recordings, so they are skipped by recording_post_delete_handler.
+    The sub courses deleted with an ancestor are skipped too, the ancestor removes the statistics of its whole tree.
+    If a sub course comes first, the ancestor reads the statistics without it, so nothing is removed twice
+    """
+    deleting = get_deleting_courses()
+    deleting.add(instance.id)
+
+    parent_id = getattr(instance, '_loaded_parent_course_id', instance.parent_course_id)
+    # The sub courses are usually deleted right after their parent, without reading the ancestors
+    if parent_id is None or parent_id in deleting:
+        return
+    chain = get_course_chains([parent_id])[parent_id]
+    if deleting.intersection(chain):
+        return
+    try:
+        statistics = CourseStatistics.objects.values(*STATISTICS_FIELDS).get(course=instance)
+    except CourseStatistics.DoesNotExist:
+        return
+
+    # The ancestors are already known, they are not read again
+    update_course_statistics({parent_id: {field: -value for field, value in statistics.items()}},
+                             dict(zip(chain, chain[1:] + [None])))
+
+
+@receiver(post_delete, sender=Course)
+def course_post_delete_handler(sender, instance, **kwargs):
+    get_deleting_courses().discard(instance.id)
+
+
+@receiver(post_save, sender=Recording)
+def recording_post_save_handler(sender, instance, created, raw=False, **kwargs):
+    """
+    Add a new recording to the statistics of its course, move a recording that changed course
+    """
+    if raw:
+        return
+
+    loaded_course_id = None if created else getattr(instance, '_loaded_course_id', instance.course_id)
+    instance._loaded_course_id = instance.course_id
+
+    if created or loaded_course_id != instance.course_id:
+        update_course_statistics({
+            loaded_course_id: get_recording_statistics(instance, -1),
+            instance.course_id: get_recording_statistics(instance),
+        }, get_cached_parents([instance]))
+
+
+@receiver(pre_delete, sender=Recording)
+def recording_pre_delete_handler(sender, instance, **kwargs):
+    """
+    Mark the recordings deleted with their course. The pre_delete of all the courses comes first, while their
+    post_delete can come before the one of the recordings, so the mark is taken here ( see is_deleted_with_course )
+    """
+    course_id = getattr(instance, '_loaded_course_id', instance.course_id)
+    instance._deleted_with_course = course_id in get_deleting_courses()
+
+
+@receiver(post_delete, sender=Recording)
+def recording_post_delete_handler(sender, instance, **kwargs):
+    """
+    Remove the deleted recording from the statistics of its course, unless it's deleted with the course
+    """
+    if is_deleted_with_course(instance):
+        return
+    update_course_statistics({getattr(instance, '_loaded_course_id', instance.course_id):
+                              get_recording_statistics(instance, -1)})
+
+
+@receiver(recordings_created)
+def recordings_created_handler(sender, recordings, **kwargs):
+    changes = defaultdict(Counter)
+    for recording in recordings:
+        changes[recording.course_id].update(get_recording_statistics(recording))
+    update_course_statistics(changes, get_cached_parents(recordings))
+
+
+@receiver(recording_counters_changed)
+def recording_counters_changed_handler(sender, pins, duration, **kwargs):
+    """
+    Add the changes of the pins and of the durations of the recordings to the statistics of their courses
+    """
+    changes, parents = defaultdict(Counter), {}
+    # The parents of the courses are read with the same query
+    for id, course_id, parent_id in Recording.objects.filter(id__in=set(pins) | set(duration), course__isnull=False) \
+            .order_by().values_list('id', 'course_id', 'course__parent_course_id'):
+        changes[course_id].update({'pin_count': pins.get(id, 0), 'total_duration': duration.get(id, 0)})
+        parents[course_id] = parent_id
+    update_course_statistics(changes, parents)
@@ -0,0 +1,129 @@
+"""
+Export of the whole archive of a user as a ZIP file, built while it's sent ( see views.UserExport ).
+
+The entries are written by a zipfile.ZipFile to a ZipBuffer that is emptied after every write, so the archive is
+never stored: no temporary file is created and the memory used doesn't depend on the size of the archive, only the
+central directory ( about a hundred bytes for each entry ) is kept until the end.
+The recordings and their pins are read with iterators and written as JSON one recording at a time, the media files
+are stored uncompressed, as they are already compressed, and copied from the storage EXPORT_CHUNK_SIZE bytes at a time.
+The entries bigger than 4 GB, and the archives bigger than 4 GB, use the ZIP64 extensions
+"""
+import zipfile
+
+from django.conf import settings
+from django.utils import timezone
+
+from .fast_serializers import ValuesSerializer
+from .models import Pin, Recording, RecordingFile
+from .renderers import FastJSONRenderer, stream_json_object
+from .serializers import ExportPinSerializer, ExportRecordingSerializer
+
+
+# Name of the JSON with the recordings and their pins, the media files keep the name they have in the storage
+RECORDINGS_ENTRY = 'recordings.json'
+
+
+class ZipBuffer(object):
+    """
+    Write only file that keeps the data written by a ZipFile until it's sent.
+    It can't tell its position, so the ZipFile writes the size and the checksum of every entry after its data
+    """
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        """
+        Return the data written since the previous call
+        """
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def get_entry_info(name, date):
+    """
+    Return the ZipInfo of a stored entry with the given name and modification date
+    """
+    info = zipfile.ZipInfo(name, date_time=timezone.localtime(date).timetuple()[:6])
+    info.compress_type = zipfile.ZIP_STORED
+    # Readable by everyone once extracted
+    info.external_attr = 0o644 << 16
+    return info
+
+
+def iter_recordings(user):
+    """
+    Yield the (recording id, representation) couples of the recordings of the user, with their pins.
+    Only the pins of a single recording are in memory at a time
+    """
+    recording_serializer = ValuesSerializer(ExportRecordingSerializer())
+    recordings = Recording.objects.filter(user=user).order_by('id') \
+                                  .values_list(*recording_serializer.columns).iterator()
+
+    # The rows start with the recording id, used to group them
+    pin_serializer = ValuesSerializer(ExportPinSerializer(), offset=1)
+    pins = Pin.objects.filter(recording__user=user).order_by('recording_id', 'time') \
+                      .values_list('recording_id', *pin_serializer.columns).iterator()
+
+    pin = next(pins, None)
+    for row in recordings:
+        recording = recording_serializer.to_representation(row)
+        recording['pins'] = []
+        while pin is not None and pin[0] == recording['id']:
+            recording['pins'].append(pin_serializer.to_representation(pin))
+            pin = next(pins, None)
+        yield str(recording['id']), recording
+
+
+def iter_media_files(user):
+    """
+    Yield the (name, date) couples of the files of the recordings of the user and of the images of their pins
+    """
+    yield from RecordingFile.objects.filter(recording__user=user).order_by('recording_id') \
+                                    .values_list('file_url', 'upload_date').iterator()
+    yield from Pin.objects.filter(recording__user=user).exclude(media_url='').order_by('recording_id', 'time') \
+                          .values_list('media_url', 'updated').iterator()
+
+
+def stream_user_archive(user):
+    """
+    Yield the ZIP archive of the user one chunk at a time: the recordings with their pins in RECORDINGS_ENTRY,
+    then the media files. The files missing from the storage are left out
+    """
+    buffer = ZipBuffer()
+    archive = zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED)
+    renderer = FastJSONRenderer()
+
+    # The size of the JSON is unknown until the end, so its entry always has room for the ZIP64 sizes
+    with archive.open(get_entry_info(RECORDINGS_ENTRY, timezone.now()), 'w', force_zip64=True) as entry:
+        for data in stream_json_object(iter_recordings(user), renderer):
+            entry.write(data)
+            yield buffer.pop()
+
+    storage = RecordingFile._meta.get_field('file_url').storage
+    for name, date in iter_media_files(user):
+        try:
+            file = storage.open(name, 'rb')
+        except OSError:
+            continue
+
+        with file:
+            info = get_entry_info(name, date)
+            # The known size lets the ZipFile choose the ZIP64 sizes only for the big files
+            info.file_size = file.size
+            with archive.open(info, 'w') as entry:
+                yield buffer.pop()
+                for chunk in iter(lambda: file.read(settings.EXPORT_CHUNK_SIZE), b''):
+                    entry.write(chunk)
+                    yield buffer.pop()
+            yield buffer.pop()
+
+    archive.close()
+    yield buffer.pop()
@@ -0,0 +1,183 @@
+"""
+Read only serializers that build the representations directly from the rows of .values_list(), without creating
+the model instances and without calling the to_representation of every field of every row.
+
+A ValuesSerializer is compiled from an instance of one of the ModelSerializers, so the output, once rendered,
+is the same of the ModelSerializer. Nested serializers are read with joins in the same query, nested lists
+( many=True ) with one additional query for each level, like prefetch_related.
+"""
+from collections import defaultdict
+from operator import itemgetter
+
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework import serializers
+from rest_framework.settings import api_settings
+
+
+# Fields whose representation is the value read from the database
+PASSTHROUGH_FIELDS = (serializers.BooleanField, serializers.CharField, serializers.IntegerField,
+                      serializers.PrimaryKeyRelatedField, serializers.ReadOnlyField)
+
+# Fields whose representation is computed by the field itself from the database value
+CONVERTED_FIELDS = (serializers.DateTimeField, serializers.DateField, serializers.TimeField,
+                    serializers.DecimalField, serializers.FloatField)
+
+
+class ValuesSerializer(object):
+    """
+    Serialize querysets with the fields of the given ModelSerializer instance, reading only the needed columns
+    """
+    def __init__(self, serializer, prefix='', offset=0):
+        self.model = serializer.Meta.model
+        self.context = serializer.context
+
+        # Prefix of the lookups, used by the nested serializers, and index of the first column in the rows
+        self.prefix = prefix
+        self.offset = offset
+
+        # values_list() lookups, readers of the fields as (name, function(row)) and nested lists
+        self.columns = []
+        self.readers = []
+        self.many = []
+
+        # Representations of the nested lists, grouped by the primary key of the rows
+        self.prefetched = {}
+
+        for name, field in serializer.fields.items():
+            if not field.write_only:
+                self.readers.append((name, self.compile_field(field)))
+
+    def add_column(self, lookup):
+        """
+        Add a lookup to the columns and return its index in the rows
+        """
+        self.columns.append(self.prefix + lookup)
+        return self.offset + len(self.columns) - 1
+
+    def compile_field(self, field):
+        """
+        Return the function that reads the representation of the field from a row
+        """
+        if isinstance(field, serializers.ListSerializer):
+            return self.compile_many(field)
+
+        if isinstance(field, serializers.BaseSerializer):
+            return self.compile_nested(field)
+
+        if isinstance(field, serializers.StringRelatedField):
+            # Only the users are supported, whose string representation is the username
+            related_model = self.model._meta.get_field(field.source).related_model
+            if not hasattr(related_model, 'USERNAME_FIELD'):
+                raise ImproperlyConfigured("StringRelatedField '{name}' is not supported by the ValuesSerializer"
+                                           .format(name=field.field_name))
+            return itemgetter(self.add_column(field.source + '__' + related_model.USERNAME_FIELD))
+
+        index = self.add_column(field.source)
+
+        if isinstance(field, serializers.FileField):
+            mapper = self.get_file_mapper(field)
+        elif isinstance(field, CONVERTED_FIELDS):
+            mapper = field.to_representation
+        elif isinstance(field, PASSTHROUGH_FIELDS):
+            return itemgetter(index)
+        else:
+            raise ImproperlyConfigured("Field '{name}' is not supported by the ValuesSerializer"
+                                       .format(name=field.field_name))
+
+        return lambda row: mapper(row[index])
+
+    def compile_nested(self, field):
+        """
+        Read the nested serializer from the columns of the joined model, null if the foreign key is null
+        """
+        key_index = self.add_column(field.source)
+
+        child = ValuesSerializer(field, prefix=self.prefix + field.source + '__',
+                                 offset=self.offset + len(self.columns))
+        if child.many:
+            raise ImproperlyConfigured("Nested lists inside the nested serializer '{name}' are not supported"
+                                       .format(name=field.field_name))
+        self.columns.extend(child.columns)
+
+        return lambda row: None if row[key_index] is None else child.to_representation(row)
+
+    def compile_many(self, field):
+        """
+        Read the nested list from the representations fetched by prefetch(), grouped by the primary key
+        """
+        if self.prefix:
+            raise ImproperlyConfigured("Nested lists inside nested serializers are not supported")
+
+        relation = next((relation for relation in self.model._meta.related_objects
+                         if relation.get_accessor_name() == field.source), None)
+        if relation is None:
+            raise ImproperlyConfigured("'{source}' is not a reverse relation of {model}"
+                                       .format(source=field.source, model=self.model.__name__))
+
+        # The rows of the related model start with the foreign key, used to group them
+        child = ValuesSerializer(field.child, offset=1)
+        pk_index = self.add_column('pk')
+        self.many.append((relation, child, pk_index))
+
+        return lambda row: self.prefetched[relation].get(row[pk_index], [])
+
+    def get_file_mapper(self, field):
+        """
+        Return the function that converts the name of a file to the same value of FileField.to_representation
+        """
+        if not getattr(field, 'use_url', api_settings.UPLOADED_FILES_USE_URL):
+            return lambda name: name or None
+
+        storage = self.model._meta.get_field(field.source).storage
+        request = self.context.get('request', None)
+
+        def to_representation(name):
+            if not name:
+                return None
+            url = storage.url(name)
+            return request.build_absolute_uri(url) if request is not None else url
+
+        return to_representation
+
+    def prefetch(self, rows):
+        """
+        Fetch the nested lists of the given rows, with a query for each list
+        """
+        for relation, child, pk_index in self.many:
+            grouped = defaultdict(list)
+            ids = [row[pk_index] for row in rows]
+            if ids:
+                # The default manager applies the default ordering, like prefetch_related
+                queryset = relation.related_model._default_manager.filter(**{relation.field.name + '__in': ids})
+                child_rows = list(queryset.values_list(relation.field.attname, *child.columns))
+                child.prefetch(child_rows)
+                for child_row in child_rows:
+                    grouped[child_row[0]].append(child.to_representation(child_row))
+            self.prefetched[relation] = grouped
+
+    @property
+    def field_names(self):
+        return [name for name, read in self.readers]
+
+    def to_representation(self, row):
+        return {name: read(row) for name, read in self.readers}
+
+    def serialize(self, queryset):
+        """
+        Return the list of the representations of the objects of the queryset
+        """
+        rows = list(queryset.values_list(*self.columns))
+        self.prefetch(rows)
+        return [self.to_representation(row) for row in rows]
+
+
+def to_columns(representations, field_names, delta_fields=()):
+    """
+    Convert a list of representations to a dict of parallel arrays, one for each field.
+    The arrays of the delta_fields contain the first value followed by the differences between consecutive values
+    """
+    columns = {name: [representation[name] for representation in representations] for name in field_names}
+    for name in delta_fields:
+        values = columns[name]
+        columns[name] = values[:1] + [current - previous for previous, current in zip(values, values[1:])]
+    return columns
@@ -0,0 +1,105 @@
+import io
+import json
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from recorder_engine.fast_serializers import ValuesSerializer
+from recorder_engine.models import *
+from recorder_engine.parsers import FastJSONParser
+from recorder_engine.renderers import FastJSONRenderer
+from recorder_engine.serializers import *
+
+
+# Renderers and parsers compared by the benchmark
+RENDERERS = (('JSONRenderer', JSONRenderer), ('FastJSONRenderer', FastJSONRenderer))
+PARSERS = (('JSONParser', JSONParser), ('FastJSONParser', FastJSONParser))
+
+
+class Command(BaseCommand):
+    """
+    Measure the throughput of the JSON renderers and parsers on the UserDump of the dataset created by
+    generate_dataset
+    """
+    help = "Render and parse the UserDump of the biggest user of the dataset with the DRF and the fast JSON " \
+           "renderers and parsers, reporting the throughput as JSON. The recordings are repeated until the " \
+           "payload reaches --min-size megabytes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefix', default='bench', help="Prefix of the usernames of the dataset")
+        parser.add_argument('--min-size', type=float, default=10, help="Minimum size of the payload in megabytes")
+        parser.add_argument('--repeat', type=int, default=5, help="Number of times each operation is timed")
+        parser.add_argument('--output', help="Write the JSON report to this file instead of the standard output")
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(username__startswith=options['prefix'] + '_') \
+                           .annotate(recordings_count=Count('recording')).order_by('-recordings_count').first()
+        if user is None or not user.recordings_count:
+            raise CommandError("No dataset with the prefix '{prefix}', run generate_dataset first"
+                               .format(prefix=options['prefix']))
+
+        recordings = ValuesSerializer(UserDumpRecordingSerializer()).serialize(Recording.objects.filter(user=user))
+        payload = {
+            'user': UserDumpUserSerializer(user).data,
+            'courses': ValuesSerializer(UserDumpCourseSerializer()).serialize(
+                Course.objects.filter(authorized_users__in=[user])),
+            'recordings': recordings,
+        }
+
+        # Repeat the recordings until the payload is big enough
+        size = len(JSONRenderer().render(payload))
+        copies = max(1, int(options['min_size'] * 1024 * 1024 / size) + 1)
+        payload['recordings'] = recordings * copies
+        rendered = JSONRenderer().render(payload)
+        megabytes = len(rendered) / 1024.0 / 1024.0
+
+        results = []
+        outputs = []
+        for name, renderer_class in RENDERERS:
+            renderer = renderer_class()
+            ms, output = self.time(lambda: renderer.render(payload), options['repeat'])
+            outputs.append(output)
+            results.append(self.result('render', name, ms, megabytes))
+
+        for name, parser_class in PARSERS:
+            parser = parser_class()
+            ms, output = self.time(lambda: parser.parse(io.BytesIO(rendered)), options['repeat'])
+            results.append(self.result('parse', name, ms, megabytes))
+
+        report = {
+            'payload_mb': megabytes,
+            'recordings': len(payload['recordings']),
+            'identical': all(output == rendered for output in outputs),
+            'results': results,
+        }
+
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
+
+    def result(self, operation, name, ms, megabytes):
+        return {
+            'operation': operation,
+            'class': name,
+            'median_ms': ms,
+            'throughput_mb_s': megabytes / (ms / 1000.0) if ms > 0 else None,
+        }
+
+    def time(self, function, repeat):
+        """
+        Return the median time in milliseconds of the function and its last result
+        """
+        timings = []
+        for _ in range(max(repeat, 1)):
+            start = time.perf_counter()
+            result = function()
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        return timings[len(timings) // 2], result
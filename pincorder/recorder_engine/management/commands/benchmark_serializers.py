@@ -0,0 +1,99 @@
+import json
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.test import RequestFactory
+from rest_framework.renderers import JSONRenderer
+
+from recorder_engine.fast_serializers import ValuesSerializer
+from recorder_engine.models import *
+from recorder_engine.serializers import *
+
+
+class Command(BaseCommand):
+    """
+    Compare the ModelSerializers with the ValuesSerializers on the dataset created by generate_dataset
+    """
+    help = "Time the serialization of the recordings, the pins and the UserDump with both the ModelSerializers " \
+           "and the ValuesSerializers, checking that the rendered JSON is the same. Results are reported as JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefix', default='bench', help="Prefix of the usernames of the dataset")
+        parser.add_argument('--repeat', type=int, default=20, help="Number of times each serialization is timed")
+        parser.add_argument('--output', help="Write the JSON report to this file instead of the standard output")
+
+    def handle(self, *args, **options):
+        # Use the user with more recordings, and the recording with more pins
+        user = User.objects.filter(username__startswith=options['prefix'] + '_') \
+                           .annotate(recordings_count=Count('recording')).order_by('-recordings_count').first()
+        if user is None:
+            raise CommandError("No dataset with the prefix '{prefix}', run generate_dataset first"
+                               .format(prefix=options['prefix']))
+        recording = Recording.objects.filter(user=user).annotate(pins_count=Count('pin')) \
+                                     .order_by('-pins_count').first()
+
+        context = {'request': RequestFactory().get('/api/recordings/', SERVER_NAME='localhost')}
+        recordings = Recording.objects.filter(user=user).select_related('user')
+        pins = Pin.objects.filter(recording=recording).order_by('time')
+
+        def model_dump():
+            return UserDumpSerializer({
+                'recordings': Recording.objects.filter(user=user).select_related('course').prefetch_related('pin_set'),
+                'user': user,
+                'courses': Course.objects.filter(authorized_users__in=[user]).select_related('teacher'),
+            }).data
+
+        def values_dump():
+            return {
+                'user': UserDumpUserSerializer(user).data,
+                'courses': ValuesSerializer(UserDumpCourseSerializer()).serialize(
+                    Course.objects.filter(authorized_users__in=[user])),
+                'recordings': ValuesSerializer(UserDumpRecordingSerializer()).serialize(
+                    Recording.objects.filter(user=user)),
+            }
+
+        cases = [
+            ('recordings', recordings.count(),
+             lambda: RecordingSerializer(recordings.all(), many=True, context=context).data,
+             lambda: ValuesSerializer(RecordingSerializer(context=context)).serialize(recordings.all())),
+            ('pins', pins.count(),
+             lambda: PinSerializer(pins.all(), many=True, context=context).data,
+             lambda: ValuesSerializer(PinSerializer(context=context)).serialize(pins.all())),
+            ('user-dump', recordings.count(), model_dump, values_dump),
+        ]
+
+        results = []
+        for name, rows, model_path, values_path in cases:
+            model_ms, model_json = self.time(model_path, options['repeat'])
+            values_ms, values_json = self.time(values_path, options['repeat'])
+            results.append({
+                'case': name,
+                'rows': rows,
+                'model_serializer_ms': model_ms,
+                'values_serializer_ms': values_ms,
+                'speedup': model_ms / values_ms if values_ms > 0 else None,
+                'identical': model_json == values_json,
+            })
+
+        output = json.dumps({'repeat': options['repeat'], 'cases': results}, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
+
+    def time(self, serialize, repeat):
+        """
+        Return the median time in milliseconds of the serialization, queries and rendering included,
+        and the rendered JSON
+        """
+        renderer = JSONRenderer()
+        timings = []
+        for _ in range(max(repeat, 1)):
+            start = time.perf_counter()
+            rendered = renderer.render(serialize())
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        return timings[len(timings) // 2], rendered
@@ -0,0 +1,209 @@
+import datetime
+import os
+import random
+
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models, transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from recorder_engine.bulk import case_by_id
+from recorder_engine.counters import annotate_expected_counters
+from recorder_engine.course_statistics import compute_course_statistics
+from recorder_engine.models import *
+
+
+# Number of objects inserted by each bulk_create
+BATCH_SIZE = 500
+
+# Number of recordings whose pins are generated at once, to keep the memory bounded
+RECORDINGS_CHUNK_SIZE = 1000
+
+# Size in bytes of the fake media files
+FAKE_AUDIO_SIZE = 64 * 1024
+FAKE_IMAGE_SIZE = 8 * 1024
+
+
+class Command(BaseCommand):
+    """
+    Generate a synthetic dataset, used to reproduce the production load locally
+    """
+    help = "Generate users, course trees, recordings, pins and fake media files using bulk inserts"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10, help="Number of users")
+        parser.add_argument('--courses', type=int, default=5, help="Number of root courses")
+        parser.add_argument('--subcourses', type=int, default=3, help="Number of children of each root course")
+        parser.add_argument('--courses-per-user', type=int, default=3,
+                            help="Number of courses that each user is authorized to view")
+        parser.add_argument('--recordings', type=int, default=20, help="Number of recordings for each user")
+        parser.add_argument('--pins', type=int, default=30, help="Average number of pins for each recording")
+        parser.add_argument('--media', action='store_true',
+                            help="Add a fake audio file to each recording and a fake image to some pins")
+        parser.add_argument('--prefix', default='bench', help="Prefix of the generated usernames")
+        parser.add_argument('--seed', type=int, default=0, help="Seed of the random generator")
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        prefix = options['prefix']
+
+        if User.objects.filter(username__startswith=prefix + '_').exists():
+            raise CommandError("A dataset with the prefix '{prefix}' already exists".format(prefix=prefix))
+
+        with transaction.atomic():
+            users = self.create_users(prefix, options['users'])
+            courses = self.create_courses(prefix, options['courses'], options['subcourses'])
+            self.authorize_users(users, courses, options['courses_per_user'])
+            recordings = self.create_recordings(prefix, users, courses, options['recordings'])
+
+        pins_count = 0
+        files_count = 0
+        for start in range(0, len(recordings), RECORDINGS_CHUNK_SIZE):
+            chunk = recordings[start:start + RECORDINGS_CHUNK_SIZE]
+            with transaction.atomic():
+                pins_count += self.create_pins(chunk, options['pins'], options['media'])
+                if options['media']:
+                    files_count += self.create_files(chunk)
+                self.update_counters(chunk)
+
+        # The statistics and the storage usage are computed from the counters of the recordings, set above
+        with transaction.atomic():
+            self.create_course_statistics(courses)
+            self.create_storage_usage(users)
+
+        self.stdout.write("Generated {users} users, {courses} courses, {recordings} recordings, "
+                          "{pins} pins and {files} files".format(users=len(users), courses=len(courses),
+                                                                 recordings=len(recordings), pins=pins_count,
+                                                                 files=files_count))
+
+    def create_users(self, prefix, count):
+        """
+        Create the users and return their ids
+        """
+        User.objects.bulk_create([User(username="{prefix}_{n}".format(prefix=prefix, n=n),
+                                       first_name="User", last_name=str(n),
+                                       email="{prefix}_{n}@example.com".format(prefix=prefix, n=n))
+                                  for n in range(count)], batch_size=BATCH_SIZE)
+
+        # bulk_create doesn't return the primary keys on every database, so they are fetched again
+        return list(User.objects.filter(username__startswith=prefix + '_').values_list('id', flat=True))
+
+    def create_courses(self, prefix, count, subcourses):
+        """
+        Create the root courses, each one with a teacher and some children. Return the ids of all the courses
+        """
+        Teacher.objects.bulk_create([Teacher(name="{prefix} Teacher {n}".format(prefix=prefix, n=n))
+                                     for n in range(count)], batch_size=BATCH_SIZE)
+        teachers = Teacher.objects.filter(name__startswith=prefix + ' Teacher ').values_list('id', flat=True)
+
+        Course.objects.bulk_create([Course(name="{prefix} Course {n}".format(prefix=prefix, n=n), teacher_id=teacher)
+                                    for n, teacher in enumerate(teachers)], batch_size=BATCH_SIZE)
+        roots = list(Course.objects.filter(name__startswith=prefix + ' Course ').values_list('id', 'teacher_id'))
+
+        Course.objects.bulk_create([Course(name="{prefix} Module {root}.{n}".format(prefix=prefix, root=root, n=n),
+                                           teacher_id=teacher, parent_course_id=root)
+                                    for root, teacher in roots for n in range(subcourses)], batch_size=BATCH_SIZE)
+
+        return list(Course.objects.filter(name__startswith=prefix + ' ').values_list('id', flat=True))
+
+    def authorize_users(self, users, courses, courses_per_user):
+        """
+        Authorize each user to view some random courses
+        """
+        membership = Course.authorized_users.through
+        membership.objects.bulk_create([membership(course_id=course, user_id=user)
+                                        for user in users
+                                        for course in self.random.sample(courses, min(courses_per_user,
+                                                                                      len(courses)))],
+                                       batch_size=BATCH_SIZE)
+
+    def create_recordings(self, prefix, users, courses, count):
+        """
+        Create the recordings of each user and return their ids
+        """
+        now = timezone.now()
+        Recording.objects.bulk_create([Recording(name="Lecture {n}".format(n=n),
+                                                 date=now - datetime.timedelta(days=n,
+                                                                               hours=self.random.randint(8, 18)),
+                                                 course_id=self.random.choice(courses) if courses else None,
+                                                 status="CONVERTED", is_online=True, is_converted=True,
+                                                 user_id=user)
+                                       for user in users for n in range(count)], batch_size=BATCH_SIZE)
+
+        return list(Recording.objects.filter(user__username__startswith=prefix + '_').values_list('id', flat=True))
+
+    def create_pins(self, recordings, average, media):
+        """
+        Create a random number of pins for each recording, spread along a lecture of about an hour
+        """
+        pins = []
+        for recording in recordings:
+            time = 0
+            for n in range(self.random.randint(0, 2 * average)):
+                time += self.random.randint(1000, 240000)
+                pin = Pin(recording_id=recording, time=time, text="Note {n} about the lecture".format(n=n))
+
+                # One pin out of ten has an image
+                if media and self.random.random() < 0.1:
+                    pin.media_url = self.save_fake_file('image.jpg', FAKE_IMAGE_SIZE)
+                    pin.media_size = FAKE_IMAGE_SIZE
+                pins.append(pin)
+
+        Pin.objects.bulk_create(pins, batch_size=BATCH_SIZE)
+        return len(pins)
+
+    def create_files(self, recordings):
+        """
+        Create a fake audio file for each recording
+        """
+        RecordingFile.objects.bulk_create([RecordingFile(recording_id=recording,
+                                                         file_url=self.save_fake_file('audio.mp3', FAKE_AUDIO_SIZE),
+                                                         size=FAKE_AUDIO_SIZE)
+                                           for recording in recordings], batch_size=BATCH_SIZE)
+        return len(recordings)
+
+    def update_counters(self, recordings):
+        """
+        Set the counters of the recordings from their pins and files, that the bulk inserts don't update
+        """
+        pin_counts, files, media_bytes = {}, {}, {}
+        for id, pin_count, has_file, size in annotate_expected_counters(Recording.objects.filter(id__in=recordings)) \
+                .values_list('id', 'expected_pin_count', 'expected_has_file', 'expected_media_bytes'):
+            pin_counts[id] = pin_count
+            files[id] = has_file
+            media_bytes[id] = size
+        if not pin_counts:
+            return
+
+        # A single UPDATE for all the recordings
+        Recording.objects.filter(id__in=pin_counts).update(
+            pin_count=case_by_id(models.IntegerField(), pin_counts),
+            has_file=case_by_id(models.BooleanField(), files),
+            media_bytes=case_by_id(models.BigIntegerField(), media_bytes))
+
+    def create_course_statistics(self, courses):
+        """
+        Create the statistics of the courses, that the bulk inserts don't send the signals for
+        """
+        statistics = compute_course_statistics()
+        CourseStatistics.objects.bulk_create([CourseStatistics(course_id=course, **statistics[course])
+                                              for course in courses], batch_size=BATCH_SIZE)
+
+    def create_storage_usage(self, users):
+        """
+        Create the storage usage of the users, that the bulk inserts don't send the signals for
+        """
+        used = dict(Recording.objects.filter(user_id__in=users).order_by().values('user_id')
+                             .annotate(used=Sum('media_bytes')).values_list('user_id', 'used'))
+        StorageUsage.objects.bulk_create([StorageUsage(user_id=user, used_bytes=used.get(user) or 0)
+                                          for user in users], batch_size=BATCH_SIZE)
+
+    def save_fake_file(self, filename, size):
+        """
+        Save a file filled with random bytes in the media storage and return its name
+        """
+        name = unique_name_generator(None, filename)
+        return default_storage.save(name, ContentFile(os.urandom(size)))
@@ -0,0 +1,84 @@
+import datetime
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from oauth2_provider.models import AccessToken, Grant, RefreshToken
+from oauth2_provider.settings import oauth2_settings
+
+
+class Command(BaseCommand):
+    """
+    Delete the expired OAuth2 tokens and grants in small batches, each one in its own short transaction,
+    so that the command can run beside the live traffic without holding long locks.
+    Revoked tokens are already deleted by oauth2_provider, so only the expired ones are left in the tables
+    """
+    help = "Delete the OAuth2 access tokens, refresh tokens and grants expired for more than the retention period"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention', type=int, default=settings.TOKEN_PURGE_RETENTION,
+                            help="Number of seconds the expired rows are kept")
+        parser.add_argument('--batch-size', type=int, default=settings.TOKEN_PURGE_BATCH_SIZE,
+                            help="Number of rows deleted by each transaction")
+        parser.add_argument('--sleep', type=float, default=0,
+                            help="Number of seconds to wait between the batches, to reduce the load")
+        parser.add_argument('--dry-run', action='store_true', help="Only count the rows that would be deleted")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("The batch size must be positive")
+        if options['retention'] < 0:
+            raise CommandError("The retention can't be negative")
+
+        self.batch_size = options['batch_size']
+        self.sleep = options['sleep']
+        self.dry_run = options['dry_run']
+
+        expired_before = timezone.now() - datetime.timedelta(seconds=options['retention'])
+
+        removed = []
+
+        # Refresh tokens never expire unless REFRESH_TOKEN_EXPIRE_SECONDS is set, in that case they expire
+        # that many seconds after their access token. They go first, so that their access tokens can be purged too
+        refresh_expire_seconds = oauth2_settings.REFRESH_TOKEN_EXPIRE_SECONDS
+        if refresh_expire_seconds:
+            if not isinstance(refresh_expire_seconds, datetime.timedelta):
+                refresh_expire_seconds = datetime.timedelta(seconds=refresh_expire_seconds)
+            removed.append(("refresh tokens", self.purge(RefreshToken.objects.filter(
+                access_token__expires__lt=expired_before - refresh_expire_seconds))))
+        else:
+            removed.append(("refresh tokens", 0))
+
+        # Access tokens with a refresh token can still be refreshed, so they are kept
+        removed.append(("access tokens", self.purge(AccessToken.objects.filter(
+            refresh_token__isnull=True, expires__lt=expired_before))))
+
+        removed.append(("grants", self.purge(Grant.objects.filter(expires__lt=expired_before))))
+
+        verb = "Would remove" if self.dry_run else "Removed"
+        for name, count in removed:
+            self.stdout.write("{verb} {count} {name}".format(verb=verb, count=count, name=name))
+
+    def purge(self, queryset):
+        """
+        Delete the rows of the queryset in batches and return the number of deleted rows
+        """
+        if self.dry_run:
+            return queryset.count()
+
+        model = queryset.model
+        removed = 0
+        while True:
+            # Select the ids first, as not every database supports DELETE with LIMIT
+            with transaction.atomic():
+                ids = list(queryset.order_by('id').values_list('id', flat=True)[:self.batch_size])
+                if not ids:
+                    return removed
+
+                # Only the rows of the model are counted, not the ones deleted in cascade
+                removed += model.objects.filter(id__in=ids).delete()[1].get(model._meta.label, 0)
+
+            if self.sleep:
+                time.sleep(self.sleep)
@@ -0,0 +1,168 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.contrib.auth.models import User
+from django.db.models import F, Q, Sum
+
+from recorder_engine.counters import annotate_expected_counters
+from recorder_engine.course_statistics import STATISTICS_FIELDS, compute_course_statistics
+from recorder_engine.models import CourseStatistics, Pin, Recording, RecordingFile, StorageUsage
+
+
+class Command(BaseCommand):
+    """
+    Recompute the counters of the recordings ( see recorder_engine/counters.py ) from their pins and files,
+    and fix the ones that drifted, e.g. because the rows were changed outside the API.
+    The recordings are checked in small batches, each one in its own short transaction.
+    Then the storage used by the users and the statistics of the courses are recomputed from the counters of the
+    recordings. Meant to run periodically, e.g. every night
+    """
+    help = "Fix the pin count, the file flag and the media size of the recordings that don't match their rows, " \
+           "the storage used by the users and the statistics of the courses"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.COUNTER_RECONCILE_BATCH_SIZE,
+                            help="Number of recordings checked by each transaction")
+        parser.add_argument('--sizes', action='store_true',
+                            help="Read the sizes of the files and of the images from the storage first")
+        parser.add_argument('--dry-run', action='store_true', help="Only count the rows that would be fixed")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("The batch size must be positive")
+
+        self.batch_size = options['batch_size']
+        self.dry_run = options['dry_run']
+        verb = "Would fix" if self.dry_run else "Fixed"
+
+        if options['sizes']:
+            for name, queryset, field in (("file sizes", RecordingFile.objects.all(), 'file_url'),
+                                          ("image sizes", Pin.objects.exclude(media_url=''), 'media_url')):
+                fixed, missing = self.fix_sizes(queryset, field)
+                self.stdout.write("{verb} {count} {name}, {missing} missing in the storage"
+                                  .format(verb=verb, count=fixed, name=name, missing=missing))
+
+        self.stdout.write("{verb} {count} recordings".format(verb=verb, count=self.fix_counters()))
+
+        # The storage usage and the statistics of the courses are computed from the counters of the recordings,
+        # fixed above
+        self.stdout.write("{verb} {count} storage usages".format(verb=verb, count=self.fix_storage_usage()))
+        self.stdout.write("{verb} {count} course statistics".format(verb=verb, count=self.fix_course_statistics()))
+
+    def fix_sizes(self, queryset, field):
+        """
+        Set the size column of the rows to the size of their file in the storage ( 0 if the file is missing ),
+        and return the number of fixed rows and of missing files
+        """
+        size_field = 'size' if field == 'file_url' else 'media_size'
+        storage = queryset.model._meta.get_field(field).storage
+        fixed, missing = 0, 0
+
+        last_id = 0
+        while True:
+            rows = list(queryset.filter(id__gt=last_id).order_by('id')
+                                .values_list('id', field, size_field)[:self.batch_size])
+            if not rows:
+                return fixed, missing
+            last_id = rows[-1][0]
+
+            for id, name, size in rows:
+                try:
+                    actual = storage.size(name)
+                except (IOError, OSError):
+                    missing += 1
+                    actual = 0
+
+                if actual != size:
+                    fixed += 1
+                    if not self.dry_run:
+                        queryset.model.objects.filter(id=id).update(**{size_field: actual})
+
+    def fix_counters(self):
+        """
+        Fix the counters of the recordings that don't match their rows, and return the number of fixed recordings
+        """
+        drifted = (~Q(pin_count=F('expected_pin_count')) | ~Q(has_file=F('expected_has_file')) |
+                   ~Q(media_bytes=F('expected_media_bytes')))
+        fixed = 0
+
+        last_id = 0
+        while True:
+            with transaction.atomic():
+                ids = list(Recording.objects.filter(id__gt=last_id).order_by('id')
+                                            .values_list('id', flat=True)[:self.batch_size])
+                if not ids:
+                    return fixed
+                last_id = ids[-1]
+
+                # The counters are compared by the database, only the drifted recordings are loaded
+                rows = annotate_expected_counters(Recording.objects.filter(id__in=ids)).filter(drifted) \
+                    .values_list('id', 'expected_pin_count', 'expected_has_file', 'expected_media_bytes')
+
+                for id, pin_count, has_file, media_bytes in rows:
+                    fixed += 1
+                    if not self.dry_run:
+                        Recording.objects.filter(id=id).update(pin_count=pin_count, has_file=has_file,
+                                                               media_bytes=media_bytes)
+
+    def fix_storage_usage(self):
+        """
+        Fix the storage used by the users that doesn't match the counters of their recordings, creating the missing
+        rows, and return the number of fixed users
+        """
+        fixed = 0
+
+        last_id = 0
+        while True:
+            with transaction.atomic():
+                ids = list(User.objects.filter(id__gt=last_id).order_by('id')
+                                       .values_list('id', flat=True)[:self.batch_size])
+                if not ids:
+                    return fixed
+                last_id = ids[-1]
+
+                expected = dict(Recording.objects.filter(user_id__in=ids).order_by().values('user_id')
+                                         .annotate(used=Sum('media_bytes')).values_list('user_id', 'used'))
+                current = dict(StorageUsage.objects.filter(user_id__in=ids).values_list('user_id', 'used_bytes'))
+
+                for id in ids:
+                    used = expected.get(id) or 0
+                    if current.get(id) == used:
+                        continue
+
+                    fixed += 1
+                    if self.dry_run:
+                        continue
+                    if id in current:
+                        StorageUsage.objects.filter(user_id=id).update(used_bytes=used)
+                    else:
+                        StorageUsage.objects.create(user_id=id, used_bytes=used)
+
+    def fix_course_statistics(self):
+        """
+        Fix the statistics of the courses that don't match the recordings of their sub trees, creating the missing
+        ones, and return the number of fixed courses. The last activity is only set when it's missing
+        """
+        with transaction.atomic():
+            expected = compute_course_statistics()
+            current = {statistics['course_id']: statistics for statistics in
+                       CourseStatistics.objects.values('course_id', 'last_activity', *STATISTICS_FIELDS)}
+
+            fixed = 0
+            for course_id, statistics in expected.items():
+                if course_id not in current:
+                    fixed += 1
+                    if not self.dry_run:
+                        CourseStatistics.objects.create(course_id=course_id, **statistics)
+                    continue
+
+                changes = {field: statistics[field] for field in STATISTICS_FIELDS
+                           if statistics[field] != current[course_id][field]}
+                if current[course_id]['last_activity'] is None and statistics['last_activity'] is not None:
+                    changes['last_activity'] = statistics['last_activity']
+
+                if changes:
+                    fixed += 1
+                    if not self.dry_run:
+                        CourseStatistics.objects.filter(course_id=course_id).update(**changes)
+            return fixed
@@ -0,0 +1,155 @@
+"""
+Prometheus metrics of the application.
+
+When the application runs in multiple preforked worker processes ( for example with gunicorn ), the
+PROMETHEUS_MULTIPROC_DIR environment variable must point to an empty directory shared by all the workers,
+and the metrics of dead workers must be marked in the server configuration:
+
+    def child_exit(server, worker):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
+
+The metrics are scraped with the METRICS_TOKEN as bearer token ( 'authorization' in the Prometheus scrape config )
+"""
+import hmac
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import CollectorRegistry, Counter, Histogram, REGISTRY, CONTENT_TYPE_LATEST, generate_latest
+from prometheus_client import multiprocess
+
+
+# Metrics
+
+REQUEST_LATENCY = Histogram('pincorder_request_latency_seconds', "Latency of the requests",
+                            ['route', 'method', 'status'])
+
+REQUEST_DB_QUERIES = Histogram('pincorder_request_db_queries', "Number of database queries made by each request",
+                               ['route'], buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500))
+
+REQUEST_DB_TIME = Histogram('pincorder_request_db_seconds', "Time spent in database queries by each request",
+                            ['route'])
+
+UPLOAD_BYTES = Histogram('pincorder_upload_bytes', "Size of the uploaded request bodies", ['route'],
+                         buckets=tuple(1024 * 4 ** n for n in range(11)))
+
+UPLOAD_DURATION = Histogram('pincorder_upload_duration_seconds', "Duration of the upload requests", ['route'],
+                            buckets=(.05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, 120, 300))
+
+CACHE_LOOKUPS = Counter('pincorder_cache_lookups_total', "Lookups in the application caches", ['cache', 'result'])
+
+
+# Routes whose request body is an uploaded file
+UPLOAD_ROUTES = ('recording-upload-file', 'recording-add-pin')
+
+
+def record_cache_lookup(cache, hit):
+    """
+    Count a lookup in the given cache. The hit ratio is hits / ( hits + misses )
+    """
+    CACHE_LOOKUPS.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+# Database instrumentation
+
+# Queries count and time of the request handled by the current thread
+_request_stats = threading.local()
+
+
+class MetricsCursorWrapper(object):
+    """
+    Wrap a database cursor, adding the number and the duration of the queries to the current request stats
+    """
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _timed(self, method, *args):
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            if getattr(_request_stats, 'active', False):
+                _request_stats.queries += 1
+                _request_stats.time += time.perf_counter() - start
+
+    def execute(self, sql, params=None):
+        return self._timed(self.cursor.execute, sql, params)
+
+    def executemany(self, sql, param_list):
+        return self._timed(self.cursor.executemany, sql, param_list)
+
+    def callproc(self, procname, params=None):
+        return self._timed(self.cursor.callproc, procname, params)
+
+
+def instrument_connections():
+    """
+    Make the database connections of the current thread return instrumented cursors.
+    Connections are per thread, so this is called at the beginning of every request
+    """
+    for connection in connections.all():
+        if getattr(connection, '_metrics_instrumented', False):
+            continue
+
+        def wrap(make_cursor):
+            return lambda cursor: MetricsCursorWrapper(make_cursor(cursor))
+
+        connection.make_cursor = wrap(connection.make_cursor)
+        connection.make_debug_cursor = wrap(connection.make_debug_cursor)
+        connection._metrics_instrumented = True
+
+
+def start_request_stats():
+    _request_stats.active = True
+    _request_stats.queries = 0
+    _request_stats.time = 0.0
+
+
+def stop_request_stats():
+    """
+    Stop collecting the database stats of the current request and return the (queries, seconds) couple
+    """
+    _request_stats.active = False
+    return _request_stats.queries, _request_stats.time
+
+
+# Scrape endpoint
+
+def get_registry():
+    """
+    Return the registry to expose. With multiple processes, the metrics of all the workers are aggregated
+    """
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ or 'prometheus_multiproc_dir' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def metrics_view(request):
+    """
+    Expose the metrics in the Prometheus text format, only to the requests with the METRICS_TOKEN
+    """
+    scheme, _, token = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+    # Compared in constant time, so that the token can't be guessed from the response times
+    if not settings.METRICS_TOKEN or scheme.lower() != 'bearer' or \
+            not hmac.compare_digest(token.encode('utf-8'), settings.METRICS_TOKEN.encode('utf-8')):
+        return HttpResponseForbidden()
+
+    return HttpResponse(generate_latest(get_registry()), content_type=CONTENT_TYPE_LATEST)
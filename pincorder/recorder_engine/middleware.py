@@ -0,0 +1,214 @@
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.handlers.base import BaseHandler
+from django.core.handlers.exception import convert_exception_to_response
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.module_loading import import_string
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from . import compression, metrics, profiling
+from .authentication import get_bearer_token
+
+
+class MetricsMiddleware(object):
+    """
+    Collect the latency, the database queries and the upload metrics of every request
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics.instrument_connections()
+        metrics.start_request_stats()
+        start = time.perf_counter()
+
+        try:
+            response = self.get_response(request)
+        finally:
+            queries, db_time = metrics.stop_request_stats()
+        duration = time.perf_counter() - start
+
+        # Label the metrics with the name of the resolved route, to keep a bounded number of labels
+        resolver_match = getattr(request, 'resolver_match', None)
+        route = resolver_match.view_name if resolver_match else '<unresolved>'
+
+        metrics.REQUEST_LATENCY.labels(route, request.method, response.status_code).observe(duration)
+        metrics.REQUEST_DB_QUERIES.labels(route).observe(queries)
+        metrics.REQUEST_DB_TIME.labels(route).observe(db_time)
+
+        if resolver_match and resolver_match.url_name in metrics.UPLOAD_ROUTES:
+            metrics.UPLOAD_BYTES.labels(route).observe(int(request.META.get('CONTENT_LENGTH') or 0))
+            metrics.UPLOAD_DURATION.labels(route).observe(duration)
+
+        return response
+
+
+class CompressionMiddleware(object):
+    """
+    Compress the responses with the best encoding accepted by the client, brotli or gzip.
+    Only the COMPRESSION_CONTENT_TYPES are compressed, and only when bigger than COMPRESSION_MIN_SIZE bytes.
+    The streaming responses are compressed one chunk at a time
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        if response.has_header('Content-Encoding') or not self.is_compressible(response):
+            return response
+        if not response.streaming and len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return response
+
+        # The response depends on the Accept-Encoding header, even when it's not compressed
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        encoding = compression.get_accepted_encoding(request)
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            # The length is unknown until the last chunk is compressed
+            response.streaming_content = compression.compress_sequence(encoding, response.streaming_content)
+            del response['Content-Length']
+        else:
+            compressed = compression.compress(encoding, response.content)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(compressed))
+
+        # The compressed body is different, so the ETag can only be weak
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+
+        response['Content-Encoding'] = encoding
+        return response
+
+    def is_compressible(self, response):
+        content_type = response.get('Content-Type', '')
+        return any(content_type.startswith(prefix) for prefix in settings.COMPRESSION_CONTENT_TYPES)
+
+
+class ProfilingMiddleware(object):
+    """
+    Profile the requests of staff users that ask for it with the 'X-Profile' header or the 'profile' parameter.
+    With the 'store' value the report is saved in PROFILE_ROOT and its name is returned in the
+    'X-Profile-Report' header, with any other value the report replaces the response
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = request.META.get('HTTP_X_PROFILE') or request.GET.get('profile')
+
+        # Requests that don't ask for a profile are passed through without any other check
+        if not mode or not self.is_staff(request):
+            return self.get_response(request)
+
+        response, report = profiling.profile_request(self.get_response, request)
+
+        if mode == 'store':
+            response['X-Profile-Report'] = profiling.store_report(report)
+            return response
+
+        return HttpResponse(report, content_type='text/plain; charset=utf-8')
+
+    def is_staff(self, request):
+        """
+        Check if the request is made by a staff user, using the same authentication classes of the API
+        """
+        # The user is missing on the stateless requests, which skip the AuthenticationMiddleware
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated and user.is_staff:
+            return True
+
+        drf_request = Request(request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+        try:
+            user = drf_request.user
+        except APIException:
+            return False
+        return user is not None and user.is_authenticated and user.is_staff
+
+
+class StatelessAPIMiddleware(object):
+    """
+    Handle the API requests authenticated with an access token ( 'Authorization: Bearer <token>' ) without the
+    middleware that only serve cookie based clients: sessions are not loaded or saved, messages are not stored and
+    the CSRF checks are skipped, as a token can't be sent by a browser on its own.
+    Every other request goes through the full middleware chain
+    """
+
+    # Path prefix of the API
+    API_PREFIX = '/api/'
+
+    # Middleware skipped by the stateless requests
+    STATEFUL_MIDDLEWARE = (
+        'django.contrib.sessions.middleware.SessionMiddleware',
+        'django.middleware.csrf.CsrfViewMiddleware',
+        'django.contrib.auth.middleware.AuthenticationMiddleware',
+        'django.contrib.messages.middleware.MessageMiddleware',
+    )
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.stateless_handler = StatelessHandler(self.get_stateless_middleware())
+
+    def get_stateless_middleware(self):
+        """
+        Return the middleware that follow this one in the MIDDLEWARE setting, without the stateful ones
+        """
+        path = '{module}.{name}'.format(module=self.__module__, name=self.__class__.__name__)
+        following = settings.MIDDLEWARE[settings.MIDDLEWARE.index(path) + 1:]
+        return [middleware for middleware in following if middleware not in self.STATEFUL_MIDDLEWARE]
+
+    def __call__(self, request):
+        if not self.is_stateless(request):
+            return self.get_response(request)
+
+        # Used by the views to authenticate the request with the access token only
+        request.stateless_api = True
+        return self.stateless_handler.middleware_chain(request)
+
+    def is_stateless(self, request):
+        """
+        Check if the request is an API request authenticated with an access token.
+        The social tokens ( 'Bearer <backend> <token>' ) need the session, so they use the full middleware chain
+        """
+        return request.path_info.startswith(self.API_PREFIX) and get_bearer_token(request) is not None
+
+
+class StatelessHandler(BaseHandler):
+    """
+    Request handler that uses the given middleware list instead of the MIDDLEWARE setting
+    """
+    def __init__(self, middleware):
+        super(StatelessHandler, self).__init__()
+        self._view_middleware = []
+        self._template_response_middleware = []
+        self._exception_middleware = []
+
+        # Same as BaseHandler.load_middleware for the new style middleware
+        handler = convert_exception_to_response(self._get_response)
+        for middleware_path in reversed(middleware):
+            try:
+                mw_instance = import_string(middleware_path)(handler)
+            except MiddlewareNotUsed:
+                continue
+
+            if hasattr(mw_instance, 'process_view'):
+                self._view_middleware.insert(0, mw_instance.process_view)
+            if hasattr(mw_instance, 'process_template_response'):
+                self._template_response_middleware.append(mw_instance.process_template_response)
+            if hasattr(mw_instance, 'process_exception'):
+                self._exception_middleware.append(mw_instance.process_exception)
+
+            handler = convert_exception_to_response(mw_instance)
+
+        self.middleware_chain = handler
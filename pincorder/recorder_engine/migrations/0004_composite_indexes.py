@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 05:31
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import recorder_engine.models
+
+
+def restore_membership_unique_index(apps, schema_editor):
+    """
+    Add back the unique (course_id, user_id) index of the through table on SQLite, where the tables rebuilt by the
+    previous migrations lose it. The other databases keep the one created by Django
+    """
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('CREATE UNIQUE INDEX IF NOT EXISTS recorder_en_course_user_uniq '
+                              'ON recorder_engine_course_authorized_users (course_id, user_id)')
+
+
+def drop_membership_unique_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP INDEX IF EXISTS recorder_en_course_user_uniq')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recorder_engine', '0003_auto_20170408_1857'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='course',
+            options={'ordering': ['id']},
+        ),
+        migrations.AlterModelOptions(
+            name='pin',
+            options={'ordering': ['time']},
+        ),
+        migrations.AlterModelOptions(
+            name='recording',
+            options={'ordering': ['id']},
+        ),
+        migrations.AlterModelOptions(
+            name='teacher',
+            options={'ordering': ['name']},
+        ),
+        migrations.AlterField(
+            model_name='pin',
+            name='media_url',
+            field=models.FileField(blank=True, upload_to=recorder_engine.models.unique_name_generator),
+        ),
+        migrations.AlterField(
+            model_name='pin',
+            name='time',
+            field=models.BigIntegerField(),
+        ),
+        migrations.AlterField(
+            model_name='recording',
+            name='course',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='recorder_engine.Course'),
+        ),
+        migrations.AlterField(
+            model_name='recordingfile',
+            name='file_url',
+            field=models.FileField(upload_to=recorder_engine.models.unique_name_generator),
+        ),
+        migrations.AlterUniqueTogether(
+            name='pin',
+            unique_together=set([('recording', 'time')]),
+        ),
+        migrations.AddIndex(
+            model_name='recording',
+            index=models.Index(fields=['user', 'id'], name='recorder_en_user_id_c52597_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recording',
+            index=models.Index(fields=['user', 'name'], name='recorder_en_user_id_8950a3_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recording',
+            index=models.Index(fields=['user', 'date'], name='recorder_en_user_id_3f2794_idx'),
+        ),
+        # The through table of Course.authorized_users is auto created, so its indexes are added manually.
+        # Its unique (course_id, user_id) index serves the lookups by course, only the reverse one is missing
+        migrations.RunPython(restore_membership_unique_index, drop_membership_unique_index),
+        migrations.RunSQL(
+            ['CREATE INDEX IF NOT EXISTS recorder_en_user_course_idx '
+             'ON recorder_engine_course_authorized_users (user_id, course_id)'],
+            ['DROP INDEX IF EXISTS recorder_en_user_course_idx'],
+        ),
+    ]
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Index the expiration time of the OAuth2 tokens and grants, used by the purge_tokens command
+    to find the expired rows without scanning the whole tables
+    """
+
+    dependencies = [
+        ('oauth2_provider', '0004_auto_20160525_1623'),
+        ('recorder_engine', '0004_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            # The indexes may already exist, e.g. created by hand on a live database
+            ['CREATE INDEX IF NOT EXISTS recorder_en_accesstoken_expires_idx ON oauth2_provider_accesstoken (expires)',
+             'CREATE INDEX IF NOT EXISTS recorder_en_grant_expires_idx ON oauth2_provider_grant (expires)'],
+            ['DROP INDEX IF EXISTS recorder_en_accesstoken_expires_idx',
+             'DROP INDEX IF EXISTS recorder_en_grant_expires_idx'],
+        ),
+    ]
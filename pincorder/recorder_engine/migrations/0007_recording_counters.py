@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 06:11
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recorder_engine', '0006_sync_versions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pin',
+            name='media_size',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='recording',
+            name='duration',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='recording',
+            name='has_file',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='recording',
+            name='media_bytes',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='recording',
+            name='pin_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='recordingfile',
+            name='size',
+            field=models.BigIntegerField(default=0),
+        ),
+        # Count the pins and the files of the existing recordings.
+        # The sizes of the files are unknown until the reconcile_counters command is run with --sizes
+        migrations.RunSQL(
+            ['UPDATE recorder_engine_recording SET '
+            'pin_count = (SELECT COUNT(*) FROM recorder_engine_pin '
+            '             WHERE recorder_engine_pin.recording_id = recorder_engine_recording.id), '
+            'has_file = EXISTS (SELECT 1 FROM recorder_engine_recordingfile '
+            '                   WHERE recorder_engine_recordingfile.recording_id = recorder_engine_recording.id)'],
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 06:18
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_course_statistics(apps, schema_editor):
+    """
+    Compute the statistics of the existing courses, adding the recordings of each course to all its ancestors
+    """
+    Course = apps.get_model('recorder_engine', 'Course')
+    CourseStatistics = apps.get_model('recorder_engine', 'CourseStatistics')
+    Recording = apps.get_model('recorder_engine', 'Recording')
+
+    parents = dict(Course.objects.values_list('id', 'parent_course_id'))
+    statistics = {id: CourseStatistics(course_id=id) for id in parents}
+
+    for row in Recording.objects.filter(course__isnull=False).order_by().values('course_id').annotate(
+            recordings=models.Count('id'), pins=models.Sum('pin_count'), duration=models.Sum('duration'),
+            activity=models.Max('updated')):
+        id, seen = row['course_id'], set()
+        while id is not None and id not in seen:
+            seen.add(id)
+            course = statistics[id]
+            course.recording_count += row['recordings']
+            course.pin_count += row['pins'] or 0
+            course.total_duration += row['duration'] or 0
+            if course.last_activity is None or row['activity'] > course.last_activity:
+                course.last_activity = row['activity']
+            id = parents[id]
+
+    CourseStatistics.objects.bulk_create(statistics.values())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recorder_engine', '0007_recording_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseStatistics',
+            fields=[
+                ('course', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='statistics', serialize=False, to='recorder_engine.Course')),
+                ('recording_count', models.IntegerField(default=0)),
+                ('pin_count', models.IntegerField(default=0)),
+                ('total_duration', models.BigIntegerField(default=0)),
+                ('last_activity', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RunPython(create_course_statistics, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 06:23
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_storage_usage(apps, schema_editor):
+    """
+    Compute the storage used by the existing users from the counters of their recordings
+    """
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    Recording = apps.get_model('recorder_engine', 'Recording')
+    StorageUsage = apps.get_model('recorder_engine', 'StorageUsage')
+
+    used = dict(Recording.objects.order_by().values('user_id').annotate(used=models.Sum('media_bytes'))
+                                 .values_list('user_id', 'used'))
+    StorageUsage.objects.bulk_create([StorageUsage(user_id=id, used_bytes=used.get(id) or 0)
+                                      for id in User.objects.values_list('id', flat=True)])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0008_alter_user_username_max_length'),
+        ('recorder_engine', '0008_course_statistics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StorageUsage',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='storage_usage', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('used_bytes', models.BigIntegerField(default=0)),
+                ('quota', models.BigIntegerField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RunPython(create_storage_usage, migrations.RunPython.noop),
+    ]
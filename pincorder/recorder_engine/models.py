@@ -50,6 +50,14 @@ class Course(models.Model):
     # Users that are authorized to view the course
     authorized_users = models.ManyToManyField('auth.user')
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        course = super(Course, cls).from_db(db, field_names, values)
+
+        # Remember the loaded parent, to move the statistics when it changes ( see course_statistics.py )
+        course._loaded_parent_course_id = course.__dict__.get('parent_course_id')
+        return course
+
     def __str__(self):
         return self.name
 
@@ -84,6 +92,48 @@ class Recording(models.Model):
     # The recording author User
     user = models.ForeignKey('auth.user')
 
+    # Version of the row, incremented by every change. Used by the sync to detect the conflicts
+    version = models.PositiveIntegerField(default=1)
+
+    # Time of the last change
+    updated = models.DateTimeField(auto_now=True)
+
+    # Counters kept up to date by the views that add and delete the pins and the file ( see counters.py ),
+    # so that the listings don't have to read the related rows
+    # Number of pins
+    pin_count = models.PositiveIntegerField(default=0)
+
+    # True if the recording file has been uploaded
+    has_file = models.BooleanField(default=False)
+
+    # Duration of the recording file in milliseconds, if given by the client on upload
+    duration = models.PositiveIntegerField(blank=True, null=True)
+
+    # Total size in bytes of the recording file and of the images of the pins
+    media_bytes = models.BigIntegerField(default=0)
+
+    COUNTER_FIELDS = ('pin_count', 'has_file', 'duration', 'media_bytes')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        recording = super(Recording, cls).from_db(db, field_names, values)
+
+        # Remember the loaded course, to move the statistics when it changes ( see course_statistics.py )
+        recording._loaded_course_id = recording.__dict__.get('course_id')
+        return recording
+
+    def save(self, *args, **kwargs):
+        # Every change of an existing recording makes a new version
+        if self.pk is not None:
+            self.version += 1
+
+        # The counters of an existing recording are only written with F() expressions, saving the values loaded
+        # with the object would lose the concurrent changes
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name not in self.COUNTER_FIELDS]
+        super(Recording, self).save(*args, **kwargs)
+
     def __str__(self):
         return self.name
 
@@ -91,6 +141,14 @@ class Recording(models.Model):
         # Recordings will be ordered in ascending order by the ID
         ordering = ['id']
 
+        # Recordings are always filtered by user, so every lookup is indexed together with the user
+        indexes = [
+            models.Index(fields=['user', 'id']),
+            models.Index(fields=['user', 'name']),
+            models.Index(fields=['user', 'date']),
+            models.Index(fields=['user', 'updated']),
+        ]
+
 
 class RecordingFile(models.Model):
     """
@@ -108,6 +166,9 @@ class RecordingFile(models.Model):
     # File field that represents the actual file ( a unique name is given to each file )
     file_url = models.FileField(upload_to=unique_name_generator)
 
+    # Size of the file in bytes
+    size = models.BigIntegerField(default=0)
+
     def __str__(self):
         return self.file_url.name
 
@@ -128,6 +189,21 @@ class Pin(models.Model):
     # Image of the Pin, can be null ( a unique name is given to each image )
     media_url = models.FileField(upload_to=unique_name_generator, blank=True)
 
+    # Size of the image in bytes, 0 without image
+    media_size = models.BigIntegerField(default=0)
+
+    # Version of the row, incremented by every change. Used by the sync to detect the conflicts
+    version = models.PositiveIntegerField(default=1)
+
+    # Time of the last change
+    updated = models.DateTimeField(auto_now=True, db_index=True)
+
+    def save(self, *args, **kwargs):
+        # Every change of an existing pin makes a new version
+        if self.pk is not None:
+            self.version += 1
+        super(Pin, self).save(*args, **kwargs)
+
     def __str__(self):
         return "{recording} - {time}".format(recording=str(self.recording), time=self.time)
 
@@ -139,6 +215,72 @@ class Pin(models.Model):
         ordering = ['time']
 
 
+class Tombstone(models.Model):
+    """
+    Model used to remember the deleted recordings, also the ones deleted with their course, and the pins deleted
+    through the API, so that the other devices of the user can delete them on the next sync
+    """
+    # Owner of the deleted recording
+    user = models.ForeignKey('auth.user', on_delete=models.CASCADE)
+
+    # Id of the deleted recording, or of the recording of the deleted pin
+    recording_id = models.IntegerField()
+
+    # Time of the deleted pin, null when the whole recording was deleted
+    time = models.BigIntegerField(null=True, blank=True)
+
+    # Time of the deletion
+    deleted = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        # The tombstones are read by user, from the time of the last sync
+        indexes = [
+            models.Index(fields=['user', 'deleted']),
+        ]
+
+
+class CourseStatistics(models.Model):
+    """
+    Model used to keep the statistics of a Course, including the recordings of all its sub courses.
+    Updated incrementally by the signal handlers in course_statistics.py
+    """
+    # The course of the statistics
+    course = models.OneToOneField('Course', primary_key=True, on_delete=models.CASCADE, related_name='statistics')
+
+    # Number of recordings
+    recording_count = models.IntegerField(default=0)
+
+    # Number of pins of the recordings
+    pin_count = models.IntegerField(default=0)
+
+    # Total duration of the recordings in milliseconds
+    total_duration = models.BigIntegerField(default=0)
+
+    # Time of the last change of a recording or of a pin, null if there was none
+    last_activity = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return str(self.course)
+
+
+class StorageUsage(models.Model):
+    """
+    Model used to keep the number of bytes stored by a User, the recording files and the pin images.
+    Updated together with the counters of the recordings ( see quota.py )
+    """
+    # The user of the storage
+    user = models.OneToOneField('auth.user', primary_key=True, on_delete=models.CASCADE, related_name='storage_usage')
+
+    # Number of bytes used
+    used_bytes = models.BigIntegerField(default=0)
+
+    # Maximum number of bytes the user can store, if null the STORAGE_QUOTA setting is used
+    quota = models.BigIntegerField(blank=True, null=True)
+
+    def __str__(self):
+        return str(self.user)
+
+
 # Post Delete Handlers, used to delete media files after instances are deleted
 
 @receiver(post_delete, sender=Pin)
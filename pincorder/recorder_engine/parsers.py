@@ -0,0 +1,40 @@
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+import msgpack
+from rest_framework.parsers import BaseParser, JSONParser
+
+from .renderers import FastJSONRenderer, MessagePackRenderer, orjson
+
+
+class FastJSONParser(JSONParser):
+    """
+    JSONParser that decodes with orjson, or with the standard library when orjson is missing
+    """
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+
+        # orjson only reads UTF-8
+        if orjson is None or encoding.lower().replace('-', '') != 'utf8':
+            return super(FastJSONParser, self).parse(stream, media_type, parser_context)
+
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - {error}'.format(error=exc))
+
+
+class MessagePackParser(BaseParser):
+    """
+    Parses MessagePack-serialized data
+    """
+    media_type = 'application/msgpack'
+    renderer_class = MessagePackRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), raw=False)
+        except (ValueError, TypeError) as exc:
+            raise ParseError('MessagePack parse error - {error}'.format(error=exc))
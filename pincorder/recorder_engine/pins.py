@@ -0,0 +1,174 @@
+"""
+Writes of the pins that don't load the rows first: the pins are inserted or updated with a single
+INSERT ... ON CONFLICT statement ( SQLite 3.35 or PostgreSQL 9.5 and later ), so two concurrent requests
+for the same time can't fail on the unique (recording, time) constraint.
+
+The images are written to the storage before the transaction, so that the rows are never locked while a file is
+saved. The replaced images are deleted only after the commit, and the new ones are deleted if nothing is written.
+The counters of the recording ( see counters.py ) are updated in the same transaction
+"""
+import os
+from collections import Counter
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopFutureHandlers
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .counters import update_counters
+from .models import Pin, Recording
+
+
+UPSERT_SQL = (
+    "INSERT INTO {pin} ({recording_id}, {time}, {text}, {media_url}, {media_size}, {version}, {updated}) "
+    "SELECT {recording}.{id}, v.column2, v.column3, v.column4, v.column5, 1, %s "
+    "FROM {recording} INNER JOIN (VALUES {values}) AS v ON {recording}.{id} = v.column1 "
+    "WHERE {recording}.{user_id} = %s "
+    "ON CONFLICT ({recording_id}, {time}) DO UPDATE SET "
+    "{text} = excluded.{text}, "
+    # The image is kept when the pin is updated without a new one
+    "{media_url} = CASE WHEN excluded.{media_url} = '' THEN {pin}.{media_url} ELSE excluded.{media_url} END, "
+    "{media_size} = CASE WHEN excluded.{media_url} = '' THEN {pin}.{media_size} ELSE excluded.{media_size} END, "
+    "{version} = {pin}.{version} + 1, "
+    "{updated} = excluded.{updated} "
+    # The inserted pins are the ones with the first version
+    "RETURNING {id}, {recording_id}, {time}, {text}, {media_url}, {version}"
+)
+
+
+class StoredUploadedFile(UploadedFile):
+    """
+    Uploaded file that has already been written to the storage of the pin images, with the given name
+    """
+    def __init__(self, stored_name, size, content_type=None, charset=None):
+        super(StoredUploadedFile, self).__init__(None, os.path.basename(stored_name), content_type, size, charset)
+        self.stored_name = stored_name
+
+
+class PinImageUploadHandler(FileUploadHandler):
+    """
+    Upload handler that writes the uploaded files to the storage of the pin images while the request is parsed,
+    one chunk at a time, instead of keeping them in memory or in a temporary file to copy afterwards.
+    Only usable with the storages that have local paths ( see has_local_storage )
+    """
+    def new_file(self, *args, **kwargs):
+        super(PinImageUploadHandler, self).new_file(*args, **kwargs)
+
+        field = Pin._meta.get_field('media_url')
+        self.stored_name = field.storage.get_available_name(field.generate_filename(None, self.file_name))
+        path = field.storage.path(self.stored_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # The names are unique, fail instead of overwriting an existing file
+        self.file = open(path, 'xb')
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        self.file.close()
+        if settings.FILE_UPLOAD_PERMISSIONS is not None:
+            os.chmod(self.file.name, settings.FILE_UPLOAD_PERMISSIONS)
+        return StoredUploadedFile(self.stored_name, file_size, self.content_type, self.charset)
+
+
+def has_local_storage():
+    """
+    Check if the pin images are stored in the local filesystem, so that they can be written by the
+    PinImageUploadHandler
+    """
+    storage = Pin._meta.get_field('media_url').storage
+    try:
+        storage.path('')
+    except NotImplementedError:
+        return False
+    return True
+
+
+def store_pin_image(upload):
+    """
+    Save the uploaded image of a pin to the storage, unless the PinImageUploadHandler did it already,
+    and return its name
+    """
+    if isinstance(upload, StoredUploadedFile):
+        return upload.stored_name
+
+    field = Pin._meta.get_field('media_url')
+    return field.storage.save(field.generate_filename(None, upload.name), upload)
+
+
+def delete_pin_images(names):
+    storage = Pin._meta.get_field('media_url').storage
+    for name in names:
+        storage.delete(name)
+
+
+def upsert_pins(user, pins):
+    """
+    Add or update the pins of the recordings of the user. pins is a list of dicts with the id of the 'recording',
+    the 'time', the 'text', the name of the stored image in 'media_url' ( '' to keep the current image ) and its
+    size in 'media_size'. The counters of the recordings are updated in the same transaction.
+    Return the written pins, in no particular order, without the ones of the recordings of other users
+    """
+    # A statement can't change the same row twice, the last change of each pin wins
+    pins = list({(pin['recording'], pin['time']): pin for pin in pins}.values())
+
+    quote = connection.ops.quote_name
+    names = {name: quote(name) for name in ('id', 'recording_id', 'time', 'text', 'media_url', 'media_size',
+                                            'version', 'updated', 'user_id')}
+    sql = UPSERT_SQL.format(pin=quote(Pin._meta.db_table), recording=quote(Recording._meta.db_table),
+                            values=", ".join(["(%s, %s, %s, %s, %s)"] * len(pins)), **names)
+
+    params = [Pin._meta.get_field('updated').get_db_prep_value(timezone.now(), connection)]
+    for pin in pins:
+        params.extend((pin['recording'], pin['time'], pin['text'], pin['media_url'], pin.get('media_size', 0)))
+    params.append(user.id)
+
+    new_images = [pin['media_url'] for pin in pins if pin['media_url']]
+    try:
+        with transaction.atomic():
+            # The images replaced by the new ones, deleted after the commit. The pins are locked until then, so
+            # a concurrent request that replaces the same image reads the new one
+            old_images = []
+            if new_images:
+                replaced = Q()
+                for pin in pins:
+                    if pin['media_url']:
+                        replaced |= Q(recording_id=pin['recording'], time=pin['time'])
+                old_images = list(Pin.objects.select_for_update().filter(replaced, recording__user=user)
+                                             .exclude(media_url='')
+                                             .values_list('recording_id', 'media_url', 'media_size'))
+            rows = execute(sql, params)
+
+            if rows:
+                pin_counts, media_bytes = Counter(), Counter()
+                # The inserted pins are the ones with the first version
+                for id, recording_id, time, text, media_url, version in rows:
+                    if version == 1:
+                        pin_counts[recording_id] += 1
+                for pin in pins:
+                    media_bytes[pin['recording']] += pin.get('media_size', 0)
+                for recording_id, name, size in old_images:
+                    media_bytes[recording_id] -= size
+                update_counters(user.id, pins=pin_counts, media_bytes=media_bytes)
+                if old_images:
+                    old_names = [name for recording_id, name, size in old_images]
+                    transaction.on_commit(lambda: delete_pin_images(old_names))
+    except Exception:
+        delete_pin_images(new_images)
+        raise
+
+    if not rows:
+        delete_pin_images(new_images)
+
+    return [Pin(id=id, recording_id=recording_id, time=time, text=text, media_url=media_url)
+            for id, recording_id, time, text, media_url, version in rows]
+
+
+def execute(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
@@ -0,0 +1,142 @@
+import cProfile
+import io
+import os
+import pstats
+import time
+import traceback
+import uuid
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connections
+
+
+# Number of functions listed in the profiler section of the report
+PROFILE_FUNCTIONS_LIMIT = 40
+
+
+class QueryRecorder(object):
+    """
+    Record the duration of every database query made by the current thread, attributing it to the
+    line of the project code that made it
+    """
+    def __init__(self):
+        # Call site -> [count, total seconds, first sql]
+        self.call_sites = defaultdict(lambda: [0, 0.0, None])
+        self.saved = []
+
+    def get_call_site(self):
+        """
+        Return the innermost frame of the stack that belongs to the project, excluding this module
+        """
+        for frame in reversed(traceback.extract_stack()):
+            filename = os.path.abspath(frame[0])
+            if filename.startswith(settings.BASE_DIR) and filename != os.path.abspath(__file__) \
+                    and 'site-packages' not in filename:
+                return "{file}:{line} in {function}".format(file=os.path.relpath(filename, settings.BASE_DIR),
+                                                            line=frame[1], function=frame[2])
+        return "<unknown>"
+
+    def record(self, sql, seconds):
+        site = self.call_sites[self.get_call_site()]
+        site[0] += 1
+        site[1] += seconds
+        if site[2] is None:
+            site[2] = sql
+
+    def wrap(self, make_cursor):
+        recorder = self
+
+        class RecordingCursor(object):
+            def __init__(self, cursor):
+                self.cursor = cursor
+
+            def __getattr__(self, attr):
+                return getattr(self.cursor, attr)
+
+            def __iter__(self):
+                return iter(self.cursor)
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, exc_type, exc_value, traceback):
+                self.close()
+
+            def execute(self, sql, params=None):
+                start = time.perf_counter()
+                try:
+                    return self.cursor.execute(sql, params)
+                finally:
+                    recorder.record(sql, time.perf_counter() - start)
+
+            def executemany(self, sql, param_list):
+                start = time.perf_counter()
+                try:
+                    return self.cursor.executemany(sql, param_list)
+                finally:
+                    recorder.record(sql, time.perf_counter() - start)
+
+        return lambda cursor: RecordingCursor(make_cursor(cursor))
+
+    def __enter__(self):
+        # Connections are per thread, so only the queries of the current request are recorded
+        for connection in connections.all():
+            self.saved.append((connection, connection.__dict__.get('make_cursor'),
+                               connection.__dict__.get('make_debug_cursor')))
+            connection.make_cursor = self.wrap(connection.make_cursor)
+            connection.make_debug_cursor = self.wrap(connection.make_debug_cursor)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Restore the original methods
+        for connection, make_cursor, make_debug_cursor in self.saved:
+            for name, method in (('make_cursor', make_cursor), ('make_debug_cursor', make_debug_cursor)):
+                if method is None:
+                    del connection.__dict__[name]
+                else:
+                    setattr(connection, name, method)
+
+    def report(self):
+        """
+        Return the SQL section of the report, with the call sites ordered by total time
+        """
+        total_count = sum(site[0] for site in self.call_sites.values())
+        total_time = sum(site[1] for site in self.call_sites.values())
+
+        lines = ["SQL: {count} queries in {ms:.2f}ms".format(count=total_count, ms=total_time * 1000), ""]
+        for call_site, (count, seconds, sql) in sorted(self.call_sites.items(), key=lambda item: -item[1][1]):
+            lines.append("{ms:10.2f}ms {count:5d}x  {site}".format(ms=seconds * 1000, count=count, site=call_site))
+            lines.append("                   {sql}".format(sql=sql))
+        return "\n".join(lines)
+
+
+def profile_request(get_response, request):
+    """
+    Handle the request with the profiler enabled, returning the response and the text report
+    """
+    profiler = cProfile.Profile()
+    with QueryRecorder() as queries:
+        start = time.perf_counter()
+        response = profiler.runcall(get_response, request)
+        duration = time.perf_counter() - start
+
+    stream = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stream)
+    stats.sort_stats('cumulative').print_stats(PROFILE_FUNCTIONS_LIMIT)
+
+    report = "{method} {path} -> {status} in {ms:.2f}ms\n\n{sql}\n\n{profile}".format(
+        method=request.method, path=request.get_full_path(), status=response.status_code, ms=duration * 1000,
+        sql=queries.report(), profile=stream.getvalue())
+    return response, report
+
+
+def store_report(report):
+    """
+    Save the report in the PROFILE_ROOT directory and return the file name
+    """
+    os.makedirs(settings.PROFILE_ROOT, exist_ok=True)
+    name = "{time}-{id}.txt".format(time=time.strftime('%Y%m%d-%H%M%S'), id=uuid.uuid4().hex[:8])
+    with open(os.path.join(settings.PROFILE_ROOT, name), 'w') as f:
+        f.write(report)
+    return name
@@ -0,0 +1,128 @@
+"""
+Accounting of the storage used by each user ( see models.StorageUsage ).
+
+The bytes used by a user are the media_bytes of all their recordings, so the counter is updated together with the
+counters of the recordings ( see counters.py ) and when a recording is deleted, without ever reading the storage.
+The quota is checked with the Content-Length of the uploads, before their body is read, so the uploads without it
+are refused. Two concurrent uploads can both pass the check, the usage is still counted right and the next uploads
+are refused.
+The reconcile_counters command corrects the drift
+"""
+import threading
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import models
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .course_statistics import is_deleted_with_course
+from .models import Course, Recording, StorageUsage
+
+
+# Ids of the users being deleted by the current thread, their storage usage and their tombstones go with them
+_deleting_users = threading.local()
+
+
+class QuotaExceeded(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = "ERROR: The storage quota is exceeded"
+
+
+class LengthRequired(APIException):
+    status_code = status.HTTP_411_LENGTH_REQUIRED
+    default_detail = "ERROR: The uploads must have a Content-Length"
+
+
+def add_used_bytes(user_id, difference):
+    """
+    Add the difference to the bytes used by the user
+    """
+    if difference:
+        StorageUsage.objects.filter(user_id=user_id).update(used_bytes=F('used_bytes') + difference)
+
+
+def get_deleting_users():
+    """
+    Return the set of the ids of the users being deleted by the current thread
+    """
+    if not hasattr(_deleting_users, 'ids'):
+        _deleting_users.ids = set()
+    return _deleting_users.ids
+
+
+def check_storage_quota(request):
+    """
+    Raise QuotaExceeded if the body of the request doesn't fit in the storage left to the user, LengthRequired if
+    its size is unknown ( e.g. a chunked request ), as it couldn't be checked.
+    Only the multipart requests carry files, the others are not checked. Must be called before request.data
+    """
+    if not request.content_type.startswith('multipart/'):
+        return
+
+    try:
+        length = int(request.META.get('CONTENT_LENGTH') or '')
+    except ValueError:
+        length = -1
+    if length < 0:
+        raise LengthRequired()
+
+    try:
+        used, quota = StorageUsage.objects.values_list('used_bytes', 'quota').get(user=request.user)
+    except StorageUsage.DoesNotExist:
+        used, quota = 0, None
+    if quota is None:
+        quota = settings.STORAGE_QUOTA
+
+    if quota is not None and used + length > quota:
+        raise QuotaExceeded("ERROR: The upload of {length} bytes exceeds the storage quota, {used} of {quota} bytes "
+                            "are used".format(length=length, used=used, quota=quota))
+
+
+# Signal Handlers, the raw saves of the fixtures are skipped
+
+@receiver(post_save, sender=User)
+def user_post_save_handler(sender, instance, created, raw=False, **kwargs):
+    """
+    Create the storage usage of a new user
+    """
+    if created and not raw:
+        StorageUsage.objects.create(user=instance)
+
+
+@receiver(pre_delete, sender=User)
+def user_pre_delete_handler(sender, instance, **kwargs):
+    get_deleting_users().add(instance.id)
+
+
+@receiver(post_delete, sender=User)
+def user_post_delete_handler(sender, instance, **kwargs):
+    get_deleting_users().discard(instance.id)
+
+
+@receiver(pre_delete, sender=Course)
+def course_quota_pre_delete_handler(sender, instance, **kwargs):
+    """
+    Remove the recordings deleted with the course from the storage used by their authors, with a single UPDATE
+    whatever the number of recordings
+    """
+    recordings = Recording.objects.filter(course=instance, media_bytes__gt=0) \
+                                  .exclude(user_id__in=get_deleting_users())
+    deleted_bytes = Subquery(recordings.filter(user_id=OuterRef('user_id')).order_by().values('user_id')
+                                       .annotate(total=Sum('media_bytes')).values('total'),
+                             output_field=models.BigIntegerField())
+    StorageUsage.objects.filter(user_id__in=recordings.values('user_id')) \
+                        .update(used_bytes=F('used_bytes') - deleted_bytes)
+
+
+@receiver(post_delete, sender=Recording)
+def recording_quota_post_delete_handler(sender, instance, **kwargs):
+    """
+    Remove the files of the deleted recording and the images of its pins from the storage used by its author.
+    The recordings deleted with their course or with their author are already taken care of
+    """
+    if not is_deleted_with_course(instance) and instance.user_id not in get_deleting_users():
+        add_used_bytes(instance.user_id, -instance.media_bytes)
@@ -0,0 +1,68 @@
+import msgpack
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    # Without orjson the standard library encoder is used
+    orjson = None
+
+
+# UTF-8 encoding of the line and paragraph separators, not valid inside javascript strings
+LINE_SEPARATOR = '\u2028'.encode('utf-8')
+PARAGRAPH_SEPARATOR = '\u2029'.encode('utf-8')
+SEPARATORS_PREFIX = LINE_SEPARATOR[:2]
+
+
+def stream_json_object(entries, renderer):
+    """
+    Yield the JSON object made of the (key, value) couples one entry at a time, so that it's never entirely in memory
+    """
+    separator = b'{'
+    for key, value in entries:
+        yield separator + renderer.render(key) + b':' + renderer.render(value)
+        separator = b','
+    yield b'{}' if separator == b'{' else b'}'
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that encodes with orjson. Datetimes, dates and UUIDs are encoded natively, with the same
+    representation of the JSONRenderer, the other types ( Decimals, lazy strings, ... ) are converted
+    by the DRF encoder. The only difference is that the microseconds of datetime.time objects are kept.
+    The JSONRenderer is used when orjson is missing, for the indented output and for the data that orjson can't
+    encode ( e.g. integers bigger than 64 bit )
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or not self.compact or self.ensure_ascii or \
+                self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super(FastJSONRenderer, self).render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=JSONEncoder().default, option=orjson.OPT_UTC_Z)
+        except orjson.JSONEncodeError:
+            return super(FastJSONRenderer, self).render(data, accepted_media_type, renderer_context)
+
+        # Escape the line and paragraph separators like the JSONRenderer, so that the output is valid javascript.
+        # Both start with the same two bytes, searched first as the replacements copy the whole output
+        if SEPARATORS_PREFIX in ret:
+            ret = ret.replace(LINE_SEPARATOR, b'\\u2028').replace(PARAGRAPH_SEPARATOR, b'\\u2029')
+        return ret
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    Renderer which serializes to MessagePack, a binary format smaller than JSON.
+    Values that aren't natively supported are converted like in the JSONRenderer, so datetimes are ISO 8601 strings
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return bytes()
+        return msgpack.packb(data, default=JSONEncoder().default, use_bin_type=True)
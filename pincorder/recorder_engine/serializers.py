@@ -32,6 +32,20 @@ class CourseSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'teacher', 'parent_course')
 
 
+class CourseStatisticsSerializer(serializers.ModelSerializer):
+    """
+    Serializer used to display the statistics of a course
+    """
+    total_hours = serializers.SerializerMethodField()
+
+    def get_total_hours(self, statistics):
+        return round(statistics.total_duration / 3600000, 2)
+
+    class Meta:
+        model = CourseStatistics
+        fields = ('course', 'recording_count', 'pin_count', 'total_duration', 'total_hours', 'last_activity')
+
+
 class PinSerializer(serializers.ModelSerializer):
     """
     Serializer used to manage pins
@@ -50,12 +64,49 @@ class PinSerializer(serializers.ModelSerializer):
         read_only_fields = ('media_url',)
 
 
+class PinUpsertSerializer(serializers.Serializer):
+    """
+    Serializer used to validate a pin added or updated by the add_pin route.
+    The recording is given by the url, the image is optional
+    """
+    time = serializers.IntegerField()
+    text = serializers.CharField(max_length=500, allow_blank=True, required=False, default="")
+    media_url = serializers.FileField(required=False)
+
+
 class RecordingSerializer(serializers.ModelSerializer):
     """
-    Serializer used to manage recordings
+    Serializer used to manage recordings.
+    The optional 'fields' argument restricts the serialized fields, the optional 'expand' argument
+    embeds the related objects listed in EXPANDABLE_FIELDS
     """
     user = serializers.StringRelatedField()
 
+    # Related objects that can be embedded in the representation
+    EXPANDABLE_FIELDS = ('pins', 'file', 'course')
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        expand = kwargs.pop('expand', None) or ()
+        super(RecordingSerializer, self).__init__(*args, **kwargs)
+
+        for name in expand:
+            self.fields[name] = self.get_expanded_field(name)
+
+        # The expanded fields are always included
+        if fields is not None:
+            for name in set(self.fields) - set(fields) - set(expand):
+                self.fields.pop(name)
+
+    def get_expanded_field(self, name):
+        if name == 'pins':
+            return PinSerializer(many=True, read_only=True, source='pin_set')
+        if name == 'file':
+            return RecordingFileSerializer(read_only=True, source='recordingfile')
+        if name == 'course':
+            return CourseSerializer(read_only=True)
+        raise ValueError("'{name}' can't be expanded".format(name=name))
+
     def get_recording(self):
         """
         Return a Recording object with the validated data, without saving it
@@ -64,8 +115,107 @@ class RecordingSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Recording
-        fields = ('id', 'name', 'date', 'course', 'status', 'is_online', 'is_converted', 'user')
-        read_only_fields = ('id', 'status', 'is_online', 'is_converted', 'user')
+        fields = ('id', 'name', 'date', 'course', 'status', 'is_online', 'is_converted', 'user',
+                  'pin_count', 'has_file', 'duration', 'media_bytes')
+        read_only_fields = ('id', 'status', 'is_online', 'is_converted', 'user',
+                            'pin_count', 'has_file', 'duration', 'media_bytes')
+
+
+class RecordingBulkSerializer(serializers.Serializer):
+    """
+    Serializer used to validate the recordings created in bulk.
+    The course is validated by the view, with a single query for all the recordings
+    """
+    name = serializers.CharField(max_length=200)
+    date = serializers.DateTimeField()
+    course = serializers.IntegerField(required=False, allow_null=True)
+
+
+class RecordingBatchSerializer(serializers.ModelSerializer):
+    """
+    Serializer used to display the file of each recording in the batch fetch
+    """
+    file = RecordingFileSerializer(read_only=True, source='recordingfile')
+
+    class Meta:
+        model = Recording
+        fields = ('id', 'file')
+
+"""
+The Sync* classes are used in the SyncAPI, where the changes made offline by the clients are applied
+"""
+
+
+class SyncNewRecordingSerializer(RecordingBulkSerializer):
+    """
+    Serializer used to validate a recording created offline, identified by a temporary id chosen by the client
+    """
+    temp_id = serializers.CharField(max_length=100)
+
+
+class SyncChangeSerializer(serializers.Serializer):
+    """
+    Base serializer of the changes made to an existing row.
+    'recording' is the id of a recording or the temp_id of a recording created by the same changeset.
+    'version' is the version of the row seen by the client and 'modified' the time of the change on the client,
+    they are used to resolve the conflicts
+    """
+    recording = serializers.CharField(max_length=100)
+    version = serializers.IntegerField(required=False, allow_null=True)
+    modified = serializers.DateTimeField(required=False, allow_null=True)
+
+
+class SyncRenameSerializer(SyncChangeSerializer):
+    """
+    Serializer used to validate the rename of a recording
+    """
+    name = serializers.CharField(max_length=200)
+
+
+class SyncPinSerializer(SyncChangeSerializer):
+    """
+    Serializer used to validate a pin added or updated offline
+    """
+    time = serializers.IntegerField()
+    text = serializers.CharField(max_length=500, allow_blank=True, required=False, default="")
+
+
+class SyncDeletedPinSerializer(SyncChangeSerializer):
+    """
+    Serializer used to validate a pin deleted offline
+    """
+    time = serializers.IntegerField()
+
+
+class SyncChangesetSerializer(serializers.Serializer):
+    """
+    Serializer used to validate the changeset of the SyncAPI.
+    'since' is the 'synced_at' time returned by the previous sync, missing on the first one
+    """
+    since = serializers.DateTimeField(required=False, allow_null=True)
+    recordings = SyncNewRecordingSerializer(many=True, required=False)
+    renames = SyncRenameSerializer(many=True, required=False)
+    pins = SyncPinSerializer(many=True, required=False)
+    deleted_pins = SyncDeletedPinSerializer(many=True, required=False)
+
+
+class SyncRecordingOutputSerializer(serializers.ModelSerializer):
+    """
+    Serializer used to display the recordings changed on the server
+    """
+    class Meta:
+        model = Recording
+        fields = ('id', 'name', 'date', 'course', 'status', 'is_online', 'is_converted', 'version', 'updated')
+
+
+class SyncPinOutputSerializer(serializers.ModelSerializer):
+    """
+    Serializer used to display the pins changed on the server
+    """
+    class Meta:
+        model = Pin
+        fields = ('recording', 'time', 'text', 'media_url', 'version', 'updated')
+
 
 """
 The UserDump* classes are used in the UserDumpAPI, where all the information
@@ -151,3 +301,41 @@ class UserDumpSerializer(serializers.Serializer):
     # The UserDump is read only, so no update is allowed
     def update(self, instance, validated_data):
         pass
+
+
+"""
+The Export* classes are used in the UserExport, where the names of the files are their paths in the archive
+"""
+
+
+class ExportFileSerializer(serializers.ModelSerializer):
+    """
+    Serializer used to display the file of a recording in the export
+    """
+    file_url = serializers.FileField(use_url=False)
+
+    class Meta:
+        model = RecordingFile
+        fields = ('file_url', 'size', 'upload_date')
+
+
+class ExportPinSerializer(serializers.ModelSerializer):
+    """
+    Serializer used to display Pin data in the export
+    """
+    media_url = serializers.FileField(use_url=False)
+
+    class Meta:
+        model = Pin
+        fields = ('time', 'text', 'media_url', 'updated')
+
+
+class ExportRecordingSerializer(serializers.ModelSerializer):
+    """
+    Serializer used to display Recording data in the export, the pins are added by the export
+    """
+    file = ExportFileSerializer(read_only=True, source='recordingfile')
+
+    class Meta:
+        model = Recording
+        fields = ('id', 'name', 'date', 'course', 'status', 'duration', 'file')
@@ -0,0 +1,14 @@
+from django.dispatch import Signal
+
+
+# Sent once after a bulk change of the users authorized to view a course.
+# 'added' and 'removed' are lists containing the ids of the affected users
+course_users_changed = Signal(providing_args=['course_id', 'added', 'removed'])
+
+# Sent after the counters of some recordings are changed with a queryset update, that doesn't send post_save.
+# 'pins' and 'duration' are dicts of recording id -> difference
+recording_counters_changed = Signal(providing_args=['pins', 'duration'])
+
+# Sent after recordings are created with a bulk insert, that doesn't send post_save.
+# 'recordings' is the list of the created recordings
+recordings_created = Signal(providing_args=['recordings'])
@@ -0,0 +1,250 @@
+"""
+Application of the changesets sent by the SyncAPI ( see views.SyncView ).
+
+A changeset contains the changes made offline by a client: new recordings, renames, pins added, updated or deleted.
+It's applied in a single transaction, with a constant number of queries whatever its size.
+
+Conflicts are resolved with last-writer-wins: a change is applied if the client has seen the current version of the
+row, or if it was made on the client after the last change of the row on the server. The rows that win over the
+changes of the client are reported as conflicts and returned among the changes
+"""
+import datetime
+from collections import Counter
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import F, Q
+from django.db.models.signals import post_delete, pre_delete
+from django.dispatch import receiver
+from django.http import Http404
+from django.utils import timezone
+from rest_framework.exceptions import APIException
+
+from .bulk import bulk_create_recordings, case_by_id
+from .counters import update_counters
+from .course_statistics import is_deleted_with_course
+from .fast_serializers import ValuesSerializer
+from .models import Course, Pin, Recording, Tombstone
+from .pins import upsert_pins
+from .quota import get_deleting_users
+from .serializers import SyncPinOutputSerializer, SyncRecordingOutputSerializer
+
+
+def client_wins(change, version, updated):
+    """
+    Check if the change of the client wins over the current row of the server
+    """
+    if change.get('version') is None or change['version'] >= version:
+        return True
+    return change.get('modified') is not None and change['modified'] >= updated
+
+
+class Changeset(object):
+    """
+    Apply a validated changeset ( see serializers.SyncChangesetSerializer ) for the user of the request
+    """
+    def __init__(self, request, data):
+        self.request = request
+        self.user = request.user
+        self.data = data
+
+        # Temporary ids of the new recordings -> ids
+        self.ids = {}
+
+        # Changes that lost against the server, and ids of the rows to return for them
+        self.conflicts = []
+        self.conflicted_recordings = set()
+        self.conflicted_pins = set()
+
+    def apply(self):
+        """
+        Apply the changes and return the response of the sync
+        """
+        with transaction.atomic():
+            self.create_recordings(self.data.get('recordings', []))
+            recordings = self.get_recordings()
+            self.rename_recordings(self.data.get('renames', []), recordings)
+            self.change_pins(self.data.get('pins', []), self.data.get('deleted_pins', []))
+
+            # A change of another transaction committed after this time can be older, get_changes returns again
+            # the changes of the last SYNC_OVERLAP seconds before since to find it
+            synced_at = timezone.now()
+            changes = self.get_changes(self.data.get('since'))
+
+        return {
+            'ids': self.ids,
+            'conflicts': self.conflicts,
+            'changes': changes,
+            'synced_at': synced_at,
+        }
+
+    def create_recordings(self, new_recordings):
+        """
+        Create the recordings made offline, checking the courses with a single query
+        """
+        if not new_recordings:
+            return
+
+        recordings = bulk_create_recordings(self.user, new_recordings)
+        for item, recording in zip(new_recordings, recordings):
+            self.ids[item['temp_id']] = recording.id
+
+    def resolve(self, reference):
+        """
+        Return the id of the recording referenced by its id or by the temporary id of a new recording
+        """
+        if reference in self.ids:
+            return self.ids[reference]
+        try:
+            return int(reference)
+        except ValueError:
+            raise APIException("ERROR: Unknown recording " + reference)
+
+    def get_recordings(self):
+        """
+        Return the version and the update time of the recordings referenced by the changes, by id.
+        Raise Http404 if any of them doesn't belong to the user
+        """
+        references = set()
+        for name in ('renames', 'pins', 'deleted_pins'):
+            references.update(self.resolve(item['recording']) for item in self.data.get(name, []))
+        if not references:
+            return {}
+
+        recordings = {id: (version, updated) for id, version, updated in
+                      Recording.objects.filter(user=self.user, id__in=references)
+                                       .values_list('id', 'version', 'updated')}
+        if len(recordings) != len(references):
+            raise Http404("ERROR: You can't access this recording or it doesn't exists")
+        return recordings
+
+    def rename_recordings(self, renames, recordings):
+        names = {}
+        for item in renames:
+            id = self.resolve(item['recording'])
+            if client_wins(item, *recordings[id]):
+                names[id] = item['name']
+            else:
+                self.add_conflict('recording', id)
+
+        if names:
+            Recording.objects.filter(id__in=names).update(name=case_by_id(models.CharField(), names),
+                                                          version=F('version') + 1, updated=timezone.now())
+
+    def change_pins(self, pins, deleted_pins):
+        """
+        Add, update and delete the pins, reading the existing ones with a single query
+        """
+        # The last change of each pin wins
+        changes = {}
+        for item in pins:
+            changes[(self.resolve(item['recording']), item['time'])] = item
+        for item in deleted_pins:
+            changes[(self.resolve(item['recording']), item['time'])] = dict(item, deleted=True)
+        if not changes:
+            return
+
+        recording_ids = set(recording_id for recording_id, time in changes)
+        times = set(time for recording_id, time in changes)
+        existing = {(recording_id, time): (id, version, updated, media_size)
+                    for id, recording_id, time, version, updated, media_size in
+                    Pin.objects.filter(recording_id__in=recording_ids, time__in=times)
+                               .values_list('id', 'recording_id', 'time', 'version', 'updated', 'media_size')}
+
+        written, deleted = [], []
+        for key, item in changes.items():
+            if key not in existing:
+                # Deleting a missing pin does nothing
+                if not item.get('deleted'):
+                    written.append(key)
+                continue
+
+            id, version, updated, media_size = existing[key]
+            if not client_wins(item, version, updated):
+                self.add_conflict('pin', key[0], time=key[1], id=id)
+            elif item.get('deleted'):
+                deleted.append(key)
+            else:
+                written.append(key)
+
+        # The new and the changed pins are written with a single INSERT ... ON CONFLICT, so a pin added meanwhile
+        # by another request is updated instead of failing on the unique (recording, time) constraint.
+        # The counters of their recordings are updated too
+        if written:
+            upsert_pins(self.user, [{'recording': recording_id, 'time': time, 'media_url': '',
+                                     'text': changes[recording_id, time]['text']} for recording_id, time in written])
+        if deleted:
+            Pin.objects.filter(id__in=[existing[key][0] for key in deleted]).delete()
+            Tombstone.objects.bulk_create([Tombstone(user=self.user, recording_id=recording_id, time=time)
+                                           for recording_id, time in deleted])
+
+            # Update the counters of all the recordings with a single query
+            pin_counts, media_bytes = Counter(), Counter()
+            for key in deleted:
+                pin_counts[key[0]] -= 1
+                media_bytes[key[0]] -= existing[key][3]
+            update_counters(self.user.id, pins=pin_counts, media_bytes=media_bytes)
+
+    def add_conflict(self, type, recording_id, time=None, id=None):
+        conflict = {'type': type, 'recording': recording_id}
+        if type == 'pin':
+            conflict['time'] = time
+            self.conflicted_pins.add(id)
+        else:
+            self.conflicted_recordings.add(recording_id)
+        self.conflicts.append(conflict)
+
+    def get_changes(self, since):
+        """
+        Return the rows changed or deleted on the server after since, and the rows of the conflicts.
+        Without since, all the recordings and the pins of the user are returned.
+        since is moved back by SYNC_OVERLAP seconds, so the rows written by the transactions that were still running
+        at the previous sync are returned too, even if their update time is older than since. The client skips the
+        rows whose version it has already
+        """
+        recordings = Recording.objects.filter(user=self.user)
+        pins = Pin.objects.filter(recording__user=self.user)
+        tombstones = Tombstone.objects.none()
+        if since is not None:
+            since -= datetime.timedelta(seconds=settings.SYNC_OVERLAP)
+            recordings = recordings.filter(Q(updated__gt=since) | Q(id__in=self.conflicted_recordings))
+            pins = pins.filter(Q(updated__gt=since) | Q(id__in=self.conflicted_pins))
+            tombstones = Tombstone.objects.filter(user=self.user, deleted__gt=since)
+
+        deleted_recordings, deleted_pins = [], []
+        for recording_id, time in tombstones.values_list('recording_id', 'time'):
+            if time is None:
+                deleted_recordings.append(recording_id)
+            else:
+                deleted_pins.append({'recording': recording_id, 'time': time})
+
+        context = {'request': self.request}
+        return {
+            'recordings': ValuesSerializer(SyncRecordingOutputSerializer(context=context)).serialize(recordings),
+            'pins': ValuesSerializer(SyncPinOutputSerializer(context=context))
+                    .serialize(pins.order_by('recording_id', 'time')),
+            'deleted_recordings': deleted_recordings,
+            'deleted_pins': deleted_pins,
+        }
+
+
+# Signal Handlers, they remember the deleted recordings, also the ones deleted with their course
+
+@receiver(pre_delete, sender=Course)
+def course_tombstone_pre_delete_handler(sender, instance, **kwargs):
+    """
+    Remember the recordings deleted with the course, with a single INSERT whatever their number
+    """
+    recordings = Recording.objects.filter(course=instance).exclude(user_id__in=get_deleting_users())
+    Tombstone.objects.bulk_create([Tombstone(user_id=user_id, recording_id=id)
+                                   for user_id, id in recordings.values_list('user_id', 'id')])
+
+
+@receiver(post_delete, sender=Recording)
+def recording_tombstone_post_delete_handler(sender, instance, **kwargs):
+    """
+    Remember the deleted recording for the sync of the other devices of its author.
+    The recordings deleted with their course or with their author are already taken care of
+    """
+    if not is_deleted_with_course(instance) and instance.user_id not in get_deleting_users():
+        Tombstone.objects.create(user_id=instance.user_id, recording_id=instance.id)
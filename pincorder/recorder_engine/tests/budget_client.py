@@ -0,0 +1,57 @@
+import os
+import time
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, Resolver404
+from rest_framework.test import APIClient
+
+from ..budgets import ROUTE_BUDGETS
+
+
+# The wall time depends on the machine running the tests, so the milliseconds are only checked when asked for with
+# CHECK_TIME_BUDGETS=1 in the environment. The run_benchmark command reports them for every route
+CHECK_TIME_BUDGETS = os.environ.get('CHECK_TIME_BUDGETS') == '1'
+
+
+class BudgetAPIClient(APIClient):
+    """
+    APIClient that records the number of SQL queries and the wall time of every call,
+    and fails when a route exceeds the queries budget declared in recorder_engine/budgets.py ( and the milliseconds
+    one, with CHECK_TIME_BUDGETS )
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(BudgetAPIClient, self).__init__(*args, **kwargs)
+
+        # List of the (route, method, queries, milliseconds) measured for each call
+        self.records = []
+
+    def request(self, **kwargs):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = super(BudgetAPIClient, self).request(**kwargs)
+            # The streaming responses read the data while they are sent, the whole body is part of the call
+            if response.streaming:
+                response.streaming_content = list(response.streaming_content)
+            milliseconds = (time.perf_counter() - start) * 1000
+
+        # Paths that can't be resolved have no budget
+        try:
+            route = resolve(response.wsgi_request.path_info).url_name
+        except Resolver404:
+            route = None
+        method = response.request['REQUEST_METHOD']
+        self.records.append((route, method, len(queries), milliseconds))
+
+        budget = ROUTE_BUDGETS.get((route, method))
+        if budget is not None:
+            if len(queries) > budget.queries:
+                raise AssertionError("{method} {route} made {count} queries, the budget is {budget}:\n{sql}".format(
+                    method=method, route=route, count=len(queries), budget=budget.queries,
+                    sql="\n".join(query['sql'] for query in queries.captured_queries)))
+            if CHECK_TIME_BUDGETS and milliseconds > budget.milliseconds:
+                raise AssertionError("{method} {route} took {ms:.0f}ms, the budget is {budget}ms".format(
+                    method=method, route=route, ms=milliseconds, budget=budget.milliseconds))
+
+        return response
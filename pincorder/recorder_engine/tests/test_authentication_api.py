@@ -0,0 +1,173 @@
+import datetime
+
+from django.conf import settings
+from django.contrib.auth.models import update_last_login
+from django.utils import timezone
+from oauth2_provider.models import AccessToken, Application
+from rest_framework.test import APITestCase, APIClient
+from django.contrib.auth.models import User
+from ..models import *
+from ..authentication import token_cache
+from ..cache import TTLCache
+
+
+class TokenAuthenticationTest(APITestCase):
+    def setUp(self):
+        token_cache.clear()
+
+        self.currentUser = User.objects.create(username="testuser")
+        application = Application.objects.create(name="App", user=self.currentUser,
+                                                 client_type=Application.CLIENT_CONFIDENTIAL,
+                                                 authorization_grant_type=Application.GRANT_PASSWORD)
+        self.token = AccessToken.objects.create(user=self.currentUser, application=application, token="token1",
+                                                expires=timezone.now() + datetime.timedelta(days=1),
+                                                scope="read write")
+
+        Recording.objects.create(name="First Registration", date=timezone.now(), user=self.currentUser)
+
+    def tearDown(self):
+        token_cache.clear()
+
+    def get_token_client(self, token="token1"):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Bearer ' + token)
+        return client
+
+    def test_token_authentication(self):
+        client = self.get_token_client()
+        response = client.get('/api/recordings/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, text="First Registration")
+
+    def test_cached_token_makes_no_authentication_query(self):
+        client = self.get_token_client()
+        client.get('/api/recordings/')
+
+        # Only the recordings query is made
+        with self.assertNumQueries(1):
+            response = client.get('/api/recordings/')
+
+        self.assertEqual(response.status_code, 200)
+
+    def test_wrong_token_should_fail(self):
+        client = self.get_token_client("wrong")
+        response = client.get('/api/recordings/')
+
+        self.assertEqual(response.status_code, 401)
+
+    def test_revoked_token_should_fail(self):
+        client = self.get_token_client()
+        client.get('/api/recordings/')
+
+        self.token.revoke()
+
+        response = client.get('/api/recordings/')
+        self.assertEqual(response.status_code, 401)
+
+    def test_expired_token_should_fail(self):
+        client = self.get_token_client()
+        client.get('/api/recordings/')
+
+        self.token.expires = timezone.now() - datetime.timedelta(seconds=1)
+        self.token.save()
+
+        response = client.get('/api/recordings/')
+        self.assertEqual(response.status_code, 401)
+
+    def test_deleted_user_token_should_fail(self):
+        client = self.get_token_client()
+        client.get('/api/recordings/')
+
+        self.currentUser.delete()
+
+        response = client.get('/api/recordings/')
+        self.assertEqual(response.status_code, 401)
+
+
+    def test_changed_user_tokens_are_removed_from_the_cache(self):
+        client = self.get_token_client()
+        client.get('/api/recordings/')
+
+        # The update of the last login keeps the tokens, the other changes remove them
+        update_last_login(None, self.currentUser)
+        self.assertEqual(len(token_cache), 1)
+        self.currentUser.first_name = "Test"
+        self.currentUser.save()
+        self.assertEqual(len(token_cache), 0)
+
+
+class StatelessAPITest(TokenAuthenticationTest):
+    def test_token_request_should_skip_the_session(self):
+        client = self.get_token_client()
+        response = client.get('/api/recordings/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(hasattr(response.wsgi_request, 'session'))
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+
+    def test_token_request_should_skip_the_csrf_check(self):
+        client = APIClient(enforce_csrf_checks=True)
+        client.credentials(HTTP_AUTHORIZATION='Bearer token1')
+        response = client.post('/api/recordings/', {'name': "Second Registration", 'date': timezone.now()})
+
+        self.assertEqual(response.status_code, 201)
+
+    def test_token_request_should_use_only_the_token_authentication(self):
+        client = self.get_token_client("wrong")
+        client.force_login(self.currentUser)
+
+        # The session of the user is ignored when a bearer token is sent
+        response = client.get('/api/recordings/')
+        self.assertEqual(response.status_code, 401)
+
+    def test_session_request_should_use_the_full_chain(self):
+        client = APIClient()
+        client.force_login(self.currentUser)
+        response = client.get('/api/recordings/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(hasattr(response.wsgi_request, 'session'))
+
+    def test_token_request_outside_the_api_should_use_the_full_chain(self):
+        client = self.get_token_client()
+        response = client.get('/admin/login/')
+
+        self.assertTrue(hasattr(response.wsgi_request, 'session'))
+
+
+class TTLCacheTest(APITestCase):
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+
+    def test_tagged_entries_are_deleted_together(self):
+        cache = TTLCache(maxsize=3, ttl=60)
+        cache.set('a', 1, tag='x')
+        cache.set('b', 2, tag='x')
+        cache.set('c', 3, tag='y')
+        cache.delete_tag('x')
+
+        self.assertIsNone(cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+
+        # The evicted entries leave their tag
+        cache.set('d', 4)
+        cache.set('e', 5)
+        cache.set('f', 6)
+        self.assertEqual(cache.tags, {})
+
+    def test_expired_entries_are_not_returned(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set('a', 1, expires=0)
+
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(len(cache), 0)
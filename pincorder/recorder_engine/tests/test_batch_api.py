@@ -0,0 +1,113 @@
+import datetime
+
+from rest_framework.test import APITestCase, APIClient
+from django.utils import timezone
+from django.contrib.auth.models import User
+from oauth2_provider.models import AccessToken, Application
+from ..models import *
+from .budget_client import BudgetAPIClient
+
+
+class BatchTest(APITestCase):
+    def setUp(self):
+        self.currentUser = User.objects.create(username="testuser")
+        self.currentUser2 = User.objects.create(username="testuser2")
+
+        # Add recordings for testuser and testuser2
+        self.r1 = Recording.objects.create(name="First Registration", date=timezone.now(), user=self.currentUser)
+        self.r2 = Recording.objects.create(name="Other Registration", date=timezone.now(), user=self.currentUser2)
+
+        Pin.objects.create(recording=self.r1, time=10, text="Explanation 1")
+
+        self.client = BudgetAPIClient()
+        self.client.force_authenticate(user=self.currentUser)
+
+    def test_batch_calls_in_order(self):
+        response = self.client.post('/api/batch/', {'requests': [
+            {'method': 'post', 'path': '/api/recordings/{id}/add_pin/'.format(id=self.r1.id),
+             'body': {'time': 20, 'text': 'Explanation 2'}},
+            {'method': 'GET', 'path': '/api/recordings/{id}/get_pins/'.format(id=self.r1.id)},
+            {'method': 'GET', 'path': '/api/recordings/search_by_name/?name=First'},
+        ]})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['committed'])
+
+        responses = response.data['responses']
+        self.assertEqual([item['status'] for item in responses], [200, 200, 200])
+        self.assertEqual(responses[0]['body']['text'], 'Explanation 2')
+        self.assertEqual([pin['time'] for pin in responses[1]['body']], [10, 20])
+        self.assertEqual(responses[2]['body'][0]['id'], self.r1.id)
+
+    def test_batch_reports_the_errors_of_each_call(self):
+        response = self.client.post('/api/batch/', {'requests': [
+            {'method': 'GET', 'path': '/api/recordings/{id}/'.format(id=self.r2.id)},
+            {'method': 'GET', 'path': '/api/not_a_route/'},
+            {'method': 'POST', 'path': '/api/recordings/{id}/add_pin/'.format(id=self.r1.id),
+             'body': {'time': 30}},
+        ]})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['committed'])
+        self.assertEqual([item['status'] for item in response.data['responses']], [404, 404, 200])
+        self.assertTrue(Pin.objects.filter(recording=self.r1, time=30).exists())
+
+    def test_batch_atomic_rolls_back(self):
+        response = self.client.post('/api/batch/', {'atomic': True, 'requests': [
+            {'method': 'POST', 'path': '/api/recordings/{id}/add_pin/'.format(id=self.r1.id),
+             'body': {'time': 40, 'text': 'Rolled back'}},
+            {'method': 'DELETE', 'path': '/api/recordings/{id}/delete_pin/'.format(id=self.r1.id),
+             'body': {'time': 1234}},
+            {'method': 'DELETE', 'path': '/api/recordings/{id}/'.format(id=self.r1.id)},
+        ]})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.data['committed'])
+
+        # The batch stops at the failed call and the previous calls are rolled back
+        self.assertEqual([item['status'] for item in response.data['responses']], [200, 404])
+        self.assertFalse(Pin.objects.filter(recording=self.r1, time=40).exists())
+        self.assertTrue(Recording.objects.filter(id=self.r1.id).exists())
+
+    def test_batch_atomic_commits(self):
+        response = self.client.post('/api/batch/', {'atomic': True, 'requests': [
+            {'method': 'POST', 'path': '/api/recordings/{id}/add_pin/'.format(id=self.r1.id),
+             'body': {'time': 40, 'text': 'Committed'}},
+            {'method': 'PATCH', 'path': '/api/recordings/{id}/'.format(id=self.r1.id), 'body': {'name': 'New'}},
+        ]})
+        self.assertTrue(response.data['committed'])
+        self.assertEqual([item['status'] for item in response.data['responses']], [200, 200])
+        self.assertTrue(Pin.objects.filter(recording=self.r1, time=40).exists())
+        self.assertEqual(Recording.objects.get(id=self.r1.id).name, 'New')
+
+    def test_batch_invalid_requests(self):
+        invalid = [
+            {},
+            {'requests': []},
+            {'requests': [{'method': 'GET'}]},
+            {'requests': [{'method': 'TRACE', 'path': '/api/recordings/'}]},
+            {'requests': [{'method': 'GET', 'path': '/admin/'}]},
+            {'requests': [{'method': 'POST', 'path': '/api/batch/', 'body': {'requests': []}}]},
+            {'requests': [{'method': 'GET', 'path': '/api/recordings/'}] * 51},
+        ]
+        for data in invalid:
+            response = self.client.post('/api/batch/', data)
+            self.assertEqual(response.status_code, 500)
+
+    def test_batch_not_authenticated(self):
+        client = APIClient()
+        response = client.post('/api/batch/', {'requests': [{'method': 'GET', 'path': '/api/recordings/'}]})
+        self.assertEqual(response.status_code, 401)
+
+    def test_batch_with_access_token(self):
+        application = Application.objects.create(name="Test", user=self.currentUser,
+                                                 client_type=Application.CLIENT_CONFIDENTIAL,
+                                                 authorization_grant_type=Application.GRANT_PASSWORD)
+        AccessToken.objects.create(user=self.currentUser, application=application, token="batch-token",
+                                   expires=timezone.now() + datetime.timedelta(hours=1), scope="read write")
+
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Bearer batch-token')
+        response = client.post('/api/batch/', {'requests': [
+            {'method': 'GET', 'path': '/api/recordings/'},
+            {'method': 'GET', 'path': '/api/recordings/{id}/'.format(id=self.r2.id)},
+        ]})
+        self.assertEqual([item['status'] for item in response.data['responses']], [200, 404])
+        self.assertEqual([recording['id'] for recording in response.data['responses'][0]['body']], [self.r1.id])
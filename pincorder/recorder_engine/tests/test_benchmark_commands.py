@@ -0,0 +1,124 @@
+import json
+import shutil
+import tempfile
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.db.models import F
+from django.utils.six import StringIO
+from oauth2_provider.models import AccessToken
+from ..counters import annotate_expected_counters
+from ..models import *
+
+
+class BenchmarkCommandsTest(TestCase):
+    def generate(self, **options):
+        call_command('generate_dataset', users=3, courses=2, subcourses=2, courses_per_user=2,
+                     recordings=4, pins=5, stdout=StringIO(), **options)
+
+    def run_benchmark(self, **options):
+        out = StringIO()
+        call_command('run_benchmark', requests=2, stdout=out, **options)
+        return json.loads(out.getvalue())
+
+    def test_generate_dataset(self):
+        self.generate()
+
+        self.assertEqual(User.objects.filter(username__startswith='bench_').count(), 3)
+        self.assertEqual(Course.objects.filter(name__startswith='bench ').count(), 6)
+        self.assertEqual(Course.objects.filter(parent_course__isnull=False).count(), 4)
+        self.assertEqual(Recording.objects.filter(user__username__startswith='bench_').count(), 12)
+        self.assertEqual(Course.authorized_users.through.objects.count(), 6)
+        self.assertEqual(CourseStatistics.objects.count(), 6)
+        self.assertEqual(StorageUsage.objects.filter(user__username__startswith='bench_').count(), 3)
+
+        # The counters of the recordings match the bulk inserted pins
+        self.assertFalse(annotate_expected_counters(Recording.objects.all())
+                         .exclude(pin_count=F('expected_pin_count')).exists())
+        self.assertEqual(sum(Recording.objects.values_list('pin_count', flat=True)), Pin.objects.count())
+
+    def test_generate_dataset_twice_should_fail(self):
+        self.generate()
+
+        with self.assertRaises(CommandError):
+            self.generate()
+
+    def test_run_benchmark_read_only(self):
+        self.generate()
+        pins_count = Pin.objects.count()
+
+        report = self.run_benchmark(read_only=True)
+
+        self.assertEqual(report['dataset']['users'], 3)
+        self.assertIn('user-dump', [result['route'] for result in report['routes']])
+        for result in report['routes']:
+            self.assertEqual(result['requests'], 2)
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+            # The time budgets are reported instead of being checked by the tests
+            self.assertIn('over_budget', result)
+            self.assertIsNotNone(result['budget_ms'])
+
+        self.assertEqual(Pin.objects.count(), pins_count)
+
+        # The generated courses have their statistics
+        statistics = next(result for result in report['routes'] if result['route'] == 'course-statistics')
+        self.assertEqual(statistics['statuses'], {'200': 2})
+
+    def test_run_benchmark_cleans_up_written_objects(self):
+        self.generate()
+        recordings_count = Recording.objects.count()
+        courses_count = Course.objects.count()
+
+        report = self.run_benchmark(routes='recording-list,recording-add-pin,course-add-course-with-teacher')
+
+        self.assertEqual([result['errors'] for result in report['routes']], [0, 0, 0, 0])
+        self.assertEqual(Recording.objects.count(), recordings_count)
+        self.assertEqual(Course.objects.count(), courses_count)
+        self.assertFalse(Pin.objects.filter(time__lt=0).exists())
+
+    def test_run_benchmark_keeps_the_counters(self):
+        self.generate()
+
+        self.run_benchmark(routes='recording-add-pin,recording-delete-pin,recording-detail,course-detail,sync')
+
+        # The pins, the recordings and the courses written by the benchmark left nothing to fix
+        out = StringIO()
+        call_command('reconcile_counters', dry_run=True, stdout=out)
+        self.assertEqual(out.getvalue().splitlines(), ["Would fix 0 recordings", "Would fix 0 storage usages",
+                                                       "Would fix 0 course statistics"])
+
+    def test_run_benchmark_with_token_and_session_authentication(self):
+        self.generate()
+
+        for auth in ('token', 'session'):
+            report = self.run_benchmark(routes='recording-list,user-dump', auth=auth)
+
+            self.assertEqual(report['config']['auth'], auth)
+            self.assertFalse(any(result['errors'] for result in report['routes']))
+            self.assertGreater(report['routes'][0]['queries_per_request'], 0)
+
+        self.assertFalse(AccessToken.objects.exists())
+
+    def test_benchmark_serializers(self):
+        # The fake media files are written to a temporary directory, removed at the end
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+
+        out = StringIO()
+        with self.settings(MEDIA_ROOT=media_root):
+            self.generate(media=True)
+            call_command('benchmark_serializers', repeat=1, stdout=out)
+        report = json.loads(out.getvalue())
+
+        # The fake media files are counted in the storage used by the users
+        self.assertEqual(sum(StorageUsage.objects.values_list('used_bytes', flat=True)),
+                         sum(Recording.objects.values_list('media_bytes', flat=True)))
+        self.assertGreater(sum(StorageUsage.objects.values_list('used_bytes', flat=True)), 0)
+        self.assertEqual([case['case'] for case in report['cases']], ['recordings', 'pins', 'user-dump'])
+        self.assertTrue(all(case['identical'] for case in report['cases']))
+
+    def test_run_benchmark_without_dataset_should_fail(self):
+        with self.assertRaises(CommandError):
+            self.run_benchmark()
@@ -0,0 +1,242 @@
+import datetime
+import io
+import json
+import os
+import zipfile
+
+from django.test import TestCase
+from django.utils import timezone
+from django.contrib.auth.models import User
+from ..models import *
+from ..budgets import ROUTE_BUDGETS
+from ..urls import urlpatterns
+from .budget_client import BudgetAPIClient
+
+
+class BudgetTestMixin(object):
+    """
+    Call every route of the API with a dataset whose size is multiplied by SCALE.
+    The BudgetAPIClient fails the test if a call exceeds the budget of its route.
+    """
+    SCALE = 1
+
+    @classmethod
+    def setUpTestData(cls):
+        scale = cls.SCALE
+
+        cls.currentUser = User.objects.create(username="testuser")
+        cls.currentUser2 = User.objects.create(username="testuser2")
+        User.objects.bulk_create([User(username="student{n}".format(n=n)) for n in range(2 * scale)])
+        cls.students = list(User.objects.filter(username__startswith="student").values_list('id', flat=True))
+
+        # Add the courses, each one with a teacher
+        Teacher.objects.bulk_create([Teacher(name="Teacher {n}".format(n=n)) for n in range(2 * scale)])
+        Course.objects.bulk_create([Course(name="Course {n}".format(n=n), teacher=teacher)
+                                    for n, teacher in enumerate(Teacher.objects.all())])
+        courses = list(Course.objects.all())
+        cls.course1 = courses[0]
+
+        # The bulk inserts don't send post_save, the statistics of the courses are created here
+        CourseStatistics.objects.bulk_create([CourseStatistics(course=course) for course in courses])
+
+        # Authorize the testuser to view all the courses
+        membership = Course.authorized_users.through
+        membership.objects.bulk_create([membership(course=course, user=cls.currentUser) for course in courses])
+
+        # Add the recordings for testuser, with some pins for each one
+        now = timezone.now()
+        Recording.objects.bulk_create([Recording(name="Recording {n}".format(n=n), user=cls.currentUser,
+                                                 date=now - datetime.timedelta(hours=n),
+                                                 course=courses[n % len(courses)])
+                                       for n in range(3 * scale)])
+        recordings = list(Recording.objects.all())
+        cls.r1 = recordings[0]
+        cls.r2 = recordings[1]
+
+        Pin.objects.bulk_create([Pin(recording=recording, time=n * 1000, text="Pin {n}".format(n=n))
+                                 for recording in recordings for n in range(3)])
+        Pin.objects.bulk_create([Pin(recording=cls.r1, time=n * 1000, text="Pin {n}".format(n=n))
+                                 for n in range(3, 3 * scale)])
+
+        RecordingFile.objects.create(recording=cls.r1, file_url="raw_upload/test.mp3")
+
+    def setUp(self):
+        self.client = BudgetAPIClient()
+        self.client.force_authenticate(user=self.currentUser)
+
+    def test_api_root(self):
+        self.client.get('/api/')
+
+    def test_recording_list(self):
+        response = self.client.get('/api/recordings/')
+        self.assertEqual(len(response.data), 3 * self.SCALE)
+
+    def test_recording_create(self):
+        response = self.client.post('/api/recordings/', {'name': 'Test Recording', 'date': timezone.now(),
+                                                         'course': self.course1.id})
+        self.assertEqual(response.status_code, 201)
+
+    def test_recording_bulk_create(self):
+        response = self.client.post('/api/recordings/bulk_create/', {'recordings': [
+            {'name': 'Recording {n}'.format(n=n), 'date': timezone.now(), 'course': self.course1.id} for n in range(3)
+        ]})
+        self.assertEqual(len(response.data['ids']), 3)
+
+    def test_recording_detail(self):
+        response = self.client.get('/api/recordings/{id}/'.format(id=self.r1.id))
+        self.assertEqual(response.status_code, 200)
+
+    def test_recording_edit(self):
+        response = self.client.patch('/api/recordings/{id}/'.format(id=self.r1.id), {'name': 'New Name'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_recording_delete(self):
+        response = self.client.delete('/api/recordings/{id}/'.format(id=self.r2.id))
+        self.assertEqual(response.status_code, 204)
+
+    def test_recording_search_by_name(self):
+        response = self.client.get('/api/recordings/search_by_name/', {'name': 'Recording'})
+        self.assertEqual(len(response.data), 3 * self.SCALE)
+
+    def test_recording_get_file(self):
+        response = self.client.get('/api/recordings/{id}/get_file/'.format(id=self.r1.id))
+        self.assertEqual(response.status_code, 200)
+
+    def test_recording_get_status(self):
+        response = self.client.get('/api/recordings/{id}/get_status/'.format(id=self.r1.id))
+        self.assertEqual(response.status_code, 200)
+
+    def test_recording_upload_file(self):
+        response = self.client.post('/api/recordings/{id}/upload_file/'.format(id=self.r2.id),
+                                    {'file_url': open('recorder_engine/tests/test.mp3', 'rb')},
+                                    format='multipart')
+        self.assertEqual(response.status_code, 200)
+
+        # Deleting file
+        os.remove(os.path.join(settings.MEDIA_ROOT, response.data['file_url']))
+
+    def test_recording_get_pins(self):
+        response = self.client.get('/api/recordings/{id}/get_pins/'.format(id=self.r1.id))
+        self.assertEqual(len(response.data), 3 * self.SCALE)
+
+    def test_recording_add_pin(self):
+        response = self.client.post('/api/recordings/{id}/add_pin/'.format(id=self.r1.id),
+                                    {'time': 100, 'text': 'Test Pin'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_recording_edit_pin(self):
+        response = self.client.post('/api/recordings/{id}/add_pin/'.format(id=self.r1.id),
+                                    {'time': 1000, 'text': 'New Text'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_recording_delete_pin(self):
+        response = self.client.delete('/api/recordings/{id}/delete_pin/'.format(id=self.r1.id), {'time': 1000})
+        self.assertEqual(response.status_code, 200)
+
+    def test_recording_add_pin_batch(self):
+        response = self.client.post('/api/recordings/{id}/add_pin_batch/'.format(id=self.r1.id),
+                                    {'batch': [{'time': 1000, 'text': 'New Text'}, {'time': 100, 'text': 'Test Pin'}]})
+        self.assertEqual(response.status_code, 200)
+
+    def test_course_list(self):
+        response = self.client.get('/api/courses/')
+        self.assertEqual(len(response.data), 2 * self.SCALE)
+
+    def test_course_create(self):
+        response = self.client.post('/api/courses/', {'name': 'New Course'})
+        self.assertEqual(response.status_code, 201)
+
+    def test_course_detail(self):
+        response = self.client.get('/api/courses/{id}/'.format(id=self.course1.id))
+        self.assertEqual(response.status_code, 200)
+
+    def test_course_edit(self):
+        response = self.client.patch('/api/courses/{id}/'.format(id=self.course1.id), {'name': 'New Name'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_course_delete(self):
+        response = self.client.delete('/api/courses/{id}/'.format(id=self.course1.id))
+        self.assertEqual(response.status_code, 204)
+
+    def test_course_delete_with_many_recordings(self):
+        # The recordings deleted with the course don't add queries, up to the 100 rows that Django deletes at once
+        course = Course.objects.create(name="Big Course")
+        course.authorized_users.add(self.currentUser)
+        users = [self.currentUser, self.currentUser2]
+        Recording.objects.bulk_create([Recording(name="Recording {n}".format(n=n), user=users[n % 2],
+                                                 date=timezone.now(), course=course) for n in range(90)])
+
+        response = self.client.delete('/api/courses/{id}/'.format(id=course.id))
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(Tombstone.objects.filter(time__isnull=True).count(), 90)
+
+    def test_course_add_course_with_teacher(self):
+        response = self.client.post('/api/courses/add_course_with_teacher/', {'name': 'New Course',
+                                                                              'teacher': 'Mary'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_course_add_teacher(self):
+        response = self.client.post('/api/courses/{id}/add_teacher/'.format(id=self.course1.id),
+                                    {'teacher': 'Mary'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_course_statistics(self):
+        response = self.client.get('/api/courses/{id}/statistics/'.format(id=self.course1.id))
+        self.assertEqual(response.status_code, 200)
+
+    def test_course_add_users(self):
+        response = self.client.post('/api/courses/{id}/add_users/'.format(id=self.course1.id),
+                                    {'users': self.students})
+        self.assertEqual(response.data['added'], 2 * self.SCALE)
+
+    def test_course_remove_users(self):
+        response = self.client.post('/api/courses/{id}/remove_users/'.format(id=self.course1.id),
+                                    {'users': self.students + [self.currentUser2.id]})
+        self.assertEqual(response.data['removed'], 0)
+
+    def test_user_dump(self):
+        response = self.client.get('/api/user_dump/')
+        self.assertEqual(len(response.data['recordings']), 3 * self.SCALE)
+
+    def test_user_export(self):
+        response = self.client.get('/api/user_export/')
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(len(json.loads(archive.read('recordings.json').decode('utf-8'))), 3 * self.SCALE)
+
+    def test_sync(self):
+        response = self.client.post('/api/sync/', {
+            'recordings': [{'temp_id': 'a', 'name': 'Offline', 'date': timezone.now(), 'course': self.course1.id}],
+            'renames': [{'recording': self.r2.id, 'name': 'Renamed', 'version': 1}],
+            'pins': [{'recording': 'a', 'time': 5, 'text': 'New'},
+                     {'recording': self.r1.id, 'time': 1000, 'text': 'Updated', 'version': 1}],
+            'deleted_pins': [{'recording': self.r1.id, 'time': 2000, 'version': 1}],
+        })
+        self.assertEqual(response.data['conflicts'], [])
+
+    def test_batch(self):
+        response = self.client.post('/api/batch/', {'requests': [
+            {'method': 'GET', 'path': '/api/recordings/{id}/get_pins/'.format(id=self.r1.id)},
+            {'method': 'POST', 'path': '/api/recordings/{id}/add_pin/'.format(id=self.r1.id),
+             'body': {'time': 100, 'text': 'Test Pin'}},
+            {'method': 'GET', 'path': '/api/recordings/{id}/'.format(id=self.r2.id)},
+        ]})
+        self.assertEqual([item['status'] for item in response.data['responses']], [200, 200, 200])
+
+
+class SmallDatasetBudgetTest(BudgetTestMixin, TestCase):
+    SCALE = 1
+
+
+class LargeDatasetBudgetTest(BudgetTestMixin, TestCase):
+    SCALE = 100
+
+
+class BudgetDeclarationTest(TestCase):
+    def test_every_route_has_a_budget(self):
+        # Collect the names of the API routes, including the ones registered by the router
+        names = set()
+        for pattern in urlpatterns:
+            for child in getattr(pattern, 'url_patterns', [pattern]):
+                names.add(child.name)
+
+        self.assertEqual(names - set(route for route, method in ROUTE_BUDGETS), set())
@@ -0,0 +1,92 @@
+import gzip
+import json
+import zlib
+from unittest import mock
+
+import brotli
+
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import TestCase, RequestFactory
+from rest_framework.test import APITestCase
+from django.utils import timezone
+from django.contrib.auth.models import User
+from ..models import *
+from .. import compression
+from ..middleware import CompressionMiddleware
+
+
+class CompressionAPITest(APITestCase):
+    def setUp(self):
+        compression.compressed_cache.clear()
+
+        self.currentUser = User.objects.create(username="testuser")
+        self.client.force_authenticate(user=self.currentUser)
+
+        for n in range(50):
+            Recording.objects.create(name="Registration {n}".format(n=n), date=timezone.now(), user=self.currentUser)
+
+    def test_gzip_response(self):
+        response = self.client.get('/api/recordings/', HTTP_ACCEPT_ENCODING='gzip, deflate')
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(int(response['Content-Length']), len(response.content))
+        self.assertEqual(len(json.loads(gzip.decompress(response.content).decode('utf-8'))), 50)
+
+    def test_brotli_is_preferred(self):
+        response = self.client.get('/api/recordings/', HTTP_ACCEPT_ENCODING='gzip, deflate, br')
+
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(len(json.loads(brotli.decompress(response.content).decode('utf-8'))), 50)
+
+    def test_refused_encodings_are_not_used(self):
+        response = self.client.get('/api/recordings/', HTTP_ACCEPT_ENCODING='gzip;q=0, br;q=0')
+
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+    def test_small_responses_are_not_compressed(self):
+        recording = Recording.objects.first()
+        response = self.client.get('/api/recordings/{id}/get_status/'.format(id=recording.id),
+                                   HTTP_ACCEPT_ENCODING='gzip')
+
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_big_responses_are_compressed_once(self):
+        with self.settings(COMPRESSION_CACHE_MIN_SIZE=1024):
+            with mock.patch.object(compression, 'compress_content', wraps=compression.compress_content) as compress:
+                first = self.client.get('/api/recordings/', HTTP_ACCEPT_ENCODING='gzip')
+                second = self.client.get('/api/recordings/', HTTP_ACCEPT_ENCODING='gzip')
+
+        self.assertEqual(compress.call_count, 1)
+        self.assertEqual(first.content, second.content)
+
+
+class CompressionMiddlewareTest(TestCase):
+    def get_response(self, response, accept_encoding='gzip'):
+        request = RequestFactory().get('/api/recordings/', HTTP_ACCEPT_ENCODING=accept_encoding)
+        return CompressionMiddleware(lambda request: response)(request)
+
+    def test_streaming_response_is_compressed_by_chunk(self):
+        chunks = [(str(n) * 2000).encode('utf-8') for n in range(5)]
+        response = self.get_response(StreamingHttpResponse(iter(chunks), content_type='application/json'))
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertFalse(response.has_header('Content-Length'))
+
+        # Each chunk can be decompressed as soon as it's received
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        compressed_chunks = list(response.streaming_content)
+        for chunk, compressed_chunk in zip(chunks, compressed_chunks):
+            self.assertEqual(decompressor.decompress(compressed_chunk), chunk)
+
+    def test_media_files_are_not_compressed(self):
+        response = self.get_response(HttpResponse(b'0' * 10000, content_type='audio/mpeg'))
+
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_etag_becomes_weak(self):
+        response = HttpResponse(b'0' * 10000, content_type='application/json')
+        response['ETag'] = '"etag"'
+
+        self.assertEqual(self.get_response(response)['ETag'], 'W/"etag"')
@@ -0,0 +1,140 @@
+import json
+import os
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from ..models import *
+from .budget_client import BudgetAPIClient
+
+
+class CountersTest(APITestCase):
+    def setUp(self):
+        self.currentUser = User.objects.create(username="testuser")
+        self.r1 = Recording.objects.create(name="First Registration", date=timezone.now(), user=self.currentUser)
+        self.r2 = Recording.objects.create(name="Second Registration", date=timezone.now(), user=self.currentUser)
+
+        self.client = BudgetAPIClient()
+        self.client.force_authenticate(user=self.currentUser)
+
+        self.image_size = os.path.getsize('recorder_engine/tests/wrong.png')
+        self.file_size = os.path.getsize('recorder_engine/tests/test.mp3')
+
+    def tearDown(self):
+        for pin in Pin.objects.exclude(media_url=''):
+            os.remove(os.path.join(settings.MEDIA_ROOT, pin.media_url.name))
+        for file in RecordingFile.objects.all():
+            os.remove(os.path.join(settings.MEDIA_ROOT, file.file_url.name))
+
+    def get_counters(self, recording):
+        recording = Recording.objects.get(id=recording.id)
+        return recording.pin_count, recording.media_bytes
+
+    def test_add_pin_counters(self):
+        self.client.post('/api/recordings/{id}/add_pin/'.format(id=self.r1.id), {'time': 10, 'text': 'First'})
+        self.client.post('/api/recordings/{id}/add_pin/'.format(id=self.r1.id),
+                         {'time': 20, 'media_url': open('recorder_engine/tests/wrong.png', 'rb')}, format='multipart')
+        self.assertEqual(self.get_counters(self.r1), (2, self.image_size))
+
+        # Updating a pin doesn't count it again, and a new image replaces the size of the old one
+        old_image = Pin.objects.get(recording=self.r1, time=20).media_url.name
+        self.client.post('/api/recordings/{id}/add_pin/'.format(id=self.r1.id), {'time': 10, 'text': 'Changed'})
+        self.client.post('/api/recordings/{id}/add_pin/'.format(id=self.r1.id),
+                         {'time': 20, 'media_url': open('recorder_engine/tests/wrong.png', 'rb')}, format='multipart')
+        self.assertEqual(self.get_counters(self.r1), (2, self.image_size))
+        self.assertEqual(self.get_counters(self.r2), (0, 0))
+
+        # The replaced image is deleted after the commit, that never happens in the tests
+        os.remove(os.path.join(settings.MEDIA_ROOT, old_image))
+
+    def test_add_pin_batch_counters(self):
+        self.client.post('/api/recordings/{id}/add_pin/'.format(id=self.r1.id), {'time': 10, 'text': 'First'})
+        self.client.post('/api/recordings/{id}/add_pin_batch/'.format(id=self.r1.id), {
+            'batch': json.dumps([{'time': 10, 'text': 'Updated', 'media_url': 'image1'},
+                                 {'time': 20, 'text': 'New', 'media_url': 'image2'},
+                                 {'time': 30, 'text': 'Without image'}]),
+            'image1': open('recorder_engine/tests/wrong.png', 'rb'),
+            'image2': open('recorder_engine/tests/wrong.png', 'rb'),
+        }, format='multipart')
+
+        self.assertEqual(self.get_counters(self.r1), (3, 2 * self.image_size))
+
+    def test_delete_pin_counters(self):
+        self.client.post('/api/recordings/{id}/add_pin/'.format(id=self.r1.id), {'time': 10, 'text': 'First'})
+        self.client.post('/api/recordings/{id}/add_pin/'.format(id=self.r1.id),
+                         {'time': 20, 'media_url': open('recorder_engine/tests/wrong.png', 'rb')}, format='multipart')
+
+        self.client.delete('/api/recordings/{id}/delete_pin/'.format(id=self.r1.id), {'time': 20})
+        self.assertEqual(self.get_counters(self.r1), (1, 0))
+
+        # A missing pin changes nothing
+        response = self.client.delete('/api/recordings/{id}/delete_pin/'.format(id=self.r1.id), {'time': 20})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.get_counters(self.r1), (1, 0))
+
+    def test_drifted_counters_dont_become_negative(self):
+        # A pin added outside the API isn't counted
+        Pin.objects.create(recording=self.r1, time=10, text="Not counted")
+
+        response = self.client.delete('/api/recordings/{id}/delete_pin/'.format(id=self.r1.id), {'time': 10})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_counters(self.r1), (0, 0))
+
+    def test_sync_counters(self):
+        self.client.post('/api/recordings/{id}/add_pin/'.format(id=self.r1.id),
+                         {'time': 10, 'media_url': open('recorder_engine/tests/wrong.png', 'rb')}, format='multipart')
+
+        response = self.client.post('/api/sync/', {
+            'pins': [{'recording': self.r1.id, 'time': 20, 'text': 'New'},
+                     {'recording': self.r2.id, 'time': 20, 'text': 'New'},
+                     {'recording': self.r2.id, 'time': 30, 'text': 'New'}],
+            'deleted_pins': [{'recording': self.r1.id, 'time': 10}],
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_counters(self.r1), (1, 0))
+        self.assertEqual(self.get_counters(self.r2), (2, 0))
+
+    def test_upload_file_counters(self):
+        response = self.client.post('/api/recordings/{id}/upload_file/'.format(id=self.r1.id),
+                                    {'file_url': open('recorder_engine/tests/test.mp3', 'rb'), 'duration': 2500},
+                                    format='multipart')
+        self.assertEqual(response.status_code, 200)
+
+        recording = Recording.objects.get(id=self.r1.id)
+        self.assertEqual((recording.has_file, recording.duration, recording.media_bytes),
+                         (True, 2500, self.file_size))
+        self.assertEqual(recording.recordingfile.size, self.file_size)
+
+    def test_upload_file_with_wrong_duration_should_fail(self):
+        response = self.client.post('/api/recordings/{id}/upload_file/'.format(id=self.r1.id),
+                                    {'file_url': open('recorder_engine/tests/test.mp3', 'rb'), 'duration': -1},
+                                    format='multipart')
+
+        self.assertEqual(response.status_code, 500)
+        self.assertFalse(RecordingFile.objects.filter(recording=self.r1).exists())
+        self.assertFalse(Recording.objects.get(id=self.r1.id).has_file)
+
+    def test_counters_in_recording_detail(self):
+        self.client.post('/api/recordings/{id}/add_pin/'.format(id=self.r1.id), {'time': 10, 'text': 'First'})
+
+        response = self.client.get('/api/recordings/{id}/'.format(id=self.r1.id))
+        self.assertEqual((response.data['pin_count'], response.data['has_file'], response.data['duration'],
+                          response.data['media_bytes']), (1, False, None, 0))
+
+        # The counters can't be written by the clients
+        self.client.patch('/api/recordings/{id}/'.format(id=self.r1.id), {'pin_count': 100, 'has_file': True})
+        self.assertEqual(self.get_counters(self.r1), (1, 0))
+        self.assertFalse(Recording.objects.get(id=self.r1.id).has_file)
+
+    def test_recording_update_keeps_the_counters(self):
+        recording = Recording.objects.get(id=self.r1.id)
+
+        # A pin is added while the recording is being changed
+        self.client.post('/api/recordings/{id}/add_pin/'.format(id=self.r1.id), {'time': 10, 'text': 'First'})
+        recording.name = "Renamed"
+        recording.save()
+
+        self.assertEqual(self.get_counters(self.r1), (1, 0))
+        self.assertEqual(Recording.objects.get(id=self.r1.id).name, "Renamed")
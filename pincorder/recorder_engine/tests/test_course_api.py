@@ -3,6 +3,8 @@ from rest_framework.test import APITestCase, APIClient
 from django.urls import reverse
 from django.contrib.auth.models import User
 from ..models import *
+from .budget_client import BudgetAPIClient
+from ..signals import course_users_changed
 
 
 class CourseTest(APITestCase):
@@ -34,7 +36,7 @@ class CourseTest(APITestCase):
     def get_logged_client(self, user=None):
         if user is None:
             user = self.currentUser
-        client = APIClient()
+        client = BudgetAPIClient()
         client.force_authenticate(user=user)
         return client
 
@@ -260,4 +262,90 @@ class CourseTest(APITestCase):
                                 {'teacher': 'Mary'})
 
         self.assertEqual(response.status_code, 404)
-        self.assertEqual(Course.objects.get(id=self.course1.id).teacher, self.t1)
\ No newline at end of file
+        self.assertEqual(Course.objects.get(id=self.course1.id).teacher, self.t1)
+
+    def test_course_add_users(self):
+        client = self.get_logged_client()
+        user3 = User.objects.create(username="testuser3")
+
+        response = client.post('/api/courses/{id}/add_users/'.format(id=self.course1.id),
+                               {'users': [self.currentUser2.id, user3.id]})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['added'], 2)
+        self.assertIn(self.currentUser2, self.course1.authorized_users.all())
+        self.assertIn(user3, self.course1.authorized_users.all())
+
+    def test_course_add_users_should_skip_existing_members(self):
+        client = self.get_logged_client()
+
+        response = client.post('/api/courses/{id}/add_users/'.format(id=self.course2.id),
+                               {'users': [self.currentUser.id, self.currentUser2.id]})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['added'], 0)
+        self.assertEqual(self.course2.authorized_users.count(), 2)
+
+    def test_course_add_users_should_skip_non_existing_users(self):
+        client = self.get_logged_client()
+
+        response = client.post('/api/courses/{id}/add_users/'.format(id=self.course1.id),
+                               {'users': [self.currentUser2.id, 123123]})
+
+        self.assertEqual(response.data['added'], 1)
+        self.assertEqual(self.course1.authorized_users.count(), 2)
+
+    def test_course_add_users_sends_a_single_notification(self):
+        client = self.get_logged_client()
+        users = [User.objects.create(username="student{n}".format(n=n)) for n in range(10)]
+        notifications = []
+
+        def receiver(sender, **kwargs):
+            notifications.append(kwargs)
+
+        course_users_changed.connect(receiver)
+        try:
+            client.post('/api/courses/{id}/add_users/'.format(id=self.course1.id),
+                        {'users': [user.id for user in users]})
+        finally:
+            course_users_changed.disconnect(receiver)
+
+        self.assertEqual(len(notifications), 1)
+        self.assertEqual(notifications[0]['course_id'], self.course1.id)
+        self.assertEqual(notifications[0]['added'], sorted(user.id for user in users))
+
+    def test_course_add_users_should_fail_user_not_authorized(self):
+        client = self.get_logged_client(self.currentUser2)
+
+        response = client.post('/api/courses/{id}/add_users/'.format(id=self.course1.id),
+                               {'users': [self.currentUser2.id]})
+
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn(self.currentUser2, self.course1.authorized_users.all())
+
+    def test_course_add_users_should_fail_without_users(self):
+        client = self.get_logged_client()
+
+        response = client.post('/api/courses/{id}/add_users/'.format(id=self.course1.id), {})
+
+        self.assertEqual(response.status_code, 500)
+
+    def test_course_remove_users(self):
+        client = self.get_logged_client()
+
+        response = client.post('/api/courses/{id}/remove_users/'.format(id=self.course2.id),
+                               {'users': [self.currentUser2.id, 123123]})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['removed'], 1)
+        self.assertNotIn(self.currentUser2, self.course2.authorized_users.all())
+        self.assertIn(self.currentUser, self.course2.authorized_users.all())
+
+    def test_course_remove_users_should_fail_user_not_authorized(self):
+        client = self.get_logged_client()
+
+        response = client.post('/api/courses/{id}/remove_users/'.format(id=self.course3.id),
+                               {'users': [self.currentUser2.id]})
+
+        self.assertEqual(response.status_code, 404)
+        self.assertIn(self.currentUser2, self.course3.authorized_users.all())
@@ -0,0 +1,174 @@
+import os
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.utils import timezone
+from django.utils.six import StringIO
+from rest_framework.test import APITestCase
+from ..models import *
+from .budget_client import BudgetAPIClient
+
+
+class CourseStatisticsTest(APITestCase):
+    def setUp(self):
+        self.currentUser = User.objects.create(username="testuser")
+        self.currentUser2 = User.objects.create(username="testuser2")
+
+        # A course with a sub course, and another course
+        self.course1 = Course.objects.create(name="Computer Science")
+        self.course2 = Course.objects.create(name="Operative System", parent_course=self.course1)
+        self.course3 = Course.objects.create(name="Math")
+        for course in (self.course1, self.course2, self.course3):
+            course.authorized_users.add(self.currentUser)
+        self.course1.authorized_users.add(self.currentUser2)
+
+        self.client = BudgetAPIClient()
+        self.client.force_authenticate(user=self.currentUser)
+
+    def get_statistics(self, course):
+        response = self.client.get('/api/courses/{id}/statistics/'.format(id=course.id))
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def get_counts(self, course):
+        statistics = self.get_statistics(course)
+        return statistics['recording_count'], statistics['pin_count'], statistics['total_duration']
+
+    def create_recording(self, course):
+        response = self.client.post('/api/recordings/', {'name': 'Lesson', 'date': timezone.now(),
+                                                         'course': course.id if course else ''})
+        self.assertEqual(response.status_code, 201)
+        return response.data['id']
+
+    def test_new_course_statistics(self):
+        statistics = self.get_statistics(self.course3)
+        self.assertEqual(statistics, {'course': self.course3.id, 'recording_count': 0, 'pin_count': 0,
+                                      'total_duration': 0, 'total_hours': 0, 'last_activity': None})
+
+    def test_statistics_of_unauthorized_course_should_fail(self):
+        course = Course.objects.create(name="Private")
+        response = self.client.get('/api/courses/{id}/statistics/'.format(id=course.id))
+        self.assertEqual(response.status_code, 404)
+
+    def test_recordings_roll_up_to_the_parent_course(self):
+        self.create_recording(self.course2)
+        self.create_recording(self.course1)
+        self.create_recording(None)
+
+        self.assertEqual(self.get_counts(self.course2), (1, 0, 0))
+        self.assertEqual(self.get_counts(self.course1), (2, 0, 0))
+        self.assertEqual(self.get_counts(self.course3), (0, 0, 0))
+        self.assertIsNotNone(self.get_statistics(self.course1)['last_activity'])
+
+    def test_bulk_created_recordings(self):
+        response = self.client.post('/api/recordings/bulk_create/', {'recordings': [
+            {'name': 'First', 'date': timezone.now(), 'course': self.course2.id},
+            {'name': 'Second', 'date': timezone.now(), 'course': self.course2.id},
+            {'name': 'Third', 'date': timezone.now(), 'course': self.course3.id},
+        ]})
+        self.assertEqual(response.status_code, 201)
+
+        self.assertEqual(self.get_counts(self.course1), (2, 0, 0))
+        self.assertEqual(self.get_counts(self.course3), (1, 0, 0))
+
+    def test_pins_and_duration(self):
+        id = self.create_recording(self.course2)
+        self.client.post('/api/recordings/{id}/add_pin_batch/'.format(id=id),
+                         {'batch': [{'time': 10, 'text': 'First'}, {'time': 20, 'text': 'Second'}]})
+        self.client.delete('/api/recordings/{id}/delete_pin/'.format(id=id), {'time': 10})
+        response = self.client.post('/api/recordings/{id}/upload_file/'.format(id=id),
+                                    {'file_url': open('recorder_engine/tests/test.mp3', 'rb'), 'duration': 5400000},
+                                    format='multipart')
+        os.remove(os.path.join(settings.MEDIA_ROOT, response.data['file_url']))
+
+        self.assertEqual(self.get_counts(self.course2), (1, 1, 5400000))
+        self.assertEqual(self.get_counts(self.course1), (1, 1, 5400000))
+        self.assertEqual(self.get_statistics(self.course1)['total_hours'], 1.5)
+
+    def test_sync_pins(self):
+        id = self.create_recording(self.course3)
+        response = self.client.post('/api/sync/', {'pins': [{'recording': id, 'time': 10, 'text': 'New'}]})
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(self.get_counts(self.course3), (1, 1, 0))
+
+    def test_move_recording(self):
+        id = self.create_recording(self.course2)
+        self.client.post('/api/recordings/{id}/add_pin/'.format(id=id), {'time': 10, 'text': 'First'})
+
+        response = self.client.patch('/api/recordings/{id}/'.format(id=id), {'course': self.course3.id})
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(self.get_counts(self.course1), (0, 0, 0))
+        self.assertEqual(self.get_counts(self.course2), (0, 0, 0))
+        self.assertEqual(self.get_counts(self.course3), (1, 1, 0))
+
+        # A change that doesn't move the recording keeps the statistics
+        self.client.patch('/api/recordings/{id}/'.format(id=id), {'name': 'Renamed'})
+        self.assertEqual(self.get_counts(self.course3), (1, 1, 0))
+
+    def test_move_sub_course(self):
+        self.create_recording(self.course2)
+
+        response = self.client.patch('/api/courses/{id}/'.format(id=self.course2.id),
+                                     {'parent_course': self.course3.id})
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(self.get_counts(self.course1), (0, 0, 0))
+        self.assertEqual(self.get_counts(self.course2), (1, 0, 0))
+        self.assertEqual(self.get_counts(self.course3), (1, 0, 0))
+
+    def test_delete_recording(self):
+        id = self.create_recording(self.course2)
+        self.client.post('/api/recordings/{id}/add_pin/'.format(id=id), {'time': 10, 'text': 'First'})
+
+        response = self.client.delete('/api/recordings/{id}/'.format(id=id))
+        self.assertEqual(response.status_code, 204)
+
+        self.assertEqual(self.get_counts(self.course1), (0, 0, 0))
+        self.assertEqual(self.get_counts(self.course2), (0, 0, 0))
+
+    def test_delete_sub_course(self):
+        self.create_recording(self.course2)
+        self.create_recording(self.course1)
+
+        response = self.client.delete('/api/courses/{id}/'.format(id=self.course2.id))
+        self.assertEqual(response.status_code, 204)
+
+        # The recordings deleted with the sub course are removed from the parent
+        self.assertEqual(self.get_counts(self.course1), (1, 0, 0))
+
+    def test_delete_course_with_sub_courses(self):
+        course4 = Course.objects.create(name="Deep", parent_course=self.course2)
+        root = Course.objects.create(name="Root")
+        for course in (course4, root):
+            course.authorized_users.add(self.currentUser)
+        self.course1.parent_course = root
+        self.course1.save()
+        for course in (self.course1, self.course2, course4):
+            self.create_recording(course)
+        self.assertEqual(self.get_counts(root), (3, 0, 0))
+
+        # The queries of the cascade grow with the tree, beyond the budget of a single course
+        Course.objects.get(id=self.course1.id).delete()
+
+        # The whole tree is removed once
+        self.assertEqual(self.get_counts(root), (0, 0, 0))
+
+        # The recordings of the other courses are still counted
+        self.create_recording(root)
+        self.assertEqual(self.get_counts(root), (1, 0, 0))
+
+    def test_reconcile_course_statistics(self):
+        id = self.create_recording(self.course2)
+        self.client.post('/api/recordings/{id}/add_pin/'.format(id=id), {'time': 10, 'text': 'First'})
+        CourseStatistics.objects.filter(course=self.course1).update(recording_count=10, pin_count=0)
+        CourseStatistics.objects.filter(course=self.course3).delete()
+
+        out = StringIO()
+        call_command('reconcile_counters', stdout=out)
+
+        self.assertIn("Fixed 2 course statistics", out.getvalue())
+        self.assertEqual(self.get_counts(self.course1), (1, 1, 0))
+        self.assertEqual(self.get_counts(self.course3), (0, 0, 0))
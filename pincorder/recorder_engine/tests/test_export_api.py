@@ -0,0 +1,114 @@
+import io
+import json
+import os
+import zipfile
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from ..models import *
+from .budget_client import BudgetAPIClient
+
+
+class UserExportTest(APITestCase):
+    def setUp(self):
+        self.currentUser = User.objects.create(username="testuser")
+        self.currentUser2 = User.objects.create(username="testuser2")
+        self.r1 = Recording.objects.create(name="First Registration", date=timezone.now(), user=self.currentUser)
+        self.r2 = Recording.objects.create(name="Second Registration", date=timezone.now(), user=self.currentUser)
+        self.r3 = Recording.objects.create(name="Other Registration", date=timezone.now(), user=self.currentUser2)
+
+        self.client = BudgetAPIClient()
+        self.client.force_authenticate(user=self.currentUser)
+
+    def tearDown(self):
+        for pin in Pin.objects.exclude(media_url=''):
+            os.remove(os.path.join(settings.MEDIA_ROOT, pin.media_url.name))
+        for file in RecordingFile.objects.all():
+            os.remove(os.path.join(settings.MEDIA_ROOT, file.file_url.name))
+
+    def get_archive(self):
+        response = self.client.get('/api/user_export/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        self.assertTrue(response.streaming)
+
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertIsNone(archive.testzip())
+        return archive
+
+    def get_recordings(self, archive):
+        return json.loads(archive.read('recordings.json').decode('utf-8'))
+
+    def test_export_without_recordings(self):
+        self.client.force_authenticate(user=User.objects.create(username="newuser"))
+
+        archive = self.get_archive()
+        self.assertEqual(archive.namelist(), ['recordings.json'])
+        self.assertEqual(self.get_recordings(archive), {})
+
+    def test_export_recordings_and_pins(self):
+        self.client.post('/api/recordings/{id}/add_pin/'.format(id=self.r1.id), {'time': 20, 'text': 'Second'})
+        self.client.post('/api/recordings/{id}/add_pin/'.format(id=self.r1.id), {'time': 10, 'text': 'First'})
+        Pin.objects.create(recording=self.r3, time=10, text="Other")
+
+        recordings = self.get_recordings(self.get_archive())
+
+        # Only the recordings of the user, with their pins in order
+        self.assertEqual(sorted(recordings), sorted([str(self.r1.id), str(self.r2.id)]))
+        recording = recordings[str(self.r1.id)]
+        self.assertEqual(recording['name'], "First Registration")
+        self.assertIsNone(recording['file'])
+        self.assertEqual([(pin['time'], pin['text'], pin['media_url']) for pin in recording['pins']],
+                         [(10, 'First', None), (20, 'Second', None)])
+        self.assertEqual(recordings[str(self.r2.id)]['pins'], [])
+
+    def test_export_media_files(self):
+        self.client.post('/api/recordings/{id}/upload_file/'.format(id=self.r1.id),
+                         {'file_url': open('recorder_engine/tests/test.mp3', 'rb')}, format='multipart')
+        self.client.post('/api/recordings/{id}/add_pin/'.format(id=self.r2.id),
+                         {'time': 10, 'media_url': open('recorder_engine/tests/wrong.png', 'rb')}, format='multipart')
+
+        # The files are read a few bytes at a time
+        with override_settings(EXPORT_CHUNK_SIZE=1000):
+            archive = self.get_archive()
+        recordings = self.get_recordings(archive)
+
+        # The paths in the JSON are the names of the files in the archive
+        file_name = recordings[str(self.r1.id)]['file']['file_url']
+        image_name = recordings[str(self.r2.id)]['pins'][0]['media_url']
+        self.assertEqual(archive.namelist(), ['recordings.json', file_name, image_name])
+
+        with open('recorder_engine/tests/test.mp3', 'rb') as file:
+            self.assertEqual(archive.read(file_name), file.read())
+        with open('recorder_engine/tests/wrong.png', 'rb') as file:
+            self.assertEqual(archive.read(image_name), file.read())
+
+        # The media files are stored as they are
+        self.assertEqual(archive.getinfo(file_name).compress_type, zipfile.ZIP_STORED)
+
+    def test_export_skips_missing_files(self):
+        RecordingFile.objects.create(recording=self.r1, file_url="raw_upload/missing.mp3")
+
+        archive = self.get_archive()
+        self.assertEqual(archive.namelist(), ['recordings.json'])
+
+        RecordingFile.objects.all().delete()
+
+    def test_export_with_any_accept_header(self):
+        response = self.client.get('/api/user_export/', HTTP_ACCEPT='application/zip')
+        self.assertEqual(response.status_code, 200)
+
+        # The errors are still rendered as JSON
+        self.client.force_authenticate(user=None)
+        response = self.client.get('/api/user_export/', HTTP_ACCEPT='application/zip')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['Content-Type'], 'application/json')
+
+    def test_export_in_batch_should_fail(self):
+        response = self.client.post('/api/batch/', {'requests': [
+            {'method': 'GET', 'path': '/api/user_export/'},
+        ]})
+        self.assertEqual(response.status_code, 500)
@@ -0,0 +1,79 @@
+import datetime
+
+from django.test import TestCase, RequestFactory
+from django.contrib.auth.models import User
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from ..models import *
+from ..serializers import *
+from ..fast_serializers import ValuesSerializer
+
+
+class ValuesSerializerTest(TestCase):
+    def setUp(self):
+        self.currentUser = User.objects.create(username="testuser", first_name="Test", email="test@example.com")
+        self.request = RequestFactory().get('/api/recordings/')
+
+        teacher = Teacher.objects.create(name="Teacher")
+        self.course = Course.objects.create(name="Course", teacher=teacher)
+        self.course.authorized_users.add(self.currentUser)
+        subcourse = Course.objects.create(name="Subcourse", parent_course=self.course)
+        subcourse.authorized_users.add(self.currentUser)
+
+        date = datetime.datetime(2017, 4, 8, 14, 5, 30, 123456, tzinfo=timezone.utc)
+        self.recording = Recording.objects.create(name="First Registration", date=date, user=self.currentUser,
+                                                  course=self.course, status="CONVERTED", is_online=True)
+        Recording.objects.create(name="Second Registration", date=date.replace(microsecond=0),
+                                 user=self.currentUser)
+
+        Pin.objects.create(recording=self.recording, time=2000, text="Second")
+        Pin.objects.create(recording=self.recording, time=1000, text="First", media_url="raw_upload/image.png")
+
+    def assertSameJSON(self, model_data, values_data):
+        renderer = JSONRenderer()
+        self.assertEqual(renderer.render(model_data), renderer.render(values_data))
+
+    def test_recordings(self):
+        recordings = Recording.objects.filter(user=self.currentUser)
+        context = {'request': self.request}
+
+        self.assertSameJSON(RecordingSerializer(recordings, many=True, context=context).data,
+                            ValuesSerializer(RecordingSerializer(context=context)).serialize(recordings))
+
+    def test_pins(self):
+        pins = Pin.objects.filter(recording=self.recording).order_by('time')
+        context = {'request': self.request}
+
+        self.assertSameJSON(PinSerializer(pins, many=True, context=context).data,
+                            ValuesSerializer(PinSerializer(context=context)).serialize(pins))
+
+    def test_pins_without_request(self):
+        pins = Pin.objects.filter(recording=self.recording)
+
+        self.assertSameJSON(UserDumpPinSerializer(pins, many=True).data,
+                            ValuesSerializer(UserDumpPinSerializer()).serialize(pins))
+
+    def test_user_dump(self):
+        recordings = Recording.objects.filter(user=self.currentUser)
+        courses = Course.objects.filter(authorized_users__in=[self.currentUser])
+
+        model_data = UserDumpSerializer({'recordings': recordings, 'user': self.currentUser,
+                                         'courses': courses}).data
+        values_data = {
+            'user': UserDumpUserSerializer(self.currentUser).data,
+            'courses': ValuesSerializer(UserDumpCourseSerializer()).serialize(courses),
+            'recordings': ValuesSerializer(UserDumpRecordingSerializer()).serialize(recordings),
+        }
+
+        self.assertSameJSON(model_data, values_data)
+
+    def test_nested_lists_use_one_query(self):
+        recordings = Recording.objects.filter(user=self.currentUser)
+
+        with self.assertNumQueries(2):
+            ValuesSerializer(UserDumpRecordingSerializer()).serialize(recordings)
+
+    def test_empty_queryset(self):
+        recordings = Recording.objects.none()
+
+        self.assertEqual(ValuesSerializer(UserDumpRecordingSerializer()).serialize(recordings), [])
@@ -0,0 +1,77 @@
+from django.utils import timezone
+from prometheus_client import REGISTRY
+from rest_framework.test import APITestCase, APIClient
+from django.contrib.auth.models import User
+from ..models import *
+from ..metrics import record_cache_lookup
+
+
+class MetricsTest(APITestCase):
+    def setUp(self):
+        self.currentUser = User.objects.create(username="testuser")
+        self.r1 = Recording.objects.create(name="First Registration", date=timezone.now(), user=self.currentUser)
+        Pin.objects.create(recording=self.r1, time=10, text="Explanation 1")
+
+    def get_logged_client(self):
+        client = APIClient()
+        client.force_authenticate(user=self.currentUser)
+        return client
+
+    def get_sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_metrics_endpoint(self):
+        self.get_logged_client().get('/api/recordings/')
+
+        with self.settings(METRICS_TOKEN='secret'):
+            response = self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer secret')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'pincorder_request_latency_seconds_bucket{')
+        self.assertContains(response, 'route="recording-list"')
+
+    def test_metrics_endpoint_without_token_should_fail(self):
+        with self.settings(METRICS_TOKEN='secret'):
+            # The requests forwarded by the local reverse proxy come from localhost too
+            self.assertEqual(self.client.get('/metrics/', REMOTE_ADDR='127.0.0.1').status_code, 403)
+            self.assertEqual(self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+            self.assertEqual(self.client.get('/metrics/', HTTP_AUTHORIZATION='secret').status_code, 403)
+
+        # Without a configured token nobody can scrape the metrics
+        with self.settings(METRICS_TOKEN=None):
+            self.assertEqual(self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer ').status_code, 403)
+
+    def test_request_latency_is_labeled_by_route(self):
+        before = self.get_sample('pincorder_request_latency_seconds_count',
+                                 route='recording-get-pins', method='GET', status='200')
+
+        self.get_logged_client().get('/api/recordings/{id}/get_pins/'.format(id=self.r1.id))
+
+        after = self.get_sample('pincorder_request_latency_seconds_count',
+                                route='recording-get-pins', method='GET', status='200')
+        self.assertEqual(after, before + 1)
+
+    def test_request_db_queries_are_counted(self):
+        before = self.get_sample('pincorder_request_db_queries_sum', route='recording-get-status')
+
+        self.get_logged_client().get('/api/recordings/{id}/get_status/'.format(id=self.r1.id))
+
+        after = self.get_sample('pincorder_request_db_queries_sum', route='recording-get-status')
+        self.assertEqual(after, before + 1)
+
+    def test_upload_bytes_are_recorded(self):
+        before = self.get_sample('pincorder_upload_bytes_sum', route='recording-add-pin')
+
+        response = self.get_logged_client().post('/api/recordings/{id}/add_pin/'.format(id=self.r1.id),
+                                                 {'time': 200, 'text': 'Test Pin'})
+
+        after = self.get_sample('pincorder_upload_bytes_sum', route='recording-add-pin')
+        self.assertEqual(after, before + int(response.wsgi_request.META['CONTENT_LENGTH']))
+
+    def test_cache_lookups_are_counted(self):
+        before = self.get_sample('pincorder_cache_lookups_total', cache='test', result='hit')
+
+        record_cache_lookup('test', True)
+        record_cache_lookup('test', False)
+
+        self.assertEqual(self.get_sample('pincorder_cache_lookups_total', cache='test', result='hit'), before + 1)
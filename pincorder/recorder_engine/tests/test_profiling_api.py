@@ -0,0 +1,72 @@
+import os
+import shutil
+import tempfile
+
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase, APIClient
+from django.contrib.auth.models import User
+from ..models import *
+
+
+class ProfilingTest(APITestCase):
+    def setUp(self):
+        self.staffUser = User.objects.create(username="staffuser", is_staff=True)
+        self.currentUser = User.objects.create(username="testuser")
+
+        r1 = Recording.objects.create(name="First Registration", date=timezone.now(), user=self.staffUser)
+        Pin.objects.create(recording=r1, time=10, text="Explanation 1")
+
+    def get_logged_client(self, user=None):
+        if user is None:
+            user = self.staffUser
+        client = APIClient()
+        client.force_authenticate(user=user)
+        return client
+
+    def test_profile_report_is_returned(self):
+        client = self.get_logged_client()
+        response = client.get('/api/user_dump/', {'profile': '1'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/plain; charset=utf-8')
+        self.assertContains(response, 'GET /api/user_dump/?profile=1 -> 200')
+        self.assertContains(response, 'SQL: ')
+        self.assertContains(response, 'function calls')
+
+    def test_profile_report_attributes_queries_to_call_sites(self):
+        client = self.get_logged_client()
+        response = client.get('/api/user_dump/', HTTP_X_PROFILE='1')
+
+        # The UserDump queries are made by the values serializers
+        self.assertContains(response, os.path.join('recorder_engine', 'fast_serializers.py'))
+        self.assertContains(response, 'in serialize')
+
+    def test_profile_report_is_stored(self):
+        profile_root = tempfile.mkdtemp()
+        try:
+            with override_settings(PROFILE_ROOT=profile_root):
+                client = self.get_logged_client()
+                response = client.get('/api/recordings/', HTTP_X_PROFILE='store')
+
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data[0]['name'], 'First Registration')
+
+            with open(os.path.join(profile_root, response['X-Profile-Report'])) as f:
+                self.assertIn('GET /api/recordings/ -> 200', f.read())
+        finally:
+            shutil.rmtree(profile_root)
+
+    def test_profile_should_be_ignored_for_non_staff_users(self):
+        client = self.get_logged_client(self.currentUser)
+        response = client.get('/api/recordings/', {'profile': '1'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, [])
+        self.assertFalse(response.has_header('X-Profile-Report'))
+
+    def test_profile_should_be_ignored_for_anonymous_users(self):
+        client = APIClient()
+        response = client.get('/api/recordings/', {'profile': '1'})
+
+        self.assertEqual(response.status_code, 401)
@@ -0,0 +1,99 @@
+import datetime
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.utils import timezone
+from django.utils.six import StringIO
+from oauth2_provider.models import AccessToken, Application, Grant, RefreshToken
+from oauth2_provider.settings import oauth2_settings
+
+
+class PurgeTokensCommandTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="testuser")
+        self.application = Application.objects.create(name="App", user=self.user,
+                                                      client_type=Application.CLIENT_CONFIDENTIAL,
+                                                      authorization_grant_type=Application.GRANT_PASSWORD)
+
+    def create_token(self, name, expires_days, refresh=False):
+        token = AccessToken.objects.create(user=self.user, application=self.application, token=name,
+                                           expires=timezone.now() + datetime.timedelta(days=expires_days))
+        if refresh:
+            RefreshToken.objects.create(user=self.user, application=self.application, token=name + "-refresh",
+                                        access_token=token)
+        return token
+
+    def create_grant(self, name, expires_days):
+        return Grant.objects.create(user=self.user, application=self.application, code=name,
+                                    redirect_uri="http://localhost/",
+                                    expires=timezone.now() + datetime.timedelta(days=expires_days))
+
+    def purge(self, **options):
+        out = StringIO()
+        call_command('purge_tokens', stdout=out, **options)
+        return out.getvalue()
+
+    def test_purge_expired_tokens_and_grants(self):
+        self.create_token("valid", 1)
+        self.create_token("retained", -1)
+        for n in range(5):
+            self.create_token("expired{n}".format(n=n), -10)
+        self.create_grant("valid", 1)
+        self.create_grant("expired", -10)
+
+        output = self.purge(retention=2 * 24 * 3600, batch_size=2)
+
+        self.assertEqual(sorted(AccessToken.objects.values_list('token', flat=True)), ["retained", "valid"])
+        self.assertEqual(list(Grant.objects.values_list('code', flat=True)), ["valid"])
+        self.assertIn("Removed 5 access tokens", output)
+        self.assertIn("Removed 1 grants", output)
+
+    def test_tokens_that_can_be_refreshed_should_be_kept(self):
+        self.create_token("expired", -10, refresh=True)
+
+        output = self.purge(retention=0)
+
+        self.assertTrue(AccessToken.objects.filter(token="expired").exists())
+        self.assertIn("Removed 0 refresh tokens", output)
+
+    def test_purge_refresh_tokens_not_used_in_time(self):
+        # With the REFRESH_TOKEN_EXPIRE_SECONDS of the settings, 60 days
+        self.create_token("abandoned", -61, refresh=True)
+        self.create_token("refreshable", -59, refresh=True)
+
+        output = self.purge(retention=0)
+
+        self.assertEqual(list(AccessToken.objects.values_list('token', flat=True)), ["refreshable"])
+        self.assertEqual(list(RefreshToken.objects.values_list('token', flat=True)), ["refreshable-refresh"])
+        self.assertIn("Removed 1 refresh tokens", output)
+        self.assertIn("Removed 1 access tokens", output)
+
+    def test_purge_expired_refresh_tokens(self):
+        self.create_token("expired", -10, refresh=True)
+        self.create_token("refreshable", -1, refresh=True)
+
+        old_value = oauth2_settings.REFRESH_TOKEN_EXPIRE_SECONDS
+        oauth2_settings.REFRESH_TOKEN_EXPIRE_SECONDS = 5 * 24 * 3600
+        try:
+            output = self.purge(retention=0)
+        finally:
+            oauth2_settings.REFRESH_TOKEN_EXPIRE_SECONDS = old_value
+
+        self.assertEqual(list(AccessToken.objects.values_list('token', flat=True)), ["refreshable"])
+        self.assertEqual(RefreshToken.objects.count(), 1)
+        self.assertIn("Removed 1 refresh tokens", output)
+        self.assertIn("Removed 1 access tokens", output)
+
+    def test_dry_run_should_not_delete(self):
+        self.create_token("expired", -10)
+
+        output = self.purge(retention=0, dry_run=True)
+
+        self.assertEqual(AccessToken.objects.count(), 1)
+        self.assertIn("Would remove 1 access tokens", output)
+
+    def test_invalid_batch_size_should_fail(self):
+        with self.assertRaises(CommandError):
+            self.purge(batch_size=0)
@@ -0,0 +1,129 @@
+import datetime
+import unittest
+
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+from django.contrib.auth.models import User
+from ..models import *
+
+
+# Size of the synthetic dataset used to check the query plans
+USERS_COUNT = 50
+COURSES_COUNT = 500
+COURSES_PER_USER = 5
+RECORDINGS_PER_USER = 40
+PINS_PER_RECORDING = 10
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', "Query plans are checked using the SQLite EXPLAIN output")
+class QueryPlanTest(TestCase):
+    """
+    Make sure that the queries made by the hot endpoints are served by an index,
+    so that a schema change can't silently turn them into full table scans
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.bulk_create([User(username="user{n}".format(n=n)) for n in range(USERS_COUNT)])
+        users = list(User.objects.all())
+        cls.user = users[0]
+
+        Course.objects.bulk_create([Course(name="Course {n}".format(n=n)) for n in range(COURSES_COUNT)])
+        courses = list(Course.objects.all())
+        cls.course = courses[0]
+
+        # Authorize every user to view a few courses
+        membership = Course.authorized_users.through
+        membership.objects.bulk_create([membership(course=courses[(i * COURSES_PER_USER + n) % COURSES_COUNT],
+                                                   user=user)
+                                        for i, user in enumerate(users) for n in range(COURSES_PER_USER)])
+
+        now = timezone.now()
+        Recording.objects.bulk_create([Recording(name="Recording {n}".format(n=n), user=user,
+                                                 date=now - datetime.timedelta(hours=n),
+                                                 course=courses[n % COURSES_COUNT])
+                                       for user in users for n in range(RECORDINGS_PER_USER)])
+        recordings = list(Recording.objects.all())
+        cls.recording = recordings[0]
+
+        Pin.objects.bulk_create([Pin(recording=recording, time=n * 1000, text="Pin {n}".format(n=n))
+                                 for recording in recordings for n in range(PINS_PER_RECORDING)])
+        RecordingFile.objects.bulk_create([RecordingFile(recording=recording, file_url="raw_upload/test.mp3")
+                                           for recording in recordings[::3]])
+
+        # Collect the statistics used by the query planner
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def get_plan(self, queryset):
+        """
+        Return the lines of the EXPLAIN QUERY PLAN output for the given queryset
+        """
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+            # The last column contains the description of each step
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assertUsesIndex(self, queryset, allow_sort=False):
+        """
+        Fail if any table is read with a full scan, or if the rows are sorted in a temporary b-tree
+        """
+        plan = self.get_plan(queryset)
+        for step in plan:
+            if step.startswith('SCAN') or ('TEMP B-TREE' in step and not allow_sort):
+                self.fail("Query is not served by an index:\n{sql}\n{plan}".format(sql=queryset.query,
+                                                                                    plan="\n".join(plan)))
+
+    def test_recording_list_uses_index(self):
+        self.assertUsesIndex(Recording.objects.filter(user=self.user))
+
+    def test_recording_detail_uses_index(self):
+        self.assertUsesIndex(Recording.objects.filter(user=self.user).filter(pk=self.recording.id))
+
+    def test_recording_search_by_name_uses_index(self):
+        self.assertUsesIndex(Recording.objects.filter(user=self.user).filter(name__contains="Recording 1"))
+
+    def test_recording_by_date_uses_index(self):
+        self.assertUsesIndex(Recording.objects.filter(user=self.user).order_by('-date'))
+
+    def test_get_pins_uses_index(self):
+        self.assertUsesIndex(Pin.objects.filter(recording__user_id=self.user)
+                                        .filter(recording_id=self.recording.id).order_by('time'))
+
+    def test_get_pins_in_time_range_uses_index(self):
+        self.assertUsesIndex(Pin.objects.filter(recording__user_id=self.user).filter(recording_id=self.recording.id)
+                                        .filter(time__gte=2000, time__lte=5000).order_by('time'))
+
+    def test_get_nearest_pin_before_uses_index(self):
+        # The pins are read backwards from the time, without sorting
+        self.assertUsesIndex(Pin.objects.filter(recording__user_id=self.user).filter(recording_id=self.recording.id)
+                                        .filter(time__lt=5000).order_by('-time')[:1])
+
+    def test_get_pin_at_time_uses_index(self):
+        self.assertUsesIndex(Pin.objects.filter(recording_id=self.recording.id).filter(time=1000))
+
+    def test_get_file_uses_index(self):
+        self.assertUsesIndex(RecordingFile.objects.filter(recording__user_id=self.user)
+                                                  .filter(recording__id=self.recording.id))
+
+    def test_course_list_uses_index(self):
+        # The few courses of the user are sorted by id after the lookup
+        self.assertUsesIndex(Course.objects.filter(authorized_users__in=[self.user]), allow_sort=True)
+
+    def test_course_authorization_check_uses_index(self):
+        # The check is made with exists(), which clears the ordering
+        self.assertUsesIndex(Course.objects.filter(id=self.course.id).filter(authorized_users__in=[self.user])
+                                           .order_by())
+
+    def test_course_members_use_index(self):
+        self.assertUsesIndex(self.course.authorized_users.all())
+
+    def test_user_dump_pins_use_index(self):
+        self.assertUsesIndex(self.recording.pin_set.all())
+
+    def test_prefetched_pins_use_index(self):
+        # Pins of many recordings are sorted by time after the lookup
+        self.assertUsesIndex(Pin.objects.filter(recording__in=Recording.objects.filter(user=self.user)),
+                             allow_sort=True)
@@ -0,0 +1,74 @@
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.utils import timezone
+from django.utils.six import StringIO
+from ..models import *
+
+
+class ReconcileCountersCommandTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="testuser")
+        self.r1 = Recording.objects.create(name="First", date=timezone.now(), user=self.user)
+        self.r2 = Recording.objects.create(name="Second", date=timezone.now(), user=self.user)
+        self.r3 = Recording.objects.create(name="Third", date=timezone.now(), user=self.user)
+
+        # Rows written without the API, the counters are not updated
+        Pin.objects.create(recording=self.r1, time=10, media_size=100)
+        Pin.objects.create(recording=self.r1, time=20)
+        RecordingFile.objects.create(recording=self.r2, file_url="file.mp3", size=1000)
+
+    def reconcile(self, **options):
+        out = StringIO()
+        call_command('reconcile_counters', stdout=out, **options)
+        return out.getvalue()
+
+    def get_counters(self, recording):
+        recording = Recording.objects.get(id=recording.id)
+        return recording.pin_count, recording.has_file, recording.media_bytes
+
+    def test_reconcile_counters(self):
+        out = self.reconcile(batch_size=2)
+
+        self.assertIn("Fixed 2 recordings", out)
+        self.assertEqual(self.get_counters(self.r1), (2, False, 100))
+        self.assertEqual(self.get_counters(self.r2), (0, True, 1000))
+        self.assertEqual(self.get_counters(self.r3), (0, False, 0))
+
+        # The counters are now right
+        self.assertIn("Fixed 0 recordings", self.reconcile())
+
+    def test_reconcile_drifted_counters(self):
+        self.reconcile()
+        Recording.objects.filter(id=self.r3.id).update(pin_count=5, has_file=True, media_bytes=10)
+
+        self.assertIn("Fixed 1 recordings", self.reconcile())
+        self.assertEqual(self.get_counters(self.r3), (0, False, 0))
+
+    def test_reconcile_dry_run(self):
+        out = self.reconcile(dry_run=True)
+
+        self.assertIn("Would fix 2 recordings", out)
+        self.assertEqual(self.get_counters(self.r1), (0, False, 0))
+
+    def test_reconcile_sizes(self):
+        storage = Pin._meta.get_field('media_url').storage
+        name = storage.save("reconcile_test.png", ContentFile(b"12345"))
+        try:
+            Pin.objects.create(recording=self.r3, time=10, media_url=name)
+
+            # The file of r2 is missing from the storage
+            out = self.reconcile(sizes=True)
+        finally:
+            storage.delete(name)
+
+        self.assertIn("Fixed 1 file sizes, 1 missing in the storage", out)
+        self.assertIn("Fixed 1 image sizes, 0 missing in the storage", out)
+        self.assertEqual(self.get_counters(self.r2), (0, True, 0))
+        self.assertEqual(self.get_counters(self.r3), (1, False, 5))
+
+    def test_wrong_batch_size(self):
+        with self.assertRaises(CommandError):
+            self.reconcile(batch_size=0)
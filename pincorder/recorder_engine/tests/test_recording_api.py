@@ -1,13 +1,19 @@
 import datetime
+import json
 import os
+from unittest import mock
+
+import msgpack
 
 from django.core.files.base import ContentFile
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase
 from rest_framework.test import APITestCase, APIClient
 from django.utils import timezone
 from django.urls import reverse
 from django.contrib.auth.models import User
 from ..models import *
+from .. import views
+from .budget_client import BudgetAPIClient
 
 
 class RecordingTest(APITestCase):
@@ -58,7 +64,7 @@ class RecordingTest(APITestCase):
     def get_logged_client(self, user=None):
         if user is None:
             user = self.currentUser
-        client = APIClient()
+        client = BudgetAPIClient()
         client.force_authenticate(user=user)
         return client
 
@@ -80,6 +86,40 @@ class RecordingTest(APITestCase):
         self.assertContains(response, text="Second Registration", status_code=200)
         self.assertContains(response, text="Third Registration", status_code=200)
 
+    def test_recording_list_fields(self):
+        client = self.get_logged_client()
+        response = client.get('/api/recordings/', {'fields': 'id,name'})
+
+        self.assertEqual(response.data[0], {'id': self.r1.id, 'name': 'First Registration'})
+
+    def test_recording_list_expand(self):
+        RecordingFile.objects.create(recording=self.r1, file_url='recording.mp3')
+
+        client = self.get_logged_client()
+        response = client.get('/api/recordings/', {'fields': 'id', 'expand': 'pins,file,course'})
+
+        self.assertEqual(response.data[0]['course'], {'id': self.course1.id, 'name': 'Operative System',
+                                                      'teacher': self.course1.teacher.id, 'parent_course': None})
+        self.assertEqual([pin['time'] for pin in response.data[0]['pins']], [10, 50, 100])
+        self.assertEqual(response.data[0]['file']['recording'], self.r1.id)
+        self.assertTrue(response.data[0]['file']['file_url'].endswith('recording.mp3'))
+
+        self.assertEqual(response.data[1]['pins'], [])
+        self.assertIsNone(response.data[1]['file'])
+
+    def test_recording_list_expand_uses_one_query_per_relation(self):
+        client = self.get_logged_client()
+
+        # The recordings with the joined file and course, and the pins
+        with self.assertNumQueries(2):
+            client.get('/api/recordings/', {'expand': 'pins,file,course'})
+
+    def test_recording_list_unknown_fields_should_fail(self):
+        client = self.get_logged_client()
+
+        self.assertEqual(client.get('/api/recordings/', {'fields': 'id,password'}).status_code, 500)
+        self.assertEqual(client.get('/api/recordings/', {'expand': 'user'}).status_code, 500)
+
     def test_recording_get_details(self):
         client = self.get_logged_client()
         response = client.get('/api/recordings/'+str(self.r1.id)+'/')
@@ -128,6 +168,38 @@ class RecordingTest(APITestCase):
 
         self.assertEqual(self.course3.recording_set.count(), 1)
 
+    def test_bulk_create_recordings(self):
+        client = self.get_logged_client()
+        response = client.post('/api/recordings/bulk_create/', {'recordings': [
+            {'name': 'Bulk 1', 'date': timezone.now(), 'course': self.course1.id},
+            {'name': 'Bulk 2', 'date': timezone.now()},
+            {'name': 'Bulk 3', 'date': timezone.now(), 'course': self.course1.id},
+        ]})
+        self.assertEqual(response.status_code, 201)
+
+        # The ids are returned in the same order of the recordings
+        recordings = [Recording.objects.get(id=id) for id in response.data['ids']]
+        self.assertEqual([recording.name for recording in recordings], ['Bulk 1', 'Bulk 2', 'Bulk 3'])
+        self.assertEqual([recording.course_id for recording in recordings], [self.course1.id, None, self.course1.id])
+        self.assertTrue(all(recording.user == self.currentUser for recording in recordings))
+
+    def test_bulk_create_recordings_to_unauthorized_course_should_fail(self):
+        client = self.get_logged_client()
+        response = client.post('/api/recordings/bulk_create/', {'recordings': [
+            {'name': 'Bulk 1', 'date': timezone.now(), 'course': self.course1.id},
+            {'name': 'Bulk 2', 'date': timezone.now(), 'course': self.course3.id},
+        ]})
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Recording.objects.filter(name__startswith='Bulk').exists())
+
+    def test_bulk_create_recordings_invalid_should_fail(self):
+        client = self.get_logged_client()
+        for data in ({}, {'recordings': [{'name': 'No date'}]},
+                     {'recordings': [{'name': 'Bulk', 'date': timezone.now()}] * 1001}):
+            response = client.post('/api/recordings/bulk_create/', data)
+            self.assertEqual(response.status_code, 500)
+        self.assertFalse(Recording.objects.filter(name__startswith='Bulk').exists())
+
     def test_edit_recording(self):
         client = self.get_logged_client()
         response = client.patch('/api/recordings/'+str(self.r1.id)+'/', {'name': 'New Name'})
@@ -192,6 +264,119 @@ class RecordingTest(APITestCase):
                                       response.data[1])
         self.assertDictContainsSubset({'time': 100, 'text': 'Explanation 2', 'media_url': None}, response.data[2])
 
+    def test_recording_list_pins_columnar(self):
+        client = self.get_logged_client()
+        response = client.get('/api/recordings/'+str(self.r1.id)+'/get_pins/', {'layout': 'columnar'})
+
+        # Times are the differences from the previous pin
+        self.assertEqual(response.data['time'], [10, 40, 50])
+        self.assertEqual(response.data['text'], ['Explanation 1', '', 'Explanation 2'])
+        self.assertEqual(response.data['media_url'],
+                         [None, 'http://testserver/api/recordings/1/get_pins/url_to_img.jpg', None])
+
+    def test_recording_list_pins_msgpack(self):
+        client = self.get_logged_client()
+        response = client.get('/api/recordings/'+str(self.r1.id)+'/get_pins/', HTTP_ACCEPT='application/msgpack')
+
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(response.content, raw=False)[0],
+                         {'time': 10, 'text': 'Explanation 1', 'media_url': None})
+
+    def test_recording_list_pins_in_time_range(self):
+        client = self.get_logged_client()
+        url = '/api/recordings/{id}/get_pins/'.format(id=self.r1.id)
+
+        response = client.get(url, {'from': 10, 'to': 99})
+        self.assertEqual([pin['time'] for pin in response.data], [10, 50])
+
+        response = client.get(url, {'from': 11})
+        self.assertEqual([pin['time'] for pin in response.data], [50, 100])
+
+    def test_recording_list_nearest_pins(self):
+        client = self.get_logged_client()
+        url = '/api/recordings/{id}/get_pins/'.format(id=self.r1.id)
+
+        response = client.get(url, {'before': 100, 'limit': 1})
+        self.assertEqual([pin['time'] for pin in response.data], [50])
+
+        response = client.get(url, {'after': 10, 'limit': 1})
+        self.assertEqual([pin['time'] for pin in response.data], [50])
+
+        # The pins before the time are returned in time order
+        response = client.get(url, {'before': 1000, 'limit': 2})
+        self.assertEqual([pin['time'] for pin in response.data], [50, 100])
+
+        response = client.get(url, {'before': 10, 'limit': 1})
+        self.assertEqual(response.data, [])
+
+    def test_recording_list_pins_cursoring(self):
+        client = self.get_logged_client()
+        url = '/api/recordings/{id}/get_pins/'.format(id=self.r1.id)
+        Pin.objects.bulk_create([Pin(recording=self.r1, time=1000 + n) for n in range(10)])
+
+        times, after = [], -1
+        while True:
+            page = client.get(url, {'after': after, 'limit': 4}).data
+            if not page:
+                break
+            times.extend(pin['time'] for pin in page)
+            after = page[-1]['time']
+
+        self.assertEqual(times, [10, 50, 100] + [1000 + n for n in range(10)])
+
+    def test_recording_list_pins_wrong_parameters_should_fail(self):
+        client = self.get_logged_client()
+        url = '/api/recordings/{id}/get_pins/'.format(id=self.r1.id)
+        for params in ({'from': 'a'}, {'after': 1, 'before': 2}, {'limit': 0}, {'limit': 1001}):
+            self.assertEqual(client.get(url, params).status_code, 500)
+
+    def test_get_batch(self):
+        RecordingFile.objects.create(recording=self.r1, file_url='recording.mp3')
+        r2 = Recording.objects.get(name="Second Registration")
+
+        client = self.get_logged_client()
+        response = client.get('/api/recordings/get_batch/',
+                              {'ids': '{r1},{r2},{r4},4000'.format(r1=self.r1.id, r2=r2.id, r4=self.r4.id)})
+
+        # Recordings of other users and missing recordings are omitted
+        self.assertEqual(sorted(response.data), sorted([str(self.r1.id), str(r2.id)]))
+        self.assertEqual([pin['time'] for pin in response.data[str(self.r1.id)]['pins']], [10, 50, 100])
+        self.assertEqual(response.data[str(self.r1.id)]['file']['recording'], self.r1.id)
+        self.assertEqual(response.data[str(r2.id)], {'pins': [], 'file': None})
+
+    def test_get_batch_is_streamed(self):
+        client = self.get_logged_client()
+        ids = ','.join(str(recording.id) for recording in Recording.objects.all())
+        response = client.get('/api/recordings/get_batch/', {'ids': ids})
+
+        with self.settings(RECORDING_BATCH_STREAM_SIZE=1):
+            streamed_response = client.get('/api/recordings/get_batch/', {'ids': ids})
+
+            self.assertTrue(streamed_response.streaming)
+            self.assertEqual(json.loads(b''.join(streamed_response.streaming_content).decode('utf-8')),
+                             response.json())
+
+    def test_get_batch_uses_one_query_per_relation(self):
+        client = self.get_logged_client()
+        ids = ','.join(str(recording.id) for recording in Recording.objects.all())
+
+        with self.assertNumQueries(2):
+            client.get('/api/recordings/get_batch/', {'ids': ids})
+
+    def test_get_batch_too_big_should_fail(self):
+        client = self.get_logged_client()
+
+        with self.settings(RECORDING_BATCH_MAX_SIZE=2):
+            response = client.get('/api/recordings/get_batch/', {'ids': '1,2,3'})
+
+        self.assertEqual(response.status_code, 500)
+
+    def test_get_batch_wrong_ids_should_fail(self):
+        client = self.get_logged_client()
+
+        self.assertEqual(client.get('/api/recordings/get_batch/', {'ids': '1,a'}).status_code, 500)
+        self.assertEqual(client.get('/api/recordings/get_batch/').status_code, 500)
+
     def test_add_pin_to_recording(self):
         client = self.get_logged_client()
         response = client.post('/api/recordings/{id}/add_pin/'.format(id=self.r1.id),
@@ -262,6 +447,43 @@ class RecordingTest(APITestCase):
 
         self.assertNotEqual(pin.text, 'New Name')
 
+    def test_add_pin_is_a_single_statement(self):
+        client = self.get_logged_client()
+        # The insert, the update of the pin count and of the statistics of the course, in a savepoint of the test
+        # transaction
+        with self.assertNumQueries(6):
+            response = client.post('/api/recordings/{id}/add_pin/'.format(id=self.r1.id), {'time': 20, 'text': 'New'})
+        self.assertEqual(response.data, {'time': 20, 'text': 'New', 'media_url': None})
+
+        # The update keeps the image and makes a new version, without changing the counters
+        pin = Pin.objects.get(recording=self.r1, time=50)
+        with self.assertNumQueries(3):
+            response = client.post('/api/recordings/{id}/add_pin/'.format(id=self.r1.id), {'time': 50})
+        self.assertEqual(response.data['media_url'], 'url_to_img.jpg')
+        self.assertEqual(Pin.objects.get(id=pin.id).version, pin.version + 1)
+        self.assertEqual(Pin.objects.get(id=pin.id).text, '')
+
+    def test_add_pin_without_time_should_fail(self):
+        client = self.get_logged_client()
+        response = client.post('/api/recordings/{id}/add_pin/'.format(id=self.r1.id), {'text': 'Test Pin'})
+
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(self.r1.pin_set.count(), 3)
+
+    def test_add_pin_to_unauthorized_recording_doesnt_store_the_image(self):
+        client = self.get_logged_client()
+        directory = os.path.join(settings.MEDIA_ROOT, settings.UPLOAD_MEDIA_URL)
+        os.makedirs(directory, exist_ok=True)
+        files = set(os.listdir(directory))
+        with mock.patch.object(views, 'store_pin_image', wraps=views.store_pin_image) as store_pin_image:
+            response = client.post('/api/recordings/{id}/add_pin/'.format(id=self.r4.id),
+                                   {'time': 200, 'media_url': open('recorder_engine/tests/wrong.png', 'rb')},
+                                   format='multipart')
+
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(store_pin_image.called)
+        self.assertEqual(set(os.listdir(directory)), files)
+
     def test_delete_pin(self):
         client = self.get_logged_client()
         initialCount = Pin.objects.count()
@@ -341,6 +563,49 @@ class RecordingTest(APITestCase):
         self.assertEqual(pin.recording, self.r1)
         self.assertEqual(pin.time, 250)
 
+    def test_add_multiple_pins_with_images(self):
+        client = self.get_logged_client()
+        response = client.post('/api/recordings/{id}/add_pin_batch/'.format(id=self.r1.id), {
+            'batch': json.dumps([{'time': 10, 'text': 'Updated', 'media_url': 'image1'},
+                                 {'time': 200, 'text': 'New', 'media_url': 'image2'},
+                                 {'time': 300, 'text': 'Without image'}]),
+            'image1': open('recorder_engine/tests/wrong.png', 'rb'),
+            'image2': open('recorder_engine/tests/wrong.png', 'rb'),
+        }, format='multipart')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(pin['time'], pin['text']) for pin in response.data],
+                         [(10, 'Updated'), (200, 'New'), (300, 'Without image')])
+        self.assertEqual(self.r1.pin_set.count(), 5)
+
+        # The images are written by the upload handler, straight to the storage
+        names = [pin.media_url.name for pin in Pin.objects.filter(recording=self.r1, time__in=[10, 200])]
+        self.assertEqual(len(set(names)), 2)
+        for name in names:
+            self.assertTrue(name.startswith(settings.UPLOAD_MEDIA_URL))
+            with open(os.path.join(settings.MEDIA_ROOT, name), 'rb') as stored:
+                self.assertEqual(stored.read(), open('recorder_engine/tests/wrong.png', 'rb').read())
+
+            # Deleting file
+            os.remove(os.path.join(settings.MEDIA_ROOT, name))
+
+    def test_add_multiple_pins_with_missing_image_should_fail(self):
+        client = self.get_logged_client()
+        directory = os.path.join(settings.MEDIA_ROOT, settings.UPLOAD_MEDIA_URL)
+        os.makedirs(directory, exist_ok=True)
+        files = set(os.listdir(directory))
+
+        response = client.post('/api/recordings/{id}/add_pin_batch/'.format(id=self.r1.id), {
+            'batch': json.dumps([{'time': 200, 'text': 'New', 'media_url': 'image1'},
+                                 {'time': 300, 'text': 'Missing', 'media_url': 'image2'}]),
+            'image1': open('recorder_engine/tests/wrong.png', 'rb'),
+        }, format='multipart')
+
+        # Nothing is written, and the uploaded images are removed
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(self.r1.pin_set.count(), 3)
+        self.assertEqual(set(os.listdir(directory)), files)
+
     def test_add_multiple_pins_should_fail_for_not_id(self):
         client = self.get_logged_client()
         response = client.post('/api/recordings//add_pin_batch/',
@@ -418,4 +683,28 @@ class RecordingTest(APITestCase):
                                {'file_url': ''},
                                 format='multipart')
 
-        self.assertEqual(response.status_code, 500)
\ No newline at end of file
+        self.assertEqual(response.status_code, 500)
+
+
+class PinImageReplacementTest(TransactionTestCase):
+    """
+    The replaced images are deleted after the commit, so the test can't run inside a transaction
+    """
+    def test_edit_pin_image_deletes_the_old_one_after_commit(self):
+        user = User.objects.create(username="testuser")
+        recording = Recording.objects.create(name="First Registration", date=timezone.now(), user=user)
+        client = APIClient()
+        client.force_authenticate(user=user)
+
+        url = '/api/recordings/{id}/add_pin/'.format(id=recording.id)
+        old = client.post(url, {'time': 200, 'media_url': open('recorder_engine/tests/wrong.png', 'rb')},
+                          format='multipart').data['media_url']
+        new = client.post(url, {'time': 200, 'media_url': open('recorder_engine/tests/wrong.png', 'rb')},
+                          format='multipart').data['media_url']
+
+        self.assertNotEqual(old, new)
+        self.assertEqual(Pin.objects.get(recording=recording, time=200).media_url.name, new)
+        self.assertFalse(os.path.isfile(os.path.join(settings.MEDIA_ROOT, old)))
+
+        # Deleting file
+        os.remove(os.path.join(settings.MEDIA_ROOT, new))
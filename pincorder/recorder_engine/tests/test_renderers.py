@@ -0,0 +1,126 @@
+import datetime
+import decimal
+import io
+import uuid
+from collections import OrderedDict
+
+import msgpack
+
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.utils import timezone
+from django.utils.translation import ugettext_lazy
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
+from ..models import *
+from ..parsers import FastJSONParser, MessagePackParser
+from ..renderers import FastJSONRenderer, MessagePackRenderer
+
+
+class FastJSONRendererTest(TestCase):
+    def assertSameOutput(self, data, accepted_media_type=None):
+        self.assertEqual(FastJSONRenderer().render(data, accepted_media_type),
+                         JSONRenderer().render(data, accepted_media_type))
+
+    def test_render_same_output(self):
+        self.assertSameOutput(OrderedDict([
+            ('name', "Registration è \u2028 \u2029"),
+            ('aware', datetime.datetime(2017, 4, 8, 14, 5, 30, 123456, tzinfo=timezone.utc)),
+            ('naive', datetime.datetime(2017, 4, 8, 14, 5, 30)),
+            ('date', datetime.date(2017, 4, 8)),
+            ('decimal', decimal.Decimal('1.5')),
+            ('lazy', ugettext_lazy("Registration")),
+            ('uuid', uuid.UUID('12345678123456781234567812345678')),
+            ('list', [1, 2.5, None, True, {'nested': []}]),
+        ]))
+
+    def test_render_none(self):
+        self.assertEqual(FastJSONRenderer().render(None), b'')
+
+    def test_render_indented(self):
+        self.assertSameOutput({'list': [1, 2]}, 'application/json; indent=4')
+
+    def test_render_big_integers(self):
+        self.assertSameOutput({'big': 2 ** 70})
+
+    def test_render_queryset(self):
+        user = User.objects.create(username="testuser")
+        Recording.objects.create(name="First Registration", date=timezone.now(), user=user)
+
+        self.assertSameOutput({'names': Recording.objects.values_list('name', flat=True)})
+
+
+class FastJSONParserTest(TestCase):
+    def test_parse(self):
+        data = FastJSONParser().parse(io.BytesIO('{"name": "Registration è", "pins": [1, 2]}'.encode('utf-8')))
+
+        self.assertEqual(data, {'name': "Registration è", 'pins': [1, 2]})
+
+    def test_parse_other_encodings(self):
+        stream = io.BytesIO('{"name": "Registration è"}'.encode('latin-1'))
+        data = FastJSONParser().parse(stream, parser_context={'encoding': 'latin-1'})
+
+        self.assertEqual(data, {'name': "Registration è"})
+
+    def test_parse_wrong_json_should_fail(self):
+        with self.assertRaises(ParseError):
+            FastJSONParser().parse(io.BytesIO(b'{"name": '))
+
+
+class MessagePackTest(TestCase):
+    def test_render_and_parse(self):
+        data = OrderedDict([
+            ('name', "Registration è"),
+            ('date', datetime.datetime(2017, 4, 8, 14, 5, 30, tzinfo=timezone.utc)),
+            ('decimal', decimal.Decimal('1.5')),
+            ('pins', [1, 2]),
+        ])
+
+        parsed = MessagePackParser().parse(io.BytesIO(MessagePackRenderer().render(data)))
+
+        self.assertEqual(parsed, {'name': "Registration è", 'date': "2017-04-08T14:05:30Z", 'decimal': 1.5,
+                                  'pins': [1, 2]})
+
+    def test_parse_wrong_data_should_fail(self):
+        with self.assertRaises(ParseError):
+            MessagePackParser().parse(io.BytesIO(b'\xc1'))
+
+
+class FastJSONAPITest(APITestCase):
+    def setUp(self):
+        self.currentUser = User.objects.create(username="testuser")
+        self.client.force_authenticate(user=self.currentUser)
+
+    def test_json_request_and_response(self):
+        response = self.client.post('/api/recordings/', '{"name": "First Registration", "date": "2017-04-08T14:05Z"}',
+                                    content_type='application/json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(response.json()['date'], "2017-04-08T14:05:00Z")
+
+    def test_wrong_json_request_should_fail(self):
+        response = self.client.post('/api/recordings/', '{"name": ', content_type='application/json')
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_msgpack_request(self):
+        data = msgpack.packb({'name': "First Registration", 'date': "2017-04-08T14:05Z"})
+        response = self.client.post('/api/recordings/', data, content_type='application/msgpack',
+                                    HTTP_ACCEPT='application/msgpack')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(msgpack.unpackb(response.content, raw=False)['name'], "First Registration")
+
+    def test_wrong_msgpack_request_should_fail(self):
+        # A truncated map, and a map used as the key of a map that the older msgpack versions reject with a TypeError
+        for data in (b'\x81\xa4name', b'\x81\x81\xa1a\x01\x01'):
+            response = self.client.post('/api/recordings/', data, content_type='application/msgpack')
+
+            self.assertEqual(response.status_code, 400)
+
+    def test_json_is_the_default(self):
+        response = self.client.get('/api/recordings/', HTTP_ACCEPT='*/*')
+
+        self.assertEqual(response['Content-Type'], 'application/json')
@@ -0,0 +1,155 @@
+import os
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.utils import timezone
+from django.utils.six import StringIO
+from rest_framework.test import APITestCase
+from ..models import *
+from .budget_client import BudgetAPIClient
+
+
+class StorageQuotaTest(APITestCase):
+    def setUp(self):
+        self.currentUser = User.objects.create(username="testuser")
+        self.currentUser2 = User.objects.create(username="testuser2")
+        self.r1 = Recording.objects.create(name="First Registration", date=timezone.now(), user=self.currentUser)
+        self.r2 = Recording.objects.create(name="Second Registration", date=timezone.now(), user=self.currentUser)
+
+        self.client = BudgetAPIClient()
+        self.client.force_authenticate(user=self.currentUser)
+
+        self.image_size = os.path.getsize('recorder_engine/tests/wrong.png')
+        self.file_size = os.path.getsize('recorder_engine/tests/test.mp3')
+
+        self.directory = os.path.join(settings.MEDIA_ROOT, settings.UPLOAD_MEDIA_URL)
+        os.makedirs(self.directory, exist_ok=True)
+        self.files = set(os.listdir(self.directory))
+
+    def tearDown(self):
+        for pin in Pin.objects.exclude(media_url=''):
+            os.remove(os.path.join(settings.MEDIA_ROOT, pin.media_url.name))
+        for file in RecordingFile.objects.all():
+            os.remove(os.path.join(settings.MEDIA_ROOT, file.file_url.name))
+
+    def get_used_bytes(self, user=None):
+        return StorageUsage.objects.get(user=user or self.currentUser).used_bytes
+
+    def set_quota(self, quota):
+        StorageUsage.objects.filter(user=self.currentUser).update(quota=quota)
+
+    def upload_file(self, recording):
+        return self.client.post('/api/recordings/{id}/upload_file/'.format(id=recording.id),
+                                {'file_url': open('recorder_engine/tests/test.mp3', 'rb')}, format='multipart')
+
+    def add_image_pin(self, recording, time):
+        return self.client.post('/api/recordings/{id}/add_pin/'.format(id=recording.id),
+                                {'time': time, 'media_url': open('recorder_engine/tests/wrong.png', 'rb')},
+                                format='multipart')
+
+    def test_new_user_storage_usage(self):
+        user = User.objects.create(username="newuser")
+        self.assertEqual(self.get_used_bytes(user), 0)
+        self.assertIsNone(StorageUsage.objects.get(user=user).quota)
+
+    def test_uploads_are_counted(self):
+        self.upload_file(self.r1)
+        self.add_image_pin(self.r1, 10)
+        self.add_image_pin(self.r2, 10)
+        self.assertEqual(self.get_used_bytes(), self.file_size + 2 * self.image_size)
+        self.assertEqual(self.get_used_bytes(self.currentUser2), 0)
+
+        # Replacing an image counts only the new one
+        old_image = Pin.objects.get(recording=self.r2, time=10).media_url.name
+        self.add_image_pin(self.r2, 10)
+        self.assertEqual(self.get_used_bytes(), self.file_size + 2 * self.image_size)
+
+        # The replaced image is deleted after the commit, that never happens in the tests
+        os.remove(os.path.join(settings.MEDIA_ROOT, old_image))
+
+    def test_deletes_are_counted(self):
+        self.upload_file(self.r1)
+        self.add_image_pin(self.r1, 10)
+        self.add_image_pin(self.r2, 10)
+
+        self.client.delete('/api/recordings/{id}/delete_pin/'.format(id=self.r2.id), {'time': 10})
+        self.assertEqual(self.get_used_bytes(), self.file_size + self.image_size)
+
+        # Deleting a recording frees its file and the images of its pins
+        response = self.client.delete('/api/recordings/{id}/'.format(id=self.r1.id))
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.get_used_bytes(), 0)
+
+    def test_course_deletes_are_counted(self):
+        course = Course.objects.create(name="Operative System")
+        r3 = Recording.objects.create(name="Other Registration", date=timezone.now(), user=self.currentUser2)
+        Recording.objects.filter(id__in=[self.r1.id, self.r2.id, r3.id]).update(course=course, media_bytes=100)
+        StorageUsage.objects.update(used_bytes=500)
+
+        # The bytes of the recordings deleted with the course are removed from all their authors at once
+        course.delete()
+        self.assertEqual(self.get_used_bytes(), 300)
+        self.assertEqual(self.get_used_bytes(self.currentUser2), 400)
+
+    def test_upload_over_quota_should_fail(self):
+        self.set_quota(self.file_size - 1)
+
+        response = self.upload_file(self.r1)
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(RecordingFile.objects.filter(recording=self.r1).exists())
+
+        # The body is refused before being read, nothing is written to the storage
+        self.assertEqual(set(os.listdir(self.directory)), self.files)
+        self.assertEqual(self.get_used_bytes(), 0)
+
+    def test_upload_without_length_should_fail(self):
+        # The size of a chunked upload is unknown, it can't be checked against the quota
+        response = self.client.post('/api/recordings/{id}/upload_file/'.format(id=self.r1.id),
+                                    {'file_url': open('recorder_engine/tests/test.mp3', 'rb')}, format='multipart',
+                                    CONTENT_LENGTH='', HTTP_TRANSFER_ENCODING='chunked')
+        self.assertEqual(response.status_code, 411)
+        self.assertEqual(set(os.listdir(self.directory)), self.files)
+        self.assertEqual(self.add_image_pin(self.r1, 10).status_code, 200)
+
+    def test_pin_images_over_quota_should_fail(self):
+        self.set_quota(self.file_size + self.image_size)
+        self.assertEqual(self.upload_file(self.r1).status_code, 200)
+
+        response = self.add_image_pin(self.r1, 10)
+        self.assertEqual(response.status_code, 413)
+        response = self.client.post('/api/recordings/{id}/add_pin_batch/'.format(id=self.r1.id), {
+            'batch': '[{"time": 10, "text": "New", "media_url": "image"}]',
+            'image': open('recorder_engine/tests/wrong.png', 'rb'),
+        }, format='multipart')
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(set(os.listdir(self.directory)) - self.files,
+                         {os.path.basename(self.r1.recordingfile.file_url.name)})
+
+        # The pins without images don't use the storage
+        response = self.client.post('/api/recordings/{id}/add_pin/'.format(id=self.r1.id), {'time': 10, 'text': 'Text'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_default_quota(self):
+        with self.settings(STORAGE_QUOTA=self.image_size - 1):
+            self.assertEqual(self.add_image_pin(self.r1, 10).status_code, 413)
+
+            # The quota of the user replaces the default one, the Content-Length counts the multipart headers too
+            self.set_quota(self.image_size + 1024)
+            self.assertEqual(self.add_image_pin(self.r1, 10).status_code, 200)
+
+        with self.settings(STORAGE_QUOTA=None):
+            self.set_quota(None)
+            self.assertEqual(self.add_image_pin(self.r1, 20).status_code, 200)
+
+    def test_reconcile_storage_usage(self):
+        self.add_image_pin(self.r1, 10)
+        StorageUsage.objects.filter(user=self.currentUser).update(used_bytes=1)
+        StorageUsage.objects.filter(user=self.currentUser2).delete()
+
+        out = StringIO()
+        call_command('reconcile_counters', stdout=out)
+
+        self.assertIn("Fixed 2 storage usages", out.getvalue())
+        self.assertEqual(self.get_used_bytes(), self.image_size)
+        self.assertEqual(self.get_used_bytes(self.currentUser2), 0)
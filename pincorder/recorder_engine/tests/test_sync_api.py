@@ -0,0 +1,191 @@
+import datetime
+from unittest import mock
+
+from rest_framework.test import APITestCase, APIClient
+from django.test import override_settings
+from django.utils import timezone
+from django.contrib.auth.models import User
+from ..models import *
+from .. import sync
+from .budget_client import BudgetAPIClient
+
+
+class SyncTest(APITestCase):
+    def setUp(self):
+        self.currentUser = User.objects.create(username="testuser")
+        self.currentUser2 = User.objects.create(username="testuser2")
+
+        teacher = Teacher.objects.create(name="Anna Rossi")
+        self.course1 = Course.objects.create(name="Operative System", teacher=teacher)
+        self.course1.authorized_users.add(self.currentUser)
+        self.course2 = Course.objects.create(name="Math", teacher=teacher)
+
+        self.r1 = Recording.objects.create(name="First Registration", date=timezone.now(), user=self.currentUser)
+        self.r2 = Recording.objects.create(name="Other Registration", date=timezone.now(), user=self.currentUser2)
+
+        self.pin1 = Pin.objects.create(recording=self.r1, time=10, text="Explanation 1")
+        self.pin2 = Pin.objects.create(recording=self.r1, time=20, text="Explanation 2")
+
+        self.client = BudgetAPIClient()
+        self.client.force_authenticate(user=self.currentUser)
+
+    def sync(self, changeset):
+        response = self.client.post('/api/sync/', changeset)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_sync_versions(self):
+        # Every change of a row makes a new version
+        self.assertEqual(self.r1.version, 1)
+        self.r1.name = "New Name"
+        self.r1.save()
+        self.assertEqual(Recording.objects.get(id=self.r1.id).version, 2)
+
+        self.client.post('/api/recordings/{id}/add_pin/'.format(id=self.r1.id), {'time': 10, 'text': 'Changed'})
+        self.assertEqual(Pin.objects.get(id=self.pin1.id).version, 2)
+
+    def test_sync_changeset(self):
+        data = self.sync({
+            'recordings': [{'temp_id': 'a', 'name': 'Offline', 'date': timezone.now(), 'course': self.course1.id}],
+            'renames': [{'recording': self.r1.id, 'name': 'Renamed', 'version': 1}],
+            'pins': [{'recording': 'a', 'time': 5, 'text': 'New'},
+                     {'recording': self.r1.id, 'time': 10, 'text': 'Updated', 'version': 1},
+                     {'recording': self.r1.id, 'time': 30, 'text': 'Added'}],
+            'deleted_pins': [{'recording': self.r1.id, 'time': 20, 'version': 1}],
+        })
+
+        new = Recording.objects.get(name='Offline')
+        self.assertEqual(data['ids'], {'a': new.id})
+        self.assertEqual(data['conflicts'], [])
+        self.assertEqual((new.user, new.course), (self.currentUser, self.course1))
+        self.assertEqual(Recording.objects.get(id=self.r1.id).name, 'Renamed')
+        self.assertEqual(Recording.objects.get(id=self.r1.id).version, 2)
+
+        self.assertEqual(list(new.pin_set.values_list('time', 'text')), [(5, 'New')])
+        self.assertEqual(list(self.r1.pin_set.values_list('time', 'text', 'version')),
+                         [(10, 'Updated', 2), (30, 'Added', 1)])
+
+        # On the first sync all the rows of the user are returned
+        self.assertEqual(sorted(recording['id'] for recording in data['changes']['recordings']),
+                         [self.r1.id, new.id])
+        self.assertEqual([(pin['recording'], pin['time']) for pin in data['changes']['pins']],
+                         [(self.r1.id, 10), (self.r1.id, 30), (new.id, 5)])
+
+    @override_settings(SYNC_OVERLAP=0)
+    def test_sync_changes_since(self):
+        synced_at = self.sync({})['synced_at']
+
+        # Changes made by another device
+        self.client.patch('/api/recordings/{id}/'.format(id=self.r1.id), {'name': 'Other Device'})
+        self.client.delete('/api/recordings/{id}/delete_pin/'.format(id=self.r1.id), {'time': 20})
+        r3 = Recording.objects.create(name="Deleted", date=timezone.now(), user=self.currentUser)
+        self.client.delete('/api/recordings/{id}/'.format(id=r3.id))
+
+        changes = self.sync({'since': synced_at})['changes']
+        self.assertEqual([(recording['id'], recording['name'], recording['version'])
+                          for recording in changes['recordings']], [(self.r1.id, 'Other Device', 2)])
+        self.assertEqual(changes['pins'], [])
+        self.assertEqual(changes['deleted_pins'], [{'recording': self.r1.id, 'time': 20}])
+        self.assertEqual(changes['deleted_recordings'], [r3.id])
+
+    @override_settings(SYNC_OVERLAP=0)
+    def test_sync_synced_at_after_the_writes(self):
+        data = self.sync({'renames': [{'recording': self.r1.id, 'name': 'Renamed', 'version': 1}]})
+        self.assertGreaterEqual(data['synced_at'], Recording.objects.get(id=self.r1.id).updated)
+
+        # The changes of the client are not returned again
+        changes = self.sync({'since': data['synced_at']})['changes']
+        self.assertEqual(changes['recordings'], [])
+
+    def test_sync_changes_before_since_are_returned_again(self):
+        synced_at = self.sync({})['synced_at']
+
+        # A transaction still running at the previous sync changed the pin, its update time is older than synced_at
+        Pin.objects.filter(id=self.pin1.id).update(text="Late", version=2,
+                                                   updated=synced_at - datetime.timedelta(seconds=1))
+
+        with self.settings(SYNC_OVERLAP=0):
+            self.assertEqual(self.sync({'since': synced_at})['changes']['pins'], [])
+
+        changes = self.sync({'since': synced_at})['changes']
+        self.assertIn((10, 'Late', 2), [(pin['time'], pin['text'], pin['version']) for pin in changes['pins']])
+
+    def test_sync_recordings_deleted_with_their_course(self):
+        synced_at = self.sync({})['synced_at']
+
+        r3 = Recording.objects.create(name="In Course", date=timezone.now(), user=self.currentUser,
+                                      course=self.course1)
+        self.course1.delete()
+
+        changes = self.sync({'since': synced_at})['changes']
+        self.assertEqual(changes['deleted_recordings'], [r3.id])
+
+    def test_deleted_user_has_no_tombstones(self):
+        self.currentUser.delete()
+        self.assertFalse(Tombstone.objects.filter(user_id=self.currentUser.id).exists())
+
+    def test_sync_pin_added_meanwhile(self):
+        # Another request adds the same pin after the sync has read the existing ones
+        def upsert_pins(user, pins):
+            Pin.objects.create(recording=self.r1, time=30, text="Other Device")
+            return upsert(user, pins)
+
+        upsert = sync.upsert_pins
+        pin_count = Recording.objects.get(id=self.r1.id).pin_count
+        with mock.patch.object(sync, 'upsert_pins', upsert_pins):
+            self.sync({'pins': [{'recording': self.r1.id, 'time': 30, 'text': 'Added'}]})
+
+        # The pin is updated instead, and it's not counted again
+        self.assertEqual(list(self.r1.pin_set.filter(time=30).values_list('text', 'version')), [('Added', 2)])
+        self.assertEqual(Recording.objects.get(id=self.r1.id).pin_count, pin_count)
+
+    def test_sync_conflicts_last_writer_wins(self):
+        before = timezone.now() - datetime.timedelta(minutes=5)
+
+        # The pin and the recording were changed on the server after the client has seen them
+        self.client.post('/api/recordings/{id}/add_pin/'.format(id=self.r1.id), {'time': 10, 'text': 'Server'})
+        self.client.patch('/api/recordings/{id}/'.format(id=self.r1.id), {'name': 'Server'})
+
+        data = self.sync({
+            'since': before,
+            'renames': [{'recording': self.r1.id, 'name': 'Client', 'version': 1, 'modified': timezone.now()}],
+            'pins': [{'recording': self.r1.id, 'time': 10, 'text': 'Client', 'version': 1, 'modified': before}],
+            'deleted_pins': [{'recording': self.r1.id, 'time': 20, 'version': 1, 'modified': before}],
+        })
+
+        # The rename was made later on the client and wins, the pin was changed earlier and loses
+        self.assertEqual(Recording.objects.get(id=self.r1.id).name, 'Client')
+        self.assertEqual(Pin.objects.get(id=self.pin1.id).text, 'Server')
+
+        # pin2 is unchanged on the server, so the client has its current version
+        self.assertFalse(Pin.objects.filter(id=self.pin2.id).exists())
+        self.assertEqual(data['conflicts'], [{'type': 'pin', 'recording': self.r1.id, 'time': 10}])
+
+        # The rows of the conflicts are returned, even if they didn't change after since
+        self.assertIn((10, 'Server'), [(pin['time'], pin['text']) for pin in data['changes']['pins']])
+
+    def test_sync_is_atomic(self):
+        response = self.client.post('/api/sync/', {
+            'recordings': [{'temp_id': 'a', 'name': 'Offline', 'date': timezone.now()}],
+            'pins': [{'recording': self.r2.id, 'time': 5, 'text': 'Not mine'}],
+        })
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(Recording.objects.filter(name='Offline').exists())
+
+    def test_sync_course_not_authorized(self):
+        response = self.client.post('/api/sync/', {
+            'recordings': [{'temp_id': 'a', 'name': 'Offline', 'date': timezone.now(), 'course': self.course2.id}],
+        })
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Recording.objects.filter(name='Offline').exists())
+
+    def test_sync_invalid_changeset(self):
+        for changeset in ({'pins': [{'recording': self.r1.id}]},
+                          {'pins': [{'recording': 'missing', 'time': 5}]},
+                          {'recordings': [{'name': 'No temp id', 'date': timezone.now()}]}):
+            response = self.client.post('/api/sync/', changeset)
+            self.assertEqual(response.status_code, 500)
+
+    def test_sync_not_authenticated(self):
+        response = APIClient().post('/api/sync/', {})
+        self.assertEqual(response.status_code, 401)
@@ -1,5 +1,7 @@
 import datetime
 
+import msgpack
+
 from django.core.files.base import ContentFile
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import TestCase
@@ -8,6 +10,7 @@ from django.utils import timezone
 from django.urls import reverse
 from django.contrib.auth.models import User
 from ..models import *
+from .budget_client import BudgetAPIClient
 
 
 class UserDumpTest(APITestCase):
@@ -61,7 +64,7 @@ class UserDumpTest(APITestCase):
     def get_logged_client(self, user=None):
         if user is None:
             user = self.currentUser
-        client = APIClient()
+        client = BudgetAPIClient()
         client.force_authenticate(user=user)
         return client
 
@@ -117,4 +120,32 @@ class UserDumpTest(APITestCase):
         client = self.get_logged_client()
         response = client.get('/api/user_dump/')
 
-        self.assertEqual(len(response.data['recordings'][1]['pin_set']), 0)
\ No newline at end of file
+        self.assertEqual(len(response.data['recordings'][1]['pin_set']), 0)
+
+    def test_userdump_contains_parent_course(self):
+        self.course2.parent_course = self.course1
+        self.course2.save()
+
+        client = self.get_logged_client()
+        response = client.get('/api/user_dump/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['courses'][1]['parent_course'], self.course1.id)
+
+    def test_userdump_contains_columnar_pins(self):
+        client = self.get_logged_client()
+        response = client.get('/api/user_dump/', {'layout': 'columnar'})
+
+        self.assertEqual(response.data['recordings'][0]['pin_set'],
+                         {'time': [10, 40, 50], 'text': ['Explanation 1', '', 'Explanation 2'],
+                          'media_url': [None, None, None]})
+        self.assertEqual(response.data['recordings'][1]['pin_set'], {'time': [], 'text': [], 'media_url': []})
+
+    def test_userdump_msgpack_is_smaller(self):
+        client = self.get_logged_client()
+        json_response = client.get('/api/user_dump/')
+        msgpack_response = client.get('/api/user_dump/', HTTP_ACCEPT='application/msgpack')
+
+        self.assertEqual(msgpack_response['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(msgpack_response.content, raw=False), json_response.json())
+        self.assertLess(len(msgpack_response.content), len(json_response.content))
@@ -11,5 +11,8 @@ router.register(r'courses', views.CourseViewSet, base_name="course")
 # Define the url patterns for the API
 urlpatterns = [
     url(r'^', include(router.urls)),
-    url(r'^user_dump/$', views.UserDump.as_view(), name='user-dump')  # User Dump URL
+    url(r'^user_dump/$', views.UserDump.as_view(), name='user-dump'),  # User Dump URL
+    url(r'^user_export/$', views.UserExport.as_view(), name='user-export'),  # User Export URL
+    url(r'^batch/$', views.BatchView.as_view(), name='batch'),  # Batch URL
+    url(r'^sync/$', views.SyncView.as_view(), name='sync')  # Sync URL
 ]
\ No newline at end of file
@@ -1,19 +1,79 @@
-from django.contrib.auth.models import AnonymousUser
-from django.http import Http404
+import json
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.db import transaction
+from django.conf import settings
+from django.urls import resolve, Resolver404
+from django.http import Http404, StreamingHttpResponse
 from rest_framework import viewsets
 from rest_framework.decorators import list_route, detail_route, parser_classes
 from rest_framework.exceptions import PermissionDenied, APIException
+from rest_framework.negotiation import BaseContentNegotiation
 from rest_framework.parsers import FormParser, MultiPartParser
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
 from rest_framework.views import APIView
 
 from .serializers import *
+from .authentication import StatelessAuthenticationMixin
+from .batch import BATCH_METHODS, dispatch_sub_request
+from .bulk import bulk_create_recordings, check_course_access
+from .counters import add_recording_file, update_counters
+from .export import stream_user_archive
+from .pins import PinImageUploadHandler, StoredUploadedFile, delete_pin_images, has_local_storage, \
+    store_pin_image, upsert_pins
+from .quota import check_storage_quota
+from .renderers import stream_json_object
+from .sync import Changeset
+from .fast_serializers import ValuesSerializer, to_columns
+from .signals import course_users_changed
 
 from oauth2_provider.ext.rest_framework import TokenHasReadWriteScope, TokenHasScope, permissions
 
 
-class RecordingViewSet(viewsets.ModelViewSet):
+# Pin fields sent as differences between consecutive pins in the columnar layout
+PIN_DELTA_FIELDS = ('time',)
+
+
+def is_columnar(request):
+    """
+    Check if the client asks for the pins as parallel arrays, with the 'layout=columnar' parameter
+    """
+    return request.query_params.get('layout') == 'columnar'
+
+
+def get_list_parameter(request, name):
+    """
+    Return the comma separated values of the query parameter as a list, or None if it's missing
+    """
+    if name not in request.query_params:
+        return None
+    return [value.strip() for value in request.query_params[name].split(',') if value.strip()]
+
+
+def get_int_parameter(request, name):
+    """
+    Return the query parameter as an integer, or None if it's missing
+    """
+    if name not in request.query_params:
+        return None
+    try:
+        return int(request.query_params[name])
+    except ValueError:
+        raise APIException("ERROR: The '{name}' parameter must be an integer".format(name=name))
+
+
+def get_recording_id(pk):
+    """
+    Return the recording id of the url as an integer, raise Http404 if it's not a number
+    """
+    try:
+        return int(pk)
+    except ValueError:
+        raise Http404("ERROR: You can't access this recording or it doesn't exists")
+
+
+class RecordingViewSet(StatelessAuthenticationMixin, viewsets.ModelViewSet):
     """
     Using this API you will be able to create, edit and manage Recordings and Pins.
     
@@ -23,8 +83,34 @@ class RecordingViewSet(viewsets.ModelViewSet):
     serializer_class = RecordingSerializer
 
     def get_queryset(self):
-        # Return the recordings of the current user
-        return Recording.objects.filter(user=self.request.user)
+        # Return the recordings of the current user, fetching the user in the same query
+        return Recording.objects.filter(user=self.request.user).select_related('user')
+
+    def list(self, request, *args, **kwargs):
+        """
+        Return the recordings of the current user.
+        The 'fields' parameter restricts the returned fields, the 'expand' parameter embeds the 'pins',
+        the 'file' and the 'course' of the recordings ( e.g. ?fields=id,name&expand=pins,course )
+        """
+        fields = get_list_parameter(request, 'fields')
+        expand = get_list_parameter(request, 'expand')
+
+        # Make sure that the user asks only for existing fields
+        if fields is not None:
+            unknown = set(fields) - set(RecordingSerializer.Meta.fields) - set(RecordingSerializer.EXPANDABLE_FIELDS)
+            if unknown:
+                raise APIException("ERROR: Unknown fields: " + ", ".join(sorted(unknown)))
+        if expand is not None:
+            unknown = set(expand) - set(RecordingSerializer.EXPANDABLE_FIELDS)
+            if unknown:
+                raise APIException("ERROR: These fields can't be expanded: " + ", ".join(sorted(unknown)))
+
+        queryset = self.filter_queryset(self.get_queryset())
+
+        # Serialize the rows directly, without creating the Recording objects. Only the columns of the requested
+        # fields are read, the file and the course are joined, the pins are fetched with one additional query
+        serializer = ValuesSerializer(self.get_serializer(fields=fields, expand=expand))
+        return Response(serializer.serialize(queryset))
 
     @list_route(methods=['get'])
     def search_by_name(self, request):
@@ -38,12 +124,84 @@ class RecordingViewSet(viewsets.ModelViewSet):
 
         # Get the recordings made by the user and having a name that contains the specified param
         recordings = Recording.objects.filter(user=self.request.user) \
-                                      .filter(name__contains=request.query_params['name'])
+                                      .filter(name__contains=request.query_params['name']) \
+                                      .select_related('user')
 
-        # Serialize the data
-        serializer = RecordingSerializer(recordings, many=True, context={'request': request})
+        # Serialize the rows directly, without creating the Recording objects
+        serializer = ValuesSerializer(RecordingSerializer(context={'request': request}))
 
-        return Response(serializer.data)
+        return Response(serializer.serialize(recordings))
+
+    @list_route(methods=['post'])
+    def bulk_create(self, request):
+        """
+        Create many recordings at once, from the list in the 'recordings' parameter.
+        Return the ids of the new recordings, in the same order
+        """
+        # Make sure that the user passes the 'recordings' parameter, if not, raise an exception
+        if not isinstance(request.data.get('recordings'), list):
+            raise APIException("ERROR: You must specify the 'recordings' parameter containing the list of recordings")
+        if len(request.data['recordings']) > settings.RECORDING_BULK_MAX_SIZE:
+            raise APIException("ERROR: At most {max} recordings can be created at once"
+                               .format(max=settings.RECORDING_BULK_MAX_SIZE))
+
+        serializer = RecordingBulkSerializer(data=request.data['recordings'], many=True)
+        if not serializer.is_valid():
+            raise APIException("ERROR: " + str(serializer.errors))
+
+        # All the courses are checked with a single query, all the recordings are inserted together
+        with transaction.atomic():
+            recordings = bulk_create_recordings(request.user, serializer.validated_data)
+
+        return Response({'ids': [recording.id for recording in recordings]}, status=201)
+
+    @list_route(methods=['get'])
+    def get_batch(self, request):
+        """
+        Return the pins and the file of the recordings listed in the 'ids' parameter ( e.g. ?ids=1,2,3 ),
+        keyed by recording id. Recordings that don't exist or belong to another user are omitted.
+        Batches bigger than RECORDING_BATCH_STREAM_SIZE are streamed, when the response is JSON
+        """
+        # Make sure that the user passes a valid list of ids
+        if 'ids' not in request.query_params:
+            raise APIException("ERROR: You must specify the 'ids' parameter")
+        try:
+            ids = sorted(set(int(value) for value in get_list_parameter(request, 'ids')))
+        except ValueError:
+            raise APIException("ERROR: The 'ids' parameter must be a comma separated list of ids")
+
+        if len(ids) > settings.RECORDING_BATCH_MAX_SIZE:
+            raise APIException("ERROR: At most {max} recordings can be fetched at once"
+                               .format(max=settings.RECORDING_BATCH_MAX_SIZE))
+
+        # The recordings of the user with their files, in a single query
+        recordings = Recording.objects.filter(user=self.request.user).filter(id__in=ids).order_by('id')
+        recordings = ValuesSerializer(RecordingBatchSerializer(context={'request': request})).serialize(recordings)
+
+        # The pins of the same recordings, read one at a time in the recordings order.
+        # The rows start with the recording id, used to group them
+        pin_serializer = ValuesSerializer(PinSerializer(context={'request': request}), offset=1)
+        pins = Pin.objects.filter(recording__user=self.request.user).filter(recording_id__in=ids) \
+                          .order_by('recording_id', 'time') \
+                          .values_list('recording_id', *pin_serializer.columns).iterator()
+
+        def entries():
+            """
+            Yield the (recording id, entry) couples, consuming the pins while the recordings are returned
+            """
+            pin = next(pins, None)
+            for recording in recordings:
+                recording_pins = []
+                while pin is not None and pin[0] == recording['id']:
+                    recording_pins.append(pin_serializer.to_representation(pin))
+                    pin = next(pins, None)
+                yield str(recording['id']), {'pins': recording_pins, 'file': recording['file']}
+
+        if len(recordings) > settings.RECORDING_BATCH_STREAM_SIZE and request.accepted_renderer.format == 'json':
+            return StreamingHttpResponse(stream_json_object(entries(), request.accepted_renderer),
+                                         content_type=request.accepted_renderer.media_type)
+
+        return Response(dict(entries()))
 
     @detail_route(methods=['get'])
     def get_file(self, request, pk=None):
@@ -80,7 +238,7 @@ class RecordingViewSet(viewsets.ModelViewSet):
     @parser_classes((FormParser, MultiPartParser,))
     def upload_file(self, request, pk=None):
         """
-        Upload the audio file to a recording
+        Upload the audio file to a recording, with its optional 'duration' in milliseconds
         """
         # Check if the user is the author of the recording, if not throw and exception
         if not Recording.objects.filter(id=pk).filter(user=self.request.user).exists():
@@ -90,6 +248,9 @@ class RecordingViewSet(viewsets.ModelViewSet):
         if RecordingFile.objects.filter(recording_id=pk).exists():
             raise APIException("ERROR: The File already exists")
 
+        # Refuse the uploads that don't fit in the storage quota of the user, before reading the body
+        check_storage_quota(request)
+
         # Copy the request data
         input_data = request.data.copy()
 
@@ -105,8 +266,23 @@ class RecordingViewSet(viewsets.ModelViewSet):
             if not request.data['file_url'].name.endswith(".aac") and not request.data['file_url'].name.endswith(".mp3"):
                 raise APIException("ERROR: Wrong file format!")
 
-            # Save and get the RecordingFile
-            file = serializer.save()
+            # The duration in milliseconds is optional, the server doesn't decode the audio
+            duration = request.data.get('duration')
+            if duration is not None:
+                try:
+                    duration = int(duration)
+                    if duration < 0:
+                        raise ValueError()
+                except ValueError:
+                    raise APIException("ERROR: The 'duration' must be a non-negative number of milliseconds")
+
+            with transaction.atomic():
+                # Save and get the RecordingFile
+                size = request.data['file_url'].size
+                file = serializer.save(size=size)
+
+                # Update the counters of the recording
+                add_recording_file(request.user.id, get_recording_id(pk), size, duration)
 
             # Return the response
             return Response(serializer.data)
@@ -116,18 +292,50 @@ class RecordingViewSet(viewsets.ModelViewSet):
     @detail_route(methods=['get'])
     def get_pins(self, request, pk=None):
         """
-        Return the pins of the current recording
+        Return the pins of the current recording, in time order.
+        'from' and 'to' restrict the pins to a range of milliseconds ( both included ),
+        'after' and 'before' return the pins that follow or precede a time, up to the 'limit' pins nearest to it.
+        To walk through the pins pass the time of the last received pin as 'after' ( e.g. ?after=5000&limit=100 )
         """
-
-        # Get the pins for the current recording and user
+        time_from = get_int_parameter(request, 'from')
+        time_to = get_int_parameter(request, 'to')
+        after = get_int_parameter(request, 'after')
+        before = get_int_parameter(request, 'before')
+        limit = get_int_parameter(request, 'limit')
+
+        if after is not None and before is not None:
+            raise APIException("ERROR: The 'after' and 'before' parameters can't be used together")
+        if limit is not None and not 0 < limit <= settings.PIN_PAGE_MAX_SIZE:
+            raise APIException("ERROR: The 'limit' parameter must be between 1 and {max}"
+                               .format(max=settings.PIN_PAGE_MAX_SIZE))
+
+        # Get the pins for the current recording and user, the filters on the time use the (recording, time) index
         pins = Pin.objects.filter(recording__user_id=self.request.user) \
             .filter(recording_id=pk).order_by('time')
-
-        # Get the serializer
-        serializer = PinSerializer(pins, many=True, context={'request': request})
+        if time_from is not None:
+            pins = pins.filter(time__gte=time_from)
+        if time_to is not None:
+            pins = pins.filter(time__lte=time_to)
+        if after is not None:
+            pins = pins.filter(time__gt=after)
+        if before is not None:
+            # The nearest pins are the last ones before the time
+            pins = pins.filter(time__lt=before).order_by('-time')
+        if limit is not None:
+            pins = pins[:limit]
+
+        # Serialize the rows directly, without creating the Pin objects
+        serializer = ValuesSerializer(PinSerializer(context={'request': request}))
+        data = serializer.serialize(pins)
+        if before is not None:
+            data.reverse()
+
+        # Return the pins as parallel arrays, if the client asks for it
+        if is_columnar(request):
+            data = to_columns(data, serializer.field_names, delta_fields=PIN_DELTA_FIELDS)
 
         # Return the response
-        return Response(serializer.data)
+        return Response(data)
 
     @detail_route(methods=['post'])
     @parser_classes((FormParser, MultiPartParser,))
@@ -135,68 +343,34 @@ class RecordingViewSet(viewsets.ModelViewSet):
         """
         Add or Update a Pin
         """
-        # Check if the user is the author of the recording, if not throw and exception
-        if not Recording.objects.filter(id=pk).filter(user=self.request.user).exists():
+        recording_id = get_recording_id(pk)
+
+        # Check if the user is the author of the recording before storing an image, if not throw and exception.
+        # The pins without images are checked by the upsert
+        if request.content_type.startswith('multipart/') and \
+                not Recording.objects.filter(id=recording_id).filter(user=self.request.user).exists():
             raise Http404("ERROR: You can't access this recording or it doesn't exists")
 
-        # Get the pins of the current recording
-        pins = Recording.objects.get(pk=pk).pin_set
+        # Refuse the uploads that don't fit in the storage quota of the user, before reading the body
+        check_storage_quota(request)
 
-        try:
-            # Try to get the pin
-            pin = pins.get(time=request.data['time'])
-
-            # If the text param exists, update it
-            if 'text' in request.data:
-                pin.text = request.data['text']
-            else:
-                pin.text = ""
-
-            # If the media_url param exists, update it
-            if 'media_url' in request.data:
-                # Delete the old image
-                pin.media_url.delete()
-                # Get the uploaded file
-                upload = request.data['media_url']
-                # Save the uploaded image
-                pin.media_url.save(upload.name, upload)
-
-            # Save the pin
-            pin.save()
+        serializer = PinUpsertSerializer(data=request.data)
+        if not serializer.is_valid():
+            raise APIException("ERROR: " + str(serializer.errors))
+        data = serializer.validated_data
 
-            # Return the response
-            return Response(PinSerializer(pin).data)
-        except Pin.DoesNotExist:
-            # Copy the request data
-            input_data = request.data.copy()
-
-            # Add the recording reference for the foreign key
-            input_data['recording'] = pk
-
-            # Get the serializer
-            serializer = PinSerializer(data=input_data)
-
-            # Check if the serialized data is valid
-            if serializer.is_valid():
-                # Save and get the pin
-                pin = serializer.save()
-
-                # If the media_url param exists, update it
-                if 'media_url' in request.data:
-                    # Delete the old image
-                    pin.media_url.delete()
-                    # Get the uploaded file
-                    upload = request.data['media_url']
-                    # Save the uploaded image
-                    pin.media_url.save(upload.name, upload)
-                    # Save the pin
-                    pin.save()
-
-                # Return the response
-                return Response(serializer.data)
-            else:
-                # If the serialized data is not valid, raise an error
-                raise APIException("ERROR: "+str(serializer.errors))
+        # Save the image first, the row is written with a single statement that also checks the author
+        pin = {'recording': recording_id, 'time': data['time'], 'text': data['text'], 'media_url': ''}
+        if 'media_url' in data:
+            pin.update(media_url=store_pin_image(data['media_url']), media_size=data['media_url'].size)
+        pins = upsert_pins(request.user, [pin])
+
+        # Check if the user is the author of the recording, if not throw and exception
+        if not pins:
+            raise Http404("ERROR: You can't access this recording or it doesn't exists")
+
+        # Return the response
+        return Response(PinSerializer(pins[0]).data)
 
     @detail_route(methods=['delete'])
     def delete_pin(self, request, pk=None):
@@ -209,11 +383,15 @@ class RecordingViewSet(viewsets.ModelViewSet):
 
         # Check if the pin exists in the specified time
         try:
-            # Get the pin at the specified time
-            pin = Recording.objects.get(id=pk).pin_set.get(time=request.data['time'])
+            with transaction.atomic():
+                # Get the pin at the specified time
+                pin = Pin.objects.get(recording_id=pk, time=request.data['time'])
 
-            # Delete the pin
-            pin.delete()
+                # Delete the pin, and remember it for the sync of the other devices
+                pin.delete()
+                Tombstone.objects.create(user=request.user, recording_id=pk, time=pin.time)
+                update_counters(request.user.id, pins={pin.recording_id: -1},
+                                media_bytes={pin.recording_id: -pin.media_size})
 
             # Return the response
             return Response("OK")
@@ -224,66 +402,80 @@ class RecordingViewSet(viewsets.ModelViewSet):
     @detail_route(methods=['post'])
     def add_pin_batch(self, request, pk=None):
         """
-        Add Multiple Pins at once
+        Add or Update Multiple Pins at once.
+        With a multipart body the 'batch' parameter is a JSON list, where the 'media_url' of each pin is the name
+        of the part containing its image
         """
+        recording_id = get_recording_id(pk)
 
         # Check if the user is the author of the recording, if not throw and exception
-        if not Recording.objects.filter(id=pk).filter(user=self.request.user).exists():
+        if not Recording.objects.filter(id=recording_id).filter(user=self.request.user).exists():
             raise Http404("ERROR: You can't access this recording or it doesn't exists")
 
+        # Refuse the uploads that don't fit in the storage quota of the user, before reading the body
+        check_storage_quota(request)
+
+        # Write the images to the storage while the request is parsed
+        if has_local_storage():
+            request.upload_handlers = [PinImageUploadHandler(request)]
+
         # Make sure that the user passes the 'batch' POST parameter, if not, raise an exception
         if 'batch' not in self.request.data:
+            self.delete_uploads(request)
             raise APIException("ERROR: You must specify the 'batch' parameter containing the data")
 
-        # Get the data from the batch POST parameter
-        data = self.request.data['batch']
-
-        # Get the pins of the current recording
-        pins = Recording.objects.get(pk=pk).pin_set.all()
-
-        # Initialize a list that will hold the pins
-        output_data = []
+        try:
+            data = self.request.data['batch']
+            if isinstance(data, str):
+                data = json.loads(data)
+
+            # Replace the names of the parts with the uploaded images
+            for d in data:
+                if d.get('media_url'):
+                    d['media_url'] = request.FILES[d['media_url']]
+        except (ValueError, TypeError, AttributeError, KeyError):
+            self.delete_uploads(request)
+            raise APIException("ERROR: The 'batch' parameter must be a list of pins, whose images are in the request")
+
+        serializer = PinUpsertSerializer(data=data, many=True)
+        if not serializer.is_valid():
+            self.delete_uploads(request)
+            raise APIException("ERROR: " + str(serializer.errors))
 
-        for d in data:
-            # For each pin in the batch, add the current recording
-            d['recording'] = pk
+        # All the pins are written with a single statement
+        pins = [{'recording': recording_id, 'time': d['time'], 'text': d['text'],
+                 'media_url': store_pin_image(d['media_url']) if 'media_url' in d else '',
+                 'media_size': d['media_url'].size if 'media_url' in d else 0}
+                for d in serializer.validated_data]
+        pins = upsert_pins(request.user, pins) if pins else []
 
-            try:
-                # If it exists, update the text
-                pin = pins.get(time=d['time'])
-                if 'text' in d:
-                    pin.text = d['text']
-                else:
-                    pin.text = ""
-                pin.save()
-            except Pin.DoesNotExist:
-                # If the pin doesn't already exist in the database, append it to output_data
-                output_data.append(d)
+        # Remove the images that no pin uses
+        self.delete_uploads(request, keep=set(pin.media_url.name for pin in pins))
 
-        # Create the serializer with the output_data
-        serializer = PinSerializer(data=output_data, many=True, context={'request': request})
+        pins.sort(key=lambda pin: pin.time)
+        return Response(PinSerializer(pins, many=True, context={'request': request}).data)
 
-        # If it's valid, save the pins
-        if serializer.is_valid():
-            serializer.save()
-
-        return Response(serializer.data)
+    def delete_uploads(self, request, keep=()):
+        """
+        Delete the images written by the PinImageUploadHandler, except the ones in keep
+        """
+        delete_pin_images([upload.stored_name for name, uploads in request.FILES.lists() for upload in uploads
+                           if isinstance(upload, StoredUploadedFile) and upload.stored_name not in keep])
 
     def perform_create(self, serializer):
         # Get the posted recording
         recording = serializer.get_recording()
 
         # Check if a course is specified by the request
-        if recording.course is not None:
+        if recording.course_id is not None:
             # Check if the user is allowed to write in this course, if not, throw an exception
-            if self.request.user not in recording.course.authorized_users.all():
-                raise PermissionDenied("You're not allowed to write in this course!")
+            check_course_access(self.request.user, [recording.course_id])
 
         # If the user is authorized, save the recording
         serializer.save(user=self.request.user)
 
 
-class CourseViewSet(viewsets.ModelViewSet):
+class CourseViewSet(StatelessAuthenticationMixin, viewsets.ModelViewSet):
     """
     Using this API you will be able to create, edit and manage Courses and Teachers.
     
@@ -372,32 +564,238 @@ class CourseViewSet(viewsets.ModelViewSet):
         # Return an OK response
         return Response('OK')
 
+    @detail_route(methods=['get'])
+    def statistics(self, request, pk=None):
+        """
+        Return the statistics of the course, including the recordings of all its sub courses.
+        The statistics are updated on every change of the recordings, so they are read with a single query
+        """
+        # Check that the user is authorized to view the course, with the same query
+        statistics = CourseStatistics.objects.filter(course_id=pk, course__authorized_users=self.request.user).first()
+        if statistics is None:
+            raise Http404("ERROR: Course doesn't exists or you're not authorized!")
+
+        return Response(CourseStatisticsSerializer(statistics).data)
+
+    def get_requested_user_ids(self, request):
+        """
+        Return the set of user ids passed in the 'users' parameter
+        """
+        # Make sure that the user passes the 'users' parameter, if not, raise an exception
+        if 'users' not in request.data:
+            raise APIException("ERROR: You must specify the 'users' parameter containing the user ids")
+
+        # The parameter must be a list of user ids
+        users = request.data['users']
+        if not isinstance(users, list):
+            raise APIException("ERROR: The 'users' parameter must be a list of user ids")
+
+        try:
+            return set(int(user_id) for user_id in users)
+        except (TypeError, ValueError):
+            raise APIException("ERROR: The 'users' parameter must be a list of user ids")
+
+    @detail_route(methods=['post'])
+    def add_users(self, request, pk=None):
+        """
+        Authorize multiple users to view the specified course.
+        Users that are already authorized are skipped.
+        """
+        # Check that the user is authorized to edit the course, if not raise an exception
+        if not (Course.objects.filter(id=pk).filter(authorized_users__in=[self.request.user]).exists()):
+            raise Http404("ERROR: Course doesn't exists or you're not authorized!")
+
+        user_ids = self.get_requested_user_ids(request)
+
+        # The intermediate model of the authorized_users relation
+        membership = Course.authorized_users.through
+
+        with transaction.atomic():
+            # Keep only the ids of existing users that are not already authorized, using a single query
+            new_ids = set(User.objects.filter(id__in=user_ids)
+                                      .exclude(course__id=pk)
+                                      .values_list('id', flat=True))
+
+            # Insert all the new memberships at once
+            membership.objects.bulk_create([membership(course_id=pk, user_id=user_id)
+                                            for user_id in sorted(new_ids)])
+
+        # Notify the change only once for the whole batch
+        if new_ids:
+            course_users_changed.send(sender=Course, course_id=int(pk), added=sorted(new_ids), removed=[])
+
+        return Response({'added': len(new_ids)})
+
+    @detail_route(methods=['post'])
+    def remove_users(self, request, pk=None):
+        """
+        Remove the authorization to view the specified course from multiple users.
+        Users that are not authorized are skipped.
+        """
+        # Check that the user is authorized to edit the course, if not raise an exception
+        if not (Course.objects.filter(id=pk).filter(authorized_users__in=[self.request.user]).exists()):
+            raise Http404("ERROR: Course doesn't exists or you're not authorized!")
+
+        user_ids = self.get_requested_user_ids(request)
+
+        # The intermediate model of the authorized_users relation
+        membership = Course.authorized_users.through
+
+        with transaction.atomic():
+            memberships = membership.objects.filter(course_id=pk, user_id__in=user_ids)
+
+            # Get the ids of the users that are going to be removed
+            removed_ids = sorted(memberships.values_list('user_id', flat=True))
+
+            # Delete all the memberships at once
+            memberships.delete()
+
+        # Notify the change only once for the whole batch
+        if removed_ids:
+            course_users_changed.send(sender=Course, course_id=int(pk), added=[], removed=removed_ids)
+
+        return Response({'removed': len(removed_ids)})
+
     def perform_create(self, serializer):
         # Get the course and add the current user to the authorized group
         course = serializer.save()
         course.authorized_users.add(self.request.user)
 
 
-class UserDump(APIView):
+class UserDump(StatelessAuthenticationMixin, APIView):
     """
     This API is used to retrive all the profile, courses and recordings information for the current user
     """
     def get(self, request, format=None):
-        # Get all the recordings for the current user
+        # Get all the recordings for the current user, the pins are fetched at once by the serializer
         recordings = Recording.objects.filter(user=request.user)
-        # Serialize the recordings
-        recording_serializer = UserDumpRecordingSerializer(recordings, many=True)
 
-        # Serialize the user info
-        user_serializer = UserDumpUserSerializer(request.user)
-
-        # Get all the courses that user is authorized to view
+        # Get all the courses that user is authorized to view, the teachers are joined by the serializer
         courses = Course.objects.filter(authorized_users__in=[request.user])
-        # Serialize the courses information
-        courses_serializer = UserDumpCourseSerializer(courses, many=True)
 
-        # Serialize all the UserDump
-        serializer = UserDumpSerializer({'recordings': recording_serializer.data, 'user': user_serializer.data,
-                                         'courses': courses_serializer.data})
+        # Serialize the rows directly, with the same fields and order of the UserDumpSerializer
+        data = {
+            'user': UserDumpUserSerializer(request.user).data,
+            'courses': ValuesSerializer(UserDumpCourseSerializer()).serialize(courses),
+            'recordings': ValuesSerializer(UserDumpRecordingSerializer()).serialize(recordings),
+        }
+
+        # Return the pins of each recording as parallel arrays, if the client asks for it
+        if is_columnar(request):
+            pin_fields = list(UserDumpPinSerializer().fields)
+            for recording in data['recordings']:
+                recording['pin_set'] = to_columns(recording['pin_set'], pin_fields, delta_fields=PIN_DELTA_FIELDS)
+
+        return Response(data)
+
+
+class FileContentNegotiation(BaseContentNegotiation):
+    """
+    Content negotiation of the views that return files, whose Accept header can only ask for the type of the file:
+    the errors are rendered with the first renderer instead of failing with 406
+    """
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+
+class UserExport(StatelessAuthenticationMixin, APIView):
+    """
+    This API is used to download the whole archive of the current user as a ZIP file: the recordings with their pins
+    in recordings.json, the files of the recordings and the images of the pins.
+    The archive is built while it's sent ( see export.py )
+    """
+    content_negotiation_class = FileContentNegotiation
+
+    def get(self, request, format=None):
+        response = StreamingHttpResponse(stream_user_archive(request.user), content_type='application/zip')
+        # The id is used in the name of the file, the username could contain characters not allowed in the headers
+        response['Content-Disposition'] = 'attachment; filename="pincorder-{id}.zip"'.format(id=request.user.id)
+        return response
+
+
+class BatchRollback(Exception):
+    """
+    Raised to roll back an atomic batch when one of its sub requests fails
+    """
+
+
+class BatchView(StatelessAuthenticationMixin, APIView):
+    """
+    This API is used to make many API calls with a single request.
+    The 'requests' parameter is the ordered list of the calls, each one with the 'method', the 'path' and the
+    optional 'body'. With 'atomic' set to true the calls are all committed or all rolled back: the batch stops at
+    the first call that fails. The response contains the 'status' and the 'body' of each executed call
+    """
+    def post(self, request, format=None):
+        requests = request.data.get('requests')
+        atomic = bool(request.data.get('atomic', False))
+
+        # Make sure that the user passes a valid list of calls
+        if not isinstance(requests, list) or not requests:
+            raise APIException("ERROR: You must specify the 'requests' parameter containing the list of calls")
+        if len(requests) > settings.API_BATCH_MAX_SIZE:
+            raise APIException("ERROR: A batch can contain at most {max} calls".format(max=settings.API_BATCH_MAX_SIZE))
+        for item in requests:
+            self.validate_item(item)
+
+        if not atomic:
+            responses = [self.dispatch_item(request, item) for item in requests]
+            return Response({'committed': True, 'responses': responses})
+
+        # In atomic mode every call runs in a savepoint of the same transaction, and the batch stops at the first
+        # call that fails
+        responses = []
+        committed = True
+        try:
+            with transaction.atomic():
+                for item in requests:
+                    responses.append(self.dispatch_item(request, item))
+                    if responses[-1]['status'] >= 400:
+                        raise BatchRollback()
+        except BatchRollback:
+            committed = False
+
+        return Response({'committed': committed, 'responses': responses})
+
+    def dispatch_item(self, request, item):
+        return dispatch_sub_request(request, item['method'].upper(), item['path'], item.get('body'))
+
+    def validate_item(self, item):
+        """
+        Check that the call has a supported method and the path of an API route, other than the batch itself
+        """
+        if not isinstance(item, dict) or not isinstance(item.get('path'), str) or 'method' not in item:
+            raise APIException("ERROR: Each call must specify the 'method' and the 'path'")
+        if str(item['method']).upper() not in BATCH_METHODS:
+            raise APIException("ERROR: Unsupported method " + str(item['method']))
+        if not item['path'].startswith('/api/'):
+            raise APIException("ERROR: Only the API can be called in a batch: " + item['path'])
+
+        try:
+            match = resolve(item['path'].partition('?')[0])
+        except Resolver404:
+            # Reported as a 404 of the single call
+            return
+        if match.url_name == 'batch':
+            raise APIException("ERROR: A batch can't contain other batches")
+        if match.url_name == 'user-export':
+            raise APIException("ERROR: The export can't be part of a batch")
+
+
+class SyncView(StatelessAuthenticationMixin, APIView):
+    """
+    This API is used to apply the changes made offline with a single request, in a single transaction.
+    The changeset contains the new 'recordings' ( with a 'temp_id' that can be used by the other changes ),
+    the 'renames' of the recordings, the 'pins' added or updated and the 'deleted_pins'.
+    The response contains the ids of the new recordings, the changes that lost against the server ( 'conflicts' )
+    and the 'changes' made on the server since the previous sync. The client must apply the deletions before
+    the changed rows, and pass 'synced_at' as 'since' in the next sync.
+    The changes made shortly before 'since' are returned again ( see settings.SYNC_OVERLAP ), the client skips the
+    rows whose 'version' it has already
+    """
+    def post(self, request, format=None):
+        serializer = SyncChangesetSerializer(data=request.data)
+        if not serializer.is_valid():
+            raise APIException("ERROR: " + str(serializer.errors))
 
-        return Response(serializer.data)
+        return Response(Changeset(request, serializer.validated_data).apply())